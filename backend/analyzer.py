@@ -0,0 +1,66 @@
+# analyzer.py
+"""Standalone analyzer daemon
+
+Runs the video analysis for every lot in the registry and publishes the
+results (counts, history, spot events, encoded frames) into shared memory,
+one segment per lot. Any number of web workers started with ANALYZER=shared
+serve from there, so the app can run under gunicorn with several workers
+while each video is still decoded and analysed only once.
+"""
+import signal
+import threading
+
+from core.analysis_pool import AnalysisPool
+from core.lot_registry import load_lot_registry
+from core.occupancy_store import OccupancyStore, OccupancySampler
+from core.parking_monitor import ParkingMonitor
+from core.shared_state import SharedStatePublisher
+from core.video_processor import VideoProcessor
+
+# How often the heartbeat and in-process pipeline stats are refreshed, in seconds
+HEARTBEAT_INTERVAL = 1.0
+
+
+def main():
+    monitor = ParkingMonitor()
+    lot_registry = load_lot_registry(monitor=monitor)
+    publisher = SharedStatePublisher(lot_registry)
+    history_store = OccupancyStore()
+    sampler = OccupancySampler(history_store, lambda: {key: (lot['total'], lot['available'], lot['occupied'])
+                                                      for key, lot in publisher.lot_data.items()})
+    sampler.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+
+    analysis_pool = None
+    processors = []
+    processes = lot_registry.process_count()
+    if processes > 0:
+        analysis_pool = AnalysisPool(lot_registry, processes, publisher)
+        analysis_pool.start()
+    else:
+        for lot in lot_registry:
+            processor = VideoProcessor(lot, monitor, publisher)
+            processors.append(processor)
+            threading.Thread(target=processor.run_processing, daemon=True).start()
+        print(f"Started {len(processors)} video processing threads")
+
+    print(f"Analyzer publishing {len(lot_registry.lots)} lots to shared memory")
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            publisher.heartbeat()
+            for processor in processors:
+                publisher.set_pipeline_stats(processor.lot_key, processor.pipeline_stats())
+    finally:
+        if analysis_pool is not None:
+            analysis_pool.stop()
+        sampler.stop()
+        history_store.close()
+        publisher.close()
+        print("Analyzer stopped")
+
+
+if __name__ == '__main__':
+    main()
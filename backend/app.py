@@ -2,193 +2,184 @@
 from flask import Flask, send_from_directory, jsonify, Response, request
 from flask_cors import CORS
 import os
+import multiprocessing
 import cv2
 import numpy as np
-import pickle
 import threading
 import time
-from pathlib import Path
+from datetime import datetime
 from core.parking_monitor import ParkingMonitor
-from concurrent.futures import ThreadPoolExecutor
+from core.lot_registry import load_lot_registry
+from core.parking_state import ParkingState
+from core.spot_state import SpotEventLog
+from core.spot_analytics import SpotAnalytics
+from core.video_processor import VideoProcessor
+from core.analysis_pool import AnalysisPool, ForwardingEventLog
+from core.shared_state import SharedStateReader
+from core.occupancy_store import OccupancyStore, OccupancySampler, RESOLUTIONS
+from core.broadcast import FrameHub
+from core.metrics import render_prometheus
+from core.static_assets import StaticAssets
+from core.stream_cache import RenditionCache, RENDITIONS, encode_jpeg
 
-app = Flask(__name__, static_folder="static", static_url_path="/")
+# Static files are served by serve_react from memory, not Flask's static route
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
-# Global variables to store parking data
-parking_data = {
-    'lot1': {'total': 0, 'available': 0, 'occupied': 0, 'history': []},
-    'lot2': {'total': 0, 'available': 0, 'occupied': 0, 'history': []}
-}
-
-# Create frames to store the latest processed frames for streaming
-frames = {
-    '1': b'',
-    '2': b''
-}
-
-# Thread locks for frame updates
-frame_locks = {
-    '1': threading.Lock(),
-    '2': threading.Lock()
-}
-
-# Video processing class for better performance
-class VideoProcessor:
-    def __init__(self, video_idx, video_path, pos_file, monitor):
-        self.video_idx = video_idx
-        self.video_path = video_path
-        self.pos_file = pos_file
-        self.monitor = monitor
-        self.positions = []
-        self.cap = None
-        self.fps = 30  # Default FPS
-        self.frame_delay = 1.0 / 30  # Default delay between frames
-        self.lot_key = f'lot{video_idx + 1}'
-        self.lot_id = str(video_idx + 1)
-        
-        self.setup_video()
+# API state, built by init_server(): lots from lots.json (see
+# core/lot_registry.py) and the latest immutable snapshot of each lot's
+# counts and history, with its JSON bodies serialized once per change (see
+# core/parking_state.py)
+lot_registry = None
+parking_state = None
+
+def update_lot(lot_key, **counts):
+    """Update a lot's counts; publishes a new version only if something changed"""
+    return parking_state.update(lot_key, **counts)
+
+def mirror_lot(lot_key, total, available, occupied, history, version, modified):
+    """Replace a lot's data with the analyzer daemon's copy (shared mode)"""
+    return parking_state.mirror(lot_key, total, available, occupied, history, version, modified)
+
+# Maximum concurrent /api/video-stream clients per lot
+MAX_STREAM_VIEWERS = int(os.environ.get('MAX_STREAM_VIEWERS', 50))
+
+# A rendition fetched from /api/video-frame stays encoded this long after the
+# last fetch, so a card refreshing every few seconds always finds a fresh frame
+STILL_FRAME_HOLD = 10.0
+
+# Latest processed frame per lot, JPEG-encoded only while someone is watching
+# and broadcast to the viewers as soon as it is ready
+stream_hubs = {}
+
+# Per-spot state and change feed per lot
+event_logs = {}
+
+# Dwell, turnover and time-of-day aggregates per lot, fed by the same changes
+spot_analytics = {}
+
+# Pipeline stats reported by analysis processes, as {lot_key: stats}
+remote_pipeline_stats = {}
+
+class ApiPublisher:
+    """Applies analysis results to the API state
     
-    def setup_video(self):
-        """Initialize video capture and load positions"""
-        try:
-            if self.pos_file.exists():
-                with open(self.pos_file, 'rb') as f:
-                    self.positions = pickle.load(f)
-                    parking_data[self.lot_key]['total'] = len(self.positions)
-                    print(f"Loaded {len(self.positions)} positions for lot {self.video_idx + 1}")
-            
-            if self.video_path.exists():
-                self.cap = cv2.VideoCapture(str(self.video_path))
-                if self.cap.isOpened():
-                    # Get actual FPS from video
-                    self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-                    if self.fps <= 0:
-                        self.fps = 30  # Fallback FPS
-                    
-                    self.frame_delay = 1.0 / self.fps
-                    print(f"Video {self.video_idx + 1} FPS: {self.fps}")
-                    
-                    # Set buffer size to reduce latency
-                    self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                else:
-                    print(f"Failed to open video {self.video_idx + 1}")
-                    self.cap = None
-            else:
-                print(f"Video file not found: {self.video_path}")
-                
-        except Exception as e:
-            print(f"Error setting up video {self.video_idx + 1}: {e}")
-            self.cap = None
+    VideoProcessors running in this process call it directly; results from
+    analysis processes are replayed on it by the AnalysisPool collector.
+    """
     
-    def process_single_frame(self, frame):
-        """Process a single frame for parking detection"""
-        if not self.positions:
-            return frame, 0
-        
-        # Create a copy for processing
-        processed_frame = frame.copy()
-        
-        # Convert to grayscale and apply preprocessing
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (3, 3), 1)
-        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                     cv2.THRESH_BINARY_INV, 25, 16)
-        processed = cv2.medianBlur(thresh, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        processed = cv2.dilate(processed, kernel, iterations=1)
-        
-        # Count free spots
-        free_count = 0
-        for x, y, w, h in self.positions:
-            spot = processed[y:y+h, x:x+w]
-            nonzero = cv2.countNonZero(spot)
-            
-            if nonzero <= (w * h * self.monitor.OCCUPANCY_THRESHOLD):
-                color = (0, 255, 0)  # Green - free
-                free_count += 1
-            else:
-                color = (0, 0, 255)  # Red - occupied
-            
-            cv2.rectangle(processed_frame, (x, y), (x+w, y+h), color, 2)
-        
-        # Add status text
-        status = f"Free: {free_count}/{len(self.positions)}"
-        cv2.putText(processed_frame, status, (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                   1, (0, 200, 0), 2, cv2.LINE_AA)
-        
-        return processed_frame, free_count
+    def update_lot(self, lot_key, **counts):
+        return update_lot(lot_key, **counts)
     
-    def run_processing(self):
-        """Main processing loop for this video"""
-        if not self.cap:
-            print(f"No video capture available for lot {self.video_idx + 1}")
-            return
-        
-        frame_count = 0
-        last_time = time.time()
+    def is_streaming(self, lot_id):
+        return stream_hubs[lot_id].cache.has_subscribers()
+    
+    def subscriber_counts(self, lot_id):
+        return dict(stream_hubs[lot_id].cache.subscribers)
+    
+    def event_log(self, lot_id):
+        # Route changes through reset_spots/append_spots so analytics see them too
+        return ForwardingEventLog(self, lot_id)
+    
+    def publish_frame(self, lot_id, seq, frame):
+        hub = stream_hubs[lot_id]
+        hub.cache.publish(seq, frame)
+        hub.cache.encode_active()
+        hub.publish(seq)
+    
+    def publish_encoded(self, lot_id, seq, encoded):
+        hub = stream_hubs[lot_id]
+        hub.cache.put_encoded(seq, encoded)
+        hub.publish(seq)
+    
+    def reset_spots(self, lot_id, occupied, timestamp):
+        event_logs[lot_id].reset(occupied, timestamp)
+        spot_analytics[lot_id].reset(occupied, timestamp)
+    
+    def append_spots(self, lot_id, spots, states, timestamp):
+        event_logs[lot_id].append(spots, states, timestamp)
+        spot_analytics[lot_id].append(spots, states, timestamp)
+    
+    def set_pipeline_stats(self, lot_key, stats):
+        remote_pipeline_stats[lot_key] = stats
+    
+    def mirror_lot(self, lot_key, total, available, occupied, history, version, modified):
+        return mirror_lot(lot_key, total, available, occupied, history, version, modified)
+    
+    def load_event_log(self, lot_id, exported):
+        event_log = event_logs[lot_id]
+        seen = event_log.latest_seq
+        event_log.load(exported)
         
-        while True:
-            try:
-                ret, frame = self.cap.read()
-                if not ret:
-                    # Loop video when it ends
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                
-                # Process frame
-                processed_frame, free_count = self.process_single_frame(frame)
-                
-                # Update parking data
-                occupied_count = len(self.positions) - free_count
-                parking_data[self.lot_key]['available'] = free_count
-                parking_data[self.lot_key]['occupied'] = occupied_count
-                
-                # Add to history (limit to last 50 entries)
-                now = time.strftime("%H:%M:%S")
-                history_entry = {
-                    'time': now,
-                    'available': free_count,
-                    'occupied': occupied_count
-                }
-                
-                parking_data[self.lot_key]['history'].append(history_entry)
-                if len(parking_data[self.lot_key]['history']) > 50:
-                    parking_data[self.lot_key]['history'] = parking_data[self.lot_key]['history'][-50:]
-                
-                # Encode frame for streaming
-                ret, buffer = cv2.imencode('.jpg', processed_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                if ret:
-                    with frame_locks[self.lot_id]:
-                        frames[self.lot_id] = buffer.tobytes()
-                
-                # Frame rate control - maintain video's original speed
-                current_time = time.time()
-                elapsed = current_time - last_time
-                
-                if elapsed < self.frame_delay:
-                    time.sleep(self.frame_delay - elapsed)
-                
-                last_time = time.time()
-                frame_count += 1
-                
-                # Print FPS every 100 frames for debugging
-                if frame_count % 100 == 0:
-                    actual_fps = 100 / (time.time() - (last_time - elapsed))
-                    print(f"Lot {self.video_idx + 1} - Target FPS: {self.fps:.1f}, Actual FPS: {actual_fps:.1f}")
-                
-            except Exception as e:
-                print(f"Error processing frame for lot {self.video_idx + 1}: {e}")
-                time.sleep(0.1)
-
-# Global video processors
+        # Feed the analytics the events that are new since the last load
+        analytics = spot_analytics[lot_id]
+        events, reset, _ = event_log.since(seen, limit=event_log.capacity)
+        if reset:
+            occupied, _, _ = event_log.snapshot()
+            analytics.reset(occupied, time.time())
+        for event in events:
+            analytics.append([event['spot']], [event['occupied']], event['time'])
+
+api_publisher = ApiPublisher()
+
+# Global video processors (in-process mode) or analysis process pool
 video_processors = []
+analysis_pool = None
+
+# ANALYZER=embedded: this process runs the analysis (python app.py)
+# ANALYZER=shared: a separate `python analyzer.py` daemon runs it and every
+# web worker mirrors its results from shared memory
+ANALYZER_MODE = os.environ.get('ANALYZER', 'embedded')
+shared_reader = None
+
+# Long-term occupancy history; written by whichever process runs the analysis
+history_store = None
+
+def init_server():
+    """Build the API state and, in shared mode, start mirroring the analyzer
+    
+    Runs when the server imports this module. Analysis processes are
+    spawned, and while one bootstraps it re-imports the parent's main
+    module (app.py or asgi.py, which imports this one); the state isn't
+    built then, so workers open no history database or shared memory.
+    """
+    global lot_registry, parking_state, stream_hubs, event_logs, spot_analytics
+    global shared_reader, history_store
+    lot_registry = load_lot_registry(monitor=ParkingMonitor())
+    parking_state = ParkingState(lot.key for lot in lot_registry)
+    stream_hubs = {lot.id: FrameHub(RenditionCache(), MAX_STREAM_VIEWERS) for lot in lot_registry}
+    event_logs = {lot.id: SpotEventLog() for lot in lot_registry}
+    spot_analytics = {lot.id: SpotAnalytics() for lot in lot_registry}
+    if ANALYZER_MODE == 'shared':
+        shared_reader = SharedStateReader(lot_registry, api_publisher)
+        shared_reader.start()
+    history_store = OccupancyStore(readonly=(ANALYZER_MODE == 'shared'))
+
+# multiprocessing sets _inheriting while a spawned child bootstraps
+if not getattr(multiprocessing.current_process(), '_inheriting', False):
+    init_server()
 
 def setup_video_processing():
-    """Setup video processors for all lots"""
+    """Setup video processing for all lots
+    
+    With analysis_processes set to 0 every lot runs on threads in this
+    process; otherwise lots are sharded across that many analysis processes
+    ("auto" = one per CPU core, at most one per lot).
+    """
+    global analysis_pool
     monitor = ParkingMonitor()
     
-    for i in range(min(2, len(monitor.video_paths))):
-        processor = VideoProcessor(i, monitor.video_paths[i], monitor.pos_files[i], monitor)
+    OccupancySampler(history_store, lambda: {key: (lot.total, lot.available, lot.occupied)
+                                            for key, lot in parking_state.lots.items()}).start()
+    
+    processes = lot_registry.process_count()
+    if processes > 0:
+        analysis_pool = AnalysisPool(lot_registry, processes, api_publisher)
+        analysis_pool.start()
+        return
+    
+    for lot in lot_registry:
+        processor = VideoProcessor(lot, monitor, api_publisher)
         video_processors.append(processor)
     
     # Start processing threads
@@ -201,71 +192,283 @@ def setup_video_processing():
     
     print(f"Started {len(video_processors)} video processing threads")
 
-def generate_frames(lot_id):
-    """Generate frames for streaming with minimal delay"""
+_loading_frames = {}
+
+def loading_frame(lot_id):
+    """Placeholder JPEG shown until the first frame of a lot is ready"""
+    if lot_id not in _loading_frames:
+        blank_frame = np.zeros((480, 640, 3), np.uint8)
+        text = f"Loading Lot {lot_id}..."
+        cv2.putText(blank_frame, text, (200, 240),
+                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        _loading_frames[lot_id] = encode_jpeg(blank_frame)
+    return _loading_frames[lot_id]
+
+def mjpeg_part(lot_id, frame_data):
+    """One part of the multipart/x-mixed-replace video stream"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + (frame_data or loading_frame(lot_id)) + b'\r\n')
+
+def generate_frames(lot_id, viewer):
+    """Generate frames for streaming, one per newly published frame"""
+    hub = stream_hubs[lot_id]
+    frame_data = None
     while True:
         try:
-            with frame_locks[lot_id]:
-                if frames[lot_id]:
-                    frame_data = frames[lot_id]
-                else:
-                    # Generate a blank frame if no data available
-                    blank_frame = np.zeros((480, 640, 3), np.uint8)
-                    text = f"Loading Lot {lot_id}..."
-                    cv2.putText(blank_frame, text, (200, 240),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    _, buffer = cv2.imencode('.jpg', blank_frame)
-                    frame_data = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
+            # Wake up on the next frame; after a timeout resend the last one
+            # so a disconnected client is noticed on the write
+            new_frame = hub.wait_next(viewer, timeout=5.0)
+            if new_frame is not None:
+                frame_data = new_frame
             
-            # Minimal delay for streaming - adjust this value to control stream speed
-            # Lower values = faster stream, higher values = slower stream
-            time.sleep(0.033)  # ~30 FPS streaming
+            yield mjpeg_part(lot_id, frame_data)
             
         except Exception as e:
             print(f"Error generating frame for lot {lot_id}: {e}")
             time.sleep(0.1)
 
+def cached_response(body, etag, modified):
+    """JSON response from pre-serialized bytes, with an ETag and Last-Modified
+    
+    Answers If-None-Match / If-Modified-Since with 304 Not Modified.
+    """
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = modified
+    # Let browsers cache the body but always revalidate
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/api/parking-data')
 def get_parking_data():
-    return jsonify({
-        'lot1': {
-            'total': parking_data['lot1']['total'],
-            'available': parking_data['lot1']['available'],
-            'occupied': parking_data['lot1']['occupied']
-        },
-        'lot2': {
-            'total': parking_data['lot2']['total'],
-            'available': parking_data['lot2']['available'],
-            'occupied': parking_data['lot2']['occupied']
-        }
-    })
+    snapshot = parking_state.all_lots
+    return cached_response(snapshot.body, snapshot.etag, snapshot.modified)
 
 @app.route('/api/parking-details')
 def get_parking_details():
     lot = request.args.get('lot', '1')
     lot_key = f'lot{lot}'
     
-    if lot_key in parking_data:
+    if lot_key in parking_state:
+        snapshot = parking_state[lot_key]
+        return cached_response(snapshot.details_json, snapshot.etag, snapshot.modified)
+    else:
+        return jsonify({'error': 'Invalid lot number'}), 400
+
+def changed_lots(lot_keys, sent_versions):
+    """Snapshots of the lots whose version differs from sent_versions, which is updated"""
+    changed = {}
+    for key in lot_keys:
+        snapshot = parking_state[key]
+        if sent_versions.get(key) != snapshot.version:
+            sent_versions[key] = snapshot.version
+            changed[key] = snapshot
+    return changed
+
+def parking_event(changed):
+    """An SSE message with the changed lots' counts, or a heartbeat if there are none"""
+    if changed:
+        return 'data: {' + ', '.join(f'"{key}": {snapshot.counts_json.decode()}'
+                                     for key, snapshot in changed.items()) + '}\n\n'
+    # Comment line keeps proxies from closing an idle connection
+    return ': heartbeat\n\n'
+
+def generate_parking_events(lot_keys, heartbeat=15.0):
+    """Server-Sent Events: push a lot's counts whenever its version changes"""
+    yield 'retry: 3000\n\n'
+    sent_versions = {}
+    while True:
+        with parking_state.changed:
+            changed = changed_lots(lot_keys, sent_versions)
+            if not changed:
+                parking_state.changed.wait(heartbeat)
+                changed = changed_lots(lot_keys, sent_versions)
+        yield parking_event(changed)
+
+def parking_stream_keys(lot):
+    """Lot keys a /api/parking-stream client asked for (all without ?lot=), None if invalid"""
+    if lot is None:
+        return list(parking_state.lot_keys)
+    if f'lot{lot}' in parking_state:
+        return [f'lot{lot}']
+    return None
+
+@app.route('/api/parking-stream')
+def parking_stream():
+    lot_keys = parking_stream_keys(request.args.get('lot'))
+    if lot_keys is None:
+        return jsonify({'error': 'Invalid lot number'}), 400
+    
+    response = Response(generate_parking_events(lot_keys), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/parking-events')
+def get_parking_events():
+    lot = request.args.get('lot', '1')
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid since value'}), 400
+    
+    if lot not in event_logs:
+        return jsonify({'error': 'Invalid lot number'}), 400
+    
+    event_log = event_logs[lot]
+    events, reset, more = event_log.since(since)
+    if reset:
+        # Client is out of sync - send the full state it can continue from
+        occupied, last_change, seq = event_log.snapshot()
         return jsonify({
-            'total': parking_data[lot_key]['total'],
-            'available': parking_data[lot_key]['available'],
-            'occupied': parking_data[lot_key]['occupied'],
-            'history': parking_data[lot_key]['history']
+            'seq': seq,
+            'reset': True,
+            'spots': len(occupied),
+            'occupied': np.flatnonzero(occupied).tolist(),
+            'last_change': last_change.tolist(),
+            'events': [],
+            'more': False
         })
-    else:
+    
+    return jsonify({
+        'seq': events[-1]['seq'] if events else since,
+        'reset': False,
+        'events': events,
+        'more': more
+    })
+
+def parse_time(value, default):
+    """Epoch seconds or an ISO 8601 date/time from a query parameter"""
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/parking-history')
+def get_parking_history():
+    lot = request.args.get('lot', '1')
+    lot_key = f'lot{lot}'
+    if lot_key not in parking_state:
         return jsonify({'error': 'Invalid lot number'}), 400
+    
+    resolution = request.args.get('resolution', 'auto')
+    if resolution not in ('auto', 'raw', *RESOLUTIONS):
+        return jsonify({'error': 'Invalid resolution'}), 400
+    
+    try:
+        end = parse_time(request.args.get('to'), time.time())
+        start = parse_time(request.args.get('from'), end - 86400)
+    except ValueError:
+        return jsonify({'error': 'Invalid from/to value'}), 400
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    resolution, points = history_store.query(lot_key, start, end, resolution)
+    return jsonify({
+        'lot': lot,
+        'from': start,
+        'to': end,
+        'resolution': resolution,
+        'points': points
+    })
+
+@app.route('/api/lot-analytics')
+def get_lot_analytics():
+    lot = request.args.get('lot', '1')
+    if lot not in spot_analytics:
+        return jsonify({'error': 'Invalid lot number'}), 400
+    
+    return jsonify(spot_analytics[lot].lot_summary())
+
+@app.route('/api/spot-analytics')
+def get_spot_analytics():
+    lot = request.args.get('lot', '1')
+    if lot not in spot_analytics:
+        return jsonify({'error': 'Invalid lot number'}), 400
+    
+    try:
+        spot = int(request.args.get('spot', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid spot number'}), 400
+    
+    summary = spot_analytics[lot].spot_summary(spot)
+    if summary is None:
+        return jsonify({'error': 'Invalid spot number'}), 400
+    return jsonify(summary)
 
 @app.route('/api/video-stream')
 def video_stream():
     lot = request.args.get('lot', '1')
-    if lot not in ['1', '2']:
+    if lot not in stream_hubs:
         return "Invalid lot number", 400
     
-    return Response(generate_frames(lot),
-                    mimetype='multipart/x-mixed-replace; boundary=frame')
+    rendition = request.args.get('rendition', 'full')
+    if rendition not in RENDITIONS:
+        return "Invalid rendition", 400
+    
+    hub = stream_hubs[lot]
+    viewer = hub.subscribe(rendition)
+    if viewer is None:
+        return "Too many viewers for this lot", 503
+    
+    response = Response(generate_frames(lot, viewer),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    # Client disconnected - stop encoding for it
+    response.call_on_close(lambda: hub.unsubscribe(viewer))
+    return response
+
+@app.route('/api/video-frame')
+def video_frame():
+    """The newest frame of a lot as a single JPEG, for thumbnails refreshed by polling"""
+    lot = request.args.get('lot', '1')
+    if lot not in stream_hubs:
+        return "Invalid lot number", 400
+    
+    rendition = request.args.get('rendition', 'thumb')
+    if rendition not in RENDITIONS:
+        return "Invalid rendition", 400
+    
+    hub = stream_hubs[lot]
+    if hub.hold(rendition, STILL_FRAME_HOLD):
+        # The newest frame may be from before anyone watched; wait for a current one
+        hub.wait_publish(timeout=1.0)
+    _, frame_data = hub.cache.get(rendition)
+    response = Response(frame_data or loading_frame(lot), mimetype='image/jpeg')
+    response.cache_control.no_store = True
+    return response
+
+def stream_stats():
+    return {lot.key: stream_hubs[lot.id].stats() for lot in lot_registry}
+
+def pipeline_stats():
+    """Pipeline stats of every lot, whichever process analyses it"""
+    stats = dict(remote_pipeline_stats)
+    stats.update({processor.lot_key: processor.pipeline_stats()
+                  for processor in video_processors})
+    return stats
+
+@app.route('/api/stream-stats')
+def get_stream_stats():
+    return jsonify(stream_stats())
+
+@app.route('/api/pipeline-stats')
+def get_pipeline_stats():
+    stats = pipeline_stats()
+    if analysis_pool is not None:
+        stats['analysis_pool'] = analysis_pool.stats()
+    return jsonify(stats)
+
+@app.route('/metrics')
+def metrics():
+    """Stage timings and counters in the Prometheus text format"""
+    return Response(render_prometheus(pipeline_stats(), stream_stats()),
+                    mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/lots')
+def get_lots():
+    return jsonify([lot.to_dict() for lot in lot_registry])
 
 @app.route('/health')
 def health():
@@ -273,25 +476,44 @@ def health():
 
 # --- STATIC FILE SERVING FOR REACT FRONTEND ---
 
+# The Vite build (frontend/ `npm run build`), held in memory with gzip and
+# brotli variants; see core/static_assets.py
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+static_assets = StaticAssets(STATIC_DIR)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react(path):
-    # Serve static files from static, else index.html for SPA
-    static_folder = str(app.static_folder)
-    file_path = os.path.join(static_folder, path)
-    if path != "" and os.path.exists(file_path):
-        return send_from_directory(static_folder, path)
-    else:
-        return send_from_directory(static_folder, 'index.html')
+    # Serve static files from memory, else index.html for SPA
+    asset = static_assets.get(path) if path else None
+    if asset is None:
+        if path and os.path.isfile(os.path.join(STATIC_DIR, path)):
+            return send_from_directory(STATIC_DIR, path)  # Too large to keep in memory
+        asset = static_assets.index
+        if asset is None:
+            return "Frontend not built", 404
+    
+    coding, body = asset.negotiate(request.accept_encodings)
+    response = Response(body, mimetype=asset.mimetype)
+    response.headers['Cache-Control'] = asset.cache_control
+    response.vary.add('Accept-Encoding')
+    if coding != 'identity':
+        response.headers['Content-Encoding'] = coding
+    # Strong ETag per encoded variant
+    response.set_etag(asset.etag if coding == 'identity' else f'{asset.etag}-{coding}')
+    return response.make_conditional(request)
 
 if __name__ == '__main__':
     print("Starting Parking Monitor Flask App...")
     
-    # Setup video processing
-    setup_video_processing()
+    static_assets.load()
     
-    # Give some time for video processors to initialize
-    time.sleep(2)
+    # Setup video processing, unless an analyzer daemon is doing it
+    if ANALYZER_MODE != 'shared':
+        setup_video_processing()
+        
+        # Give some time for video processors to initialize
+        time.sleep(2)
     
     # Run the Flask app
     app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
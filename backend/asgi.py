@@ -0,0 +1,290 @@
+# asgi.py
+"""ASGI entry point
+
+Serves the Flask app's routes from an asyncio server, for many concurrent
+stream clients on one process:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    python asgi.py
+
+The long-lived streams, /api/video-stream and /api/parking-stream, are
+served by coroutines. A publish wakes the event loop once per lot
+(call_soon_threadsafe from the analysis or reader thread) and every client
+of that lot resumes, so an open stream holds no thread. Every other route
+goes to the Flask app on a small thread pool (ASGI_THREADS, default 8).
+
+The analysis starts with the server unless ANALYZER=shared, in which case
+any number of uvicorn workers can serve one analyzer daemon.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import app as web
+from core.broadcast import PENDING
+from core.stream_cache import RENDITIONS
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))
+
+# Like generate_frames: resend the last frame when nothing new came for this
+# long, and send an SSE heartbeat as generate_parking_events does
+FRAME_TIMEOUT = 5.0
+SSE_HEARTBEAT = 15.0
+
+_executor = ThreadPoolExecutor(ASGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+
+class Wakeup:
+    """'Something changed' signal set from any thread, awaited by many coroutines
+
+    Holds one future per change: set() resolves the current one on the event
+    loop and starts the next, so each change costs one loop callback however
+    many clients wait for it.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def set(self, *args):
+        self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        if not self.future.done():
+            self.future.set_result(None)
+        self.future = self.loop.create_future()
+
+
+_frame_wakeups = {}  # {lot_id: Wakeup}, hooked to the lot's FrameHub
+_parking_wakeup = None
+
+
+def _wakeups():
+    """Hook Wakeups into the frame hubs and lot updates, on first use"""
+    global _parking_wakeup
+    if _parking_wakeup is None:
+        loop = asyncio.get_running_loop()
+        for lot_id, hub in web.stream_hubs.items():
+            _frame_wakeups[lot_id] = Wakeup(loop)
+            hub.add_listener(_frame_wakeups[lot_id].set)
+        _parking_wakeup = Wakeup(loop)
+        web.parking_state.listeners.append(_parking_wakeup.set)
+    return _frame_wakeups, _parking_wakeup
+
+
+async def _next_frame(hub, viewer):
+    """hub.next_frame() that never encodes on the event loop
+
+    Publishers encode the watched renditions before waking the streams, so
+    the frame is normally there already. A rendition that nobody watched
+    when the frame was published is encoded (or its encode waited for) on
+    the executor.
+    """
+    frame = hub.next_frame(viewer, encode=False)
+    if frame is PENDING:
+        frame = await asyncio.get_running_loop().run_in_executor(_executor, hub.next_frame, viewer)
+    return frame
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _wait_change(changed, disconnect, timeout):
+    """Wait for changed (a Wakeup's future); False once the client has gone
+
+    Take the future before checking for news: a change signalled while the
+    check runs then resolves it rather than a later one, and isn't missed.
+    """
+    await asyncio.wait((changed, disconnect), timeout=timeout,
+                       return_when=asyncio.FIRST_COMPLETED)
+    return not disconnect.done()
+
+
+async def _simple_response(send, status, body, content_type):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type.encode())]})
+    await send({'type': 'http.response.body', 'body': body.encode()})
+
+
+async def video_stream(scope, receive, send, args):
+    """/api/video-stream as a coroutine; same checks and parts as the Flask route"""
+    lot = args.get('lot', '1')
+    if lot not in web.stream_hubs:
+        return await _simple_response(send, 400, "Invalid lot number", 'text/html; charset=utf-8')
+    rendition = args.get('rendition', 'full')
+    if rendition not in RENDITIONS:
+        return await _simple_response(send, 400, "Invalid rendition", 'text/html; charset=utf-8')
+
+    hub = web.stream_hubs[lot]
+    viewer = hub.subscribe(rendition)
+    if viewer is None:
+        return await _simple_response(send, 503, "Too many viewers for this lot", 'text/html; charset=utf-8')
+
+    wakeup = _wakeups()[0][lot]
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame')]})
+        frame_data = None
+        while not disconnect.done():
+            changed = wakeup.future  # _next_frame() may run on the executor while a frame comes in
+            new_frame = await _next_frame(hub, viewer)
+            if new_frame is None:
+                if not await _wait_change(changed, disconnect, FRAME_TIMEOUT):
+                    break
+                new_frame = await _next_frame(hub, viewer)
+            if new_frame is not None:
+                frame_data = new_frame
+            # Waits while the client's socket buffer is full; it then gets
+            # the newest frame and the ones in between count as skipped
+            await send({'type': 'http.response.body', 'body': web.mjpeg_part(lot, frame_data),
+                        'more_body': True})
+    finally:
+        disconnect.cancel()
+        hub.unsubscribe(viewer)
+
+
+async def parking_stream(scope, receive, send, args):
+    """/api/parking-stream (Server-Sent Events) as a coroutine"""
+    lot_keys = web.parking_stream_keys(args.get('lot'))
+    if lot_keys is None:
+        return await _simple_response(send, 400, json.dumps({'error': 'Invalid lot number'}),
+                                      'application/json')
+
+    wakeup = _wakeups()[1]
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')]})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        sent_versions = {}
+        while not disconnect.done():
+            future = wakeup.future
+            changed = web.changed_lots(lot_keys, sent_versions)
+            if not changed:
+                if not await _wait_change(future, disconnect, SSE_HEARTBEAT):
+                    break
+                changed = web.changed_lots(lot_keys, sent_versions)
+            await send({'type': 'http.response.body', 'body': web.parking_event(changed).encode(),
+                        'more_body': True})
+    finally:
+        disconnect.cancel()
+
+
+STREAMS = {
+    '/api/video-stream': video_stream,
+    '/api/parking-stream': parking_stream,
+}
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def run_wsgi(environ):
+    """Call the Flask app; returns (status code, headers, body)"""
+    response = []
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, headers]
+        return chunks.append
+
+    result = web.app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    status, headers = response
+    return (int(status.split(' ', 1)[0]),
+            [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+            b''.join(chunks))
+
+
+async def call_flask(scope, receive, send):
+    """Answer a (finite) request with the Flask app, on the thread pool"""
+    body = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    loop = asyncio.get_running_loop()
+    status, headers, content = await loop.run_in_executor(
+        _executor, run_wsgi, wsgi_environ(scope, b''.join(body)))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _wakeups()
+            web.static_assets.load()
+            if web.ANALYZER_MODE != 'shared':
+                web.setup_video_processing()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if web.analysis_pool is not None:
+                web.analysis_pool.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    stream = STREAMS.get(scope['path'])
+    if stream is not None and scope['method'] == 'GET':
+        args = {}
+        for name, value in parse_qsl(scope['query_string'].decode('latin-1')):
+            args.setdefault(name, value)  # First value wins, as in request.args.get()
+        return await stream(scope, receive, send, args)
+    return await call_flask(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("Starting Parking Monitor ASGI app...")
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,104 @@
+# batch.py
+"""Offline batch analysis of recorded footage
+
+Analyses a video file headlessly and as fast as the machine allows: the
+file is split into chunks scored in parallel by a process pool, and the
+per-frame, per-spot occupancy timeline is written to a compressed .npz
+file (columns frame, time, occupied, free) with a JSON summary next to it.
+
+    python batch.py recording.mp4 --layout assets/coordinate-video-1 --out results/day1
+    python batch.py --lot 1 --out results/lot1 --workers 8 --step 5
+    python batch.py --lot 1 --out results/lot1 --classifier linear --model models/lot1.npz
+
+Load the timeline with:
+
+    data = np.load('results/day1.npz')
+    occupied = np.unpackbits(data['occupied'], axis=1, count=int(data['spots']))
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import cv2
+
+from core.batch_analysis import BatchSettings, run_batch
+from core.layout_file import load_layout
+from core.lot_registry import load_lot_registry
+from core.parking_monitor import ParkingMonitor
+from core.spot_classifier import CLASSIFIERS, load_classifier
+
+
+def parse_start(value, video):
+    """Epoch seconds or ISO 8601; by default the file's mtime minus its duration"""
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+    cap = cv2.VideoCapture(str(video))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+    cap.release()
+    return os.path.getmtime(video) - duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse recorded footage faster than real time")
+    parser.add_argument('video', nargs='?', help="video file (or use --lot)")
+    parser.add_argument('--layout', help="layout file for the video")
+    parser.add_argument('--lot', help="take the video, layout, analysis width and classifier of a lot in lots.json")
+    parser.add_argument('--out', required=True, help="output path; writes OUT.npz and OUT.json")
+    parser.add_argument('--workers', type=int, default=0, help="worker processes (0 = one per core)")
+    parser.add_argument('--step', type=int, default=1, help="analyse every n-th frame")
+    parser.add_argument('--analysis-width', type=int, help="score frames downscaled to this width")
+    parser.add_argument('--start', help="wall-clock time of the first frame (epoch or ISO 8601)")
+    parser.add_argument('--classifier', choices=CLASSIFIERS, help="how spots are scored (default edge)")
+    parser.add_argument('--model', help="model file of the linear classifier (see train_classifier.py)")
+    parser.add_argument('--ratios', action='store_true', help="also store every spot's score (float16)")
+    args = parser.parse_args()
+
+    monitor = ParkingMonitor()
+    video, layout, analysis_width = args.video, args.layout, args.analysis_width
+    classifier, model = args.classifier, args.model
+    if args.lot:
+        lot = load_lot_registry(monitor=monitor).get(args.lot)
+        if lot is None or not lot.is_file:
+            parser.error(f"No lot {args.lot} with a video file in the registry")
+        video = video or lot.source
+        layout = layout or lot.layout
+        analysis_width = analysis_width or lot.analysis_width
+        if classifier is None and model is None:
+            classifier, model = lot.classifier, lot.classifier_model
+    if not video or not layout:
+        parser.error("need a video and --layout, or --lot")
+    if not Path(video).exists():
+        parser.error(f"Video file not found: {video}")
+    if not Path(layout).exists():
+        parser.error(f"Layout file not found: {layout}")
+
+    try:
+        stored = load_layout(layout)
+    except Exception as e:  # Not JSON or a plain pickle, or a corrupted layout
+        parser.error(f"Could not read layout {layout}: {e}")
+    if not stored.positions:
+        sys.exit(f"No spots in {layout}")
+    try:
+        spot_classifier = load_classifier(classifier or ('linear' if model else 'edge'), model, monitor)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    settings = BatchSettings(stored.positions, stored.frame_size, spot_classifier, analysis_width, args.step)
+
+    summary = run_batch(video, settings, monitor, Path(args.out).with_suffix('.npz'),
+                        workers=args.workers or None, start_time=parse_start(args.start, video),
+                        keep_ratios=args.ratios)
+    print(json.dumps({key: summary[key] for key in ('frames_analysed', 'video_seconds', 'spots', 'workers',
+                                                   'wall_seconds', 'frames_per_second',
+                                                   'speed_vs_realtime', 'free')}, indent=2))
+    print(f"Timeline written to {Path(args.out).with_suffix('.npz')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# analysis_resolution.py
+# Compare occupancy at reduced analysis widths against the source resolution:
+# how many spot decisions agree, how far the edge ratios move, and what each
+# width costs per frame.
+#
+# Run from the backend directory, on a recorded clip and its layout:
+#   python -m benchmarks.analysis_resolution --video clip.mp4 --layout assets/coordinate-video-1
+# or on synthetic frames:
+#   python -m benchmarks.analysis_resolution [--width 3840 --height 2160]
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.spot_scoring import make_frame, make_positions
+from core.layout_file import load_layout
+from core.spot_layout import SpotLayout, downscale
+
+OCCUPANCY_THRESHOLD = 0.2
+
+
+def read_frames(video, count, step):
+    cap = cv2.VideoCapture(str(video))
+    frames = []
+    index = 0
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % step == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def score_at(frame, positions, reference, width, repeat=3):
+    """(occupied, edge ratios, seconds) with the frame downscaled to width
+
+    The time covers the resize and scoring, best of `repeat` runs.
+    """
+    height, source_width = frame.shape[:2]
+    size = (width, max(1, round(height * width / source_width))) if width < source_width else (source_width, height)
+    layout = SpotLayout(positions, size, reference)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        occupied, counts = layout.score(downscale(frame, size), OCCUPANCY_THRESHOLD)
+        best = min(best, time.perf_counter() - start)
+    return occupied, counts / np.maximum(layout.areas, 1), best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Occupancy accuracy vs analysis resolution")
+    parser.add_argument('--video', help="recorded clip (synthetic frames if omitted)")
+    parser.add_argument('--layout', help="layout file for the clip")
+    parser.add_argument('--frames', type=int, default=30)
+    parser.add_argument('--step', type=int, default=10, help="use every n-th frame of the clip")
+    parser.add_argument('--width', type=int, default=1920, help="synthetic frame width")
+    parser.add_argument('--height', type=int, default=1080, help="synthetic frame height")
+    parser.add_argument('--spots', type=int, default=200, help="synthetic spot count")
+    parser.add_argument('--widths', type=int, nargs='+', default=[1280, 960, 640, 480])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.video:
+        if not args.layout:
+            parser.error("--video needs --layout")
+        frames = read_frames(args.video, args.frames, args.step)
+        if not frames:
+            parser.error(f"Could not read frames from {args.video}")
+        stored = load_layout(args.layout)
+        positions = stored.positions
+        reference = stored.frame_size or (frames[0].shape[1], frames[0].shape[0])
+    else:
+        frames = [make_frame(args.width, args.height, seed) for seed in range(args.frames)]
+        positions = make_positions(args.spots, args.width, args.height)
+        reference = (args.width, args.height)
+
+    source_width = frames[0].shape[1]
+    widths = [source_width] + [w for w in args.widths if w < source_width]
+    print(f"{len(frames)} frames at {source_width}x{frames[0].shape[0]}, {len(positions)} spots")
+    print(f"{'width':>6} {'ms/frame':>9} {'speedup':>8} {'agree %':>8} {'flips':>6} {'ratio err':>10}")
+
+    baseline = [score_at(frame, positions, reference, source_width, args.repeat) for frame in frames]
+    base_seconds = sum(result[2] for result in baseline) / len(frames)
+    for width in widths:
+        results = [score_at(frame, positions, reference, width, args.repeat) for frame in frames]
+        seconds = sum(result[2] for result in results) / len(frames)
+        flips = sum(int((occupied != base[0]).sum()) for (occupied, _, _), base in zip(results, baseline))
+        decisions = len(frames) * len(positions)
+        ratio_error = np.mean([np.abs(ratios - base[1]).mean() for (_, ratios, _), base in zip(results, baseline)])
+        print(f"{width:>6} {seconds * 1000:>9.2f} {base_seconds / seconds:>7.1f}x "
+              f"{100.0 * (decisions - flips) / decisions:>8.2f} {flips:>6} {ratio_error:>10.4f}")
+
+
+if __name__ == '__main__':
+    main()
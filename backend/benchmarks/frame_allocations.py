@@ -0,0 +1,113 @@
+# frame_allocations.py
+# Check that the steady-state frame hot loop allocates (almost) nothing:
+# run VideoProcessor.analyze_frame (resize, motion, filter chain, scoring,
+# overlay) and ParkingMonitor.process_frame on pre-rendered synthetic
+# frames under tracemalloc, and compare with the same calls without the
+# reused buffers. NumPy reports its buffers to tracemalloc, so every
+# frame-sized array shows up. Exits 1 if a steady-state frame allocates
+# more than --budget KiB, or if the buffered results differ.
+#
+# Run from the backend directory:
+#   python -m benchmarks.frame_allocations [--width 3840 --height 2160 --spots 200]
+import argparse
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_lot import SyntheticLot
+from core.layout_file import save_layout
+from core.lot_registry import LotConfig
+from core.parking_monitor import ParkingMonitor
+from core.spot_layout import SpotLayout, preprocess
+from core.spot_state import SpotEventLog
+from core.video_processor import VideoProcessor
+from core.workspace import FrameWorkspace
+
+
+class NullPublisher:
+    """Publisher that asks for the overlay and throws results away"""
+
+    def update_lot(self, lot_key, **counts):
+        pass
+
+    def is_streaming(self, lot_id):
+        return True
+
+    def event_log(self, lot_id):
+        return SpotEventLog()
+
+    def publish_frame(self, lot_id, seq, frame):
+        pass
+
+
+def traced_kib(fn, frames, warmup):
+    """Mean and max tracemalloc peak (KiB above the live set) per call after warmup"""
+    for frame in frames[:warmup]:
+        fn(frame)
+    peaks = []
+    tracemalloc.start()
+    for frame in frames[warmup:]:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(frame)
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+    tracemalloc.stop()
+    return float(np.mean(peaks)), float(np.max(peaks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame allocations of the analysis hot loop")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--spots', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--analysis-width', type=int, default=960)
+    parser.add_argument('--budget', type=float, default=64.0, help="max KiB a steady-state frame may allocate")
+    args = parser.parse_args()
+
+    lot = SyntheticLot(args.width, args.height, args.spots)
+    frames = list(lot.frames(args.frames))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        layout_file = Path(tmp) / 'layout'
+        save_layout(layout_file, lot.positions, lot.frame_size)
+        monitor = ParkingMonitor()
+        monitor.ANALYSIS_FPS = float('inf')  # Analyse every frame
+        processor = VideoProcessor(LotConfig('alloc', Path(tmp) / 'none.mp4', layout_file,
+                                             analysis_width=args.analysis_width),
+                                   monitor, NullPublisher())
+
+        seq = iter(range(1, 1 << 30))
+        analyze_mean, analyze_max = traced_kib(lambda f: processor.analyze_frame((next(seq), f, None)),
+                                               frames, args.warmup)
+        monitor.original_frame_sizes[0] = lot.frame_size
+        # process_frame draws on the frame it is given, so it gets copies
+        monitor_mean, monitor_max = traced_kib(lambda f: monitor.process_frame(f, lot.positions, 0),
+                                               [f.copy() for f in frames], args.warmup)
+
+    # The same scoring without reused buffers, for comparison and correctness
+    layout = SpotLayout(lot.positions, lot.frame_size)
+    legacy_mean, _ = traced_kib(lambda f: layout.score(f, monitor.OCCUPANCY_THRESHOLD), frames, args.warmup)
+    threshold, buffered = monitor.OCCUPANCY_THRESHOLD, FrameWorkspace()
+    match = all(np.array_equal(layout.score(f, threshold)[1], layout.score(f, threshold, workspace=buffered)[1])
+                and np.array_equal(preprocess(layout.crop(f)), preprocess(layout.crop(f), buffered))
+                for f in frames[:5])
+
+    print(f"{args.width}x{args.height}, {len(lot.positions)} spots, analysis width {args.analysis_width}")
+    print(f"{'path':>28} {'mean KiB':>9} {'max KiB':>8}")
+    print(f"{'VideoProcessor.analyze_frame':>28} {analyze_mean:>9.1f} {analyze_max:>8.1f}")
+    print(f"{'ParkingMonitor.process_frame':>28} {monitor_mean:>9.1f} {monitor_max:>8.1f}")
+    print(f"{'SpotLayout.score (no buffers)':>28} {legacy_mean:>9.1f}")
+    print(f"Buffered results match: {'yes' if match else 'NO'}")
+
+    if not match or max(analyze_max, monitor_max) > args.budget:
+        print(f"FAIL: over the {args.budget:.0f} KiB per-frame budget or results differ")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# loop_cache.py
+# Play a synthetic clip in a loop through the real VideoProcessor
+# (run_processing with its analysis and encoder threads, paced at the
+# clip's FPS, stream watched) with the loop cache on, and report the CPU
+# time and cache hit rate of every pass. The first pass fills the cache;
+# later ones should be served from it. Exits 1 if a later pass hits less
+# than --min-hit-rate or doesn't use less than --max-cpu of the first
+# pass's CPU time.
+#
+# Run from the backend directory:
+#   python -m benchmarks.loop_cache [--mode disk --width 1920 --height 1080 --passes 3]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_lot import write_clip
+from core.lot_registry import LotConfig
+from core.parking_monitor import ParkingMonitor
+from core.spot_state import SpotEventLog
+from core.video_processor import VideoProcessor
+
+
+class LoopPublisher:
+    """Publisher with one viewer of the full rendition that counts what it gets"""
+
+    def __init__(self):
+        self.frames = 0
+        self.updates = 0
+
+    def update_lot(self, lot_key, **counts):
+        self.updates += 1
+
+    def is_streaming(self, lot_id):
+        return True
+
+    def subscriber_counts(self, lot_id):
+        return {'full': 1, 'thumb': 0}
+
+    def event_log(self, lot_id):
+        return SpotEventLog()
+
+    def publish_frame(self, lot_id, seq, frame):
+        self.frames += 1
+
+    def publish_encoded(self, lot_id, seq, encoded):
+        self.frames += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU per loop of a cached looped file source")
+    parser.add_argument('--mode', choices=('memory', 'disk'), default='memory')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--passes', type=int, default=3)
+    parser.add_argument('--cache-mb', type=float, default=256)
+    parser.add_argument('--min-hit-rate', type=float, default=0.9)
+    parser.add_argument('--max-cpu', type=float, default=0.5, help="max CPU of a cached pass, relative to the first")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video, layout, _ = write_clip(tmp, args.width, args.height, args.spots, args.frames, args.fps)
+        os.environ['LOOP_CACHE_DIR'] = str(Path(tmp) / 'cache')  # Not the app's data directory
+        lot = LotConfig('bench', Path(video), layout, loop_cache=args.mode, loop_cache_mb=args.cache_mb)
+        publisher = LoopPublisher()
+        processor = VideoProcessor(lot, ParkingMonitor(), publisher)
+        threading.Thread(target=processor.run_processing, daemon=True).start()
+
+        passes = []
+        restarts, cpu, wall = 0, time.process_time(), time.monotonic()
+        hits, misses = 0, 0
+        while len(passes) < args.passes:
+            time.sleep(0.01)
+            if processor.decode_restarts == restarts:
+                continue
+            restarts = processor.decode_restarts
+            stats = processor.loop_cache.stats()
+            now_cpu, now_wall = time.process_time(), time.monotonic()
+            lookups = stats['hits'] - hits + stats['misses'] - misses
+            passes.append({
+                'cpu': now_cpu - cpu,
+                'wall': now_wall - wall,
+                'hit_rate': (stats['hits'] - hits) / lookups if lookups else 0.0
+            })
+            cpu, wall, hits, misses = now_cpu, now_wall, stats['hits'], stats['misses']
+        stats = processor.loop_cache.stats()
+
+    print(f"{args.width}x{args.height}, {args.spots} spots, {args.frames} frames at {args.fps:g} FPS, "
+          f"{args.mode} cache")
+    print(f"{'pass':>4} {'wall s':>7} {'CPU s':>7} {'CPU %':>6} {'hit rate':>9}")
+    for i, result in enumerate(passes, 1):
+        print(f"{i:>4} {result['wall']:>7.2f} {result['cpu']:>7.2f} "
+              f"{100 * result['cpu'] / result['wall']:>6.1f} {result['hit_rate']:>9.3f}")
+    print(f"Cached {stats['frames']} frames in {stats['bytes'] / (1 << 20):.1f} MiB; "
+          f"{publisher.frames} frames published, {publisher.updates} count updates")
+
+    first = passes[0]['cpu']
+    failed = [i for i, result in enumerate(passes[1:], 2)
+              if result['hit_rate'] < args.min_hit_rate or result['cpu'] > args.max_cpu * first]
+    if failed:
+        print(f"FAIL: pass {', '.join(map(str, failed))} below {args.min_hit_rate:.0%} hits "
+              f"or above {args.max_cpu:.0%} of the first pass's CPU")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# occupancy_batch.py
+# Score several synthetic lots frame by frame (a classifier.scores() call
+# per lot and frame, like the old monitor loop) and through
+# OccupancyEngine.process_batch() with every lot's next --batch frames in
+# one call, for the edge and the linear classifier and each --threads
+# count, plus the motion-gated OccupancyEngine.update() the headless
+# monitor falls back to with one thread. Reports frames per second. Checks that the batched scores match
+# the per-frame ones and that the debounced batch results match a
+# SpotStateTracker fed frame by frame. Exits 1 if they don't.
+#
+# Run from the backend directory:
+#   python -m benchmarks.occupancy_batch [--lots 4 --spots 100 --width 1280 --height 720 --batch 4]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_lot import SyntheticLot
+from core.occupancy_engine import OccupancyEngine
+from core.parking_monitor import ParkingMonitor
+from core.spot_classifier import EdgeClassifier, patch_features, sample_patches, train_linear
+from core.spot_layout import SpotLayout
+from core.spot_state import SpotEventLog, SpotStateTracker
+from core.workspace import FrameWorkspace
+
+FPS = 30.0  # Video time the frames are debounced on
+
+
+def per_frame(classifier, lots, frames):
+    """(scores per lot as (frames, spots), seconds) from one scores() call per lot and frame"""
+    layouts = [SpotLayout(lot.positions, lot.frame_size) for lot in lots]
+    workspaces = [FrameWorkspace() for _ in lots]
+    started = time.perf_counter()
+    scores = [np.array([classifier.scores(layout, frame, workspace=workspace) for frame in lot_frames])
+              for layout, workspace, lot_frames in zip(layouts, workspaces, frames)]
+    return scores, time.perf_counter() - started
+
+
+def batched(classifier, lots, frames, batch, threads):
+    """(scores per lot, debounced occupancy per lot, seconds) through process_batch()"""
+    engine = OccupancyEngine(ParkingMonitor(), threads)
+    for key, lot in enumerate(lots):
+        engine.add_lot(key, lot.positions, lot.frame_size, classifier=classifier)
+    count = len(frames[0])
+    scores = [np.empty((count, len(lot.positions))) for lot in lots]
+    occupied = [np.empty((count, len(lot.positions)), dtype=bool) for lot in lots]
+    started = time.perf_counter()
+    for start in range(0, count, batch):
+        stop = min(start + batch, count)
+        stack = [frame for lot_frames in frames for frame in lot_frames[start:stop]]
+        keys = [key for key in range(len(lots)) for _ in range(start, stop)]
+        times = [index / FPS for _ in lots for index in range(start, stop)]
+        batch_occupied, batch_scores = engine.process_batch(stack, keys, times)
+        for key, lot in enumerate(lots):
+            rows = slice(key * (stop - start), (key + 1) * (stop - start))
+            scores[key][start:stop] = batch_scores[rows, :len(lot.positions)]
+            occupied[key][start:stop] = batch_occupied[rows, :len(lot.positions)]
+    elapsed = time.perf_counter() - started
+    engine.close()
+    return scores, occupied, elapsed
+
+
+def gated(classifier, lots, frames):
+    """Seconds to run every frame through the motion-gated OccupancyEngine.update()"""
+    engine = OccupancyEngine(ParkingMonitor(), 1)
+    for key, lot in enumerate(lots):
+        engine.add_lot(key, lot.positions, lot.frame_size, classifier=classifier)
+    started = time.perf_counter()
+    for index in range(len(frames[0])):
+        for key, lot_frames in enumerate(frames):
+            engine.update(key, lot_frames[index], index / FPS, index / FPS)
+    return time.perf_counter() - started
+
+
+def debounced(classifier, scores, min_dwell):
+    """Occupancy after each frame from a SpotStateTracker fed one frame at a time"""
+    tracker = SpotStateTracker(scores.shape[1], classifier.threshold + classifier.hysteresis,
+                               classifier.threshold - classifier.hysteresis, min_dwell, SpotEventLog())
+    rows = []
+    for index, row in enumerate(scores):
+        tracker.update(row, index / FPS)
+        rows.append(tracker.occupied)
+    return np.array(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-frame scoring versus OccupancyEngine.process_batch()")
+    parser.add_argument('--lots', type=int, default=4)
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=40, help="frames per lot")
+    parser.add_argument('--batch', type=int, default=4, help="consecutive frames per lot in each call")
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, min(os.cpu_count() or 1, 8)}))
+    args = parser.parse_args()
+
+    # Lots of different sizes, so batches mix spot counts
+    lots = [SyntheticLot(args.width, args.height, args.spots + 10 * i, seed=i, turnover=0.02)
+            for i in range(args.lots)]
+    frames = [list(lot.frames(args.frames)) for lot in lots]
+
+    train = SyntheticLot(args.width, args.height, args.spots, seed=100, turnover=0.05)
+    features, labels = [], []
+    for frame in train.frames(30):
+        features.append(patch_features(sample_patches(frame, SpotLayout(train.positions, train.frame_size).corners)))
+        labels.append(train.occupied.copy())
+    classifiers = [EdgeClassifier(), train_linear(np.vstack(features), np.concatenate(labels))]
+
+    min_dwell = ParkingMonitor().MIN_DWELL
+    total = args.lots * args.frames
+    print(f"{args.lots} lots of {args.spots}+ spots at {args.width}x{args.height}, "
+          f"{args.frames} frames each, {args.batch} frames per lot and call")
+    print(f"{'classifier':>10} {'mode':>16} {'frames/s':>9}")
+    failed = False
+    for classifier in classifiers:
+        expected, elapsed = per_frame(classifier, lots, frames)
+        print(f"{classifier.name:>10} {'per frame':>16} {total / elapsed:>9.1f}")
+        print(f"{classifier.name:>10} {'update(), gated':>16} {total / gated(classifier, lots, frames):>9.1f}")
+        for threads in args.threads:
+            scores, occupied, elapsed = batched(classifier, lots, frames, args.batch, threads)
+            print(f"{classifier.name:>10} {f'batch, {threads} thr':>16} {total / elapsed:>9.1f}")
+            for key in range(args.lots):
+                if not np.allclose(scores[key], expected[key], rtol=1e-9, atol=1e-12):
+                    print(f"FAIL: {classifier.name} batch scores of lot {key} differ from per-frame scores")
+                    failed = True
+                if not np.array_equal(occupied[key], debounced(classifier, expected[key], min_dwell)):
+                    print(f"FAIL: {classifier.name} debounced batch occupancy of lot {key} differs")
+                    failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
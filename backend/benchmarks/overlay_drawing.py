@@ -0,0 +1,111 @@
+# overlay_drawing.py
+# Time the overlay of one frame both ways: a cv2.rectangle per spot plus
+# the status text on a fresh copy (how the overlay used to be drawn), and
+# the cached SpotOverlay / StatusBanner layers composited onto the copy.
+# Each frame a few spots change state (--turnover) and the free count
+# changes with them. Runs once without spot labels (the server's stream)
+# and once with a label per spot that changes every frame (the CLI
+# monitor's edge counts). Also checks that both give the same pixels (within
+# one grey level of rounding in the anti-aliased text). Exits 1 if the
+# cached overlay is slower at the largest spot count or differs.
+#
+# Run from the backend directory:
+#   python -m benchmarks.overlay_drawing [--width 1920 --height 1080 --spots 50,200,800]
+import argparse
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.spot_scoring import make_frame, make_positions
+from core.overlay import LABEL_COLOR, LABEL_OFFSET, SpotOverlay, StatusBanner
+
+LABEL_SCALE = 0.5
+
+
+def draw_legacy(frame, positions, occupied, free_count, labels=None):
+    out = frame.copy()
+    for (x, y, w, h), is_occupied in zip(positions, occupied):
+        color = (0, 0, 255) if is_occupied else (0, 255, 0)
+        cv2.rectangle(out, (x, y), (x + w, y + h), color, 2)
+    if labels is not None:
+        for (x, y, w, h), label in zip(positions, labels):
+            cv2.putText(out, label, (x + LABEL_OFFSET, y + h - LABEL_OFFSET), cv2.FONT_HERSHEY_SIMPLEX,
+                        LABEL_SCALE, LABEL_COLOR, 1)
+    cv2.putText(out, f"Free: {free_count}/{len(positions)}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                1, (0, 200, 0), 2, cv2.LINE_AA)
+    return out
+
+
+def draw_cached(frame, overlay, banner, occupied, free_count, out, labels=None):
+    overlay.update(occupied, labels)
+    np.copyto(out, frame)
+    overlay.draw(out)
+    banner.draw(out, f"Free: {free_count}/{len(overlay.positions)}")
+    return out
+
+
+def run(frame, positions, states, labels=None):
+    """(legacy ms, cached ms, max pixel difference) per frame over the state (and label) sequence"""
+    overlay, banner = SpotOverlay(positions, frame.shape[1::-1], label_scale=LABEL_SCALE), StatusBanner()
+    out = np.empty_like(frame)
+    labels = labels or [None] * len(states)
+    draw_cached(frame, overlay, banner, states[0], 0, out, labels[0])  # First render of the layer
+
+    started = time.perf_counter()
+    for occupied, frame_labels in zip(states, labels):
+        draw_legacy(frame, positions, occupied, int((~occupied).sum()), frame_labels)
+    legacy = (time.perf_counter() - started) / len(states) * 1e3
+
+    started = time.perf_counter()
+    for occupied, frame_labels in zip(states, labels):
+        draw_cached(frame, overlay, banner, occupied, int((~occupied).sum()), out, frame_labels)
+    cached = (time.perf_counter() - started) / len(states) * 1e3
+
+    difference = 0
+    step = max(1, len(states) // 10)
+    for occupied, frame_labels in zip(states[::step], labels[::step]):
+        free = int((~occupied).sum())
+        expected = draw_legacy(frame, positions, occupied, free, frame_labels)
+        got = draw_cached(frame, overlay, banner, occupied, free, out, frame_labels)
+        difference = max(difference, int(np.abs(expected.astype(np.int16) - got).max()))
+    return legacy, cached, difference
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cached overlay layer versus drawing every spot per frame")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--spots', default='50,200,800', help="comma-separated spot counts")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--turnover', type=float, default=0.005, help="per-spot chance of a change each frame")
+    args = parser.parse_args()
+
+    frame = make_frame(args.width, args.height)
+    rng = np.random.default_rng(0)
+    print(f"{args.width}x{args.height}, {args.turnover:.1%} of spots change per frame")
+    print(f"{'spots':>6} {'labels':>7} {'legacy ms':>10} {'cached ms':>10} {'speedup':>8} {'max diff':>9}")
+    results = {False: [], True: []}
+    for count in (int(n) for n in args.spots.split(',')):
+        positions = make_positions(count, args.width, args.height)
+        occupied = rng.random(count) < 0.5
+        states, labels = [], []
+        for _ in range(args.frames):
+            occupied = occupied ^ (rng.random(count) < args.turnover)
+            states.append(occupied)
+            labels.append([str(n) for n in rng.integers(0, 2700, count)])  # Edge pixel counts
+        for labelled in (False, True):
+            legacy, cached, difference = run(frame, positions, states, labels if labelled else None)
+            results[labelled].append((legacy, cached, difference))
+            print(f"{count:>6} {'yes' if labelled else 'no':>7} {legacy:>10.3f} {cached:>10.3f} "
+                  f"{legacy / cached:>7.1f}x {difference:>9}")
+
+    slower = any(rows[-1][1] > rows[-1][0] for rows in results.values())
+    if slower or max(difference for rows in results.values() for _, _, difference in rows) > 1:
+        print("FAIL: the cached overlay is slower or draws different pixels")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
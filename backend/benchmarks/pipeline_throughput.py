@@ -0,0 +1,244 @@
+# pipeline_throughput.py
+# Run the real VideoProcessor decode -> analyze -> encode stages and
+# ParkingMonitor.process_frame headlessly on synthetic lots, across spot
+# counts and resolutions, and compare the results with stored baselines.
+#
+# Every case runs in a fresh process (so peak RSS is its own) on a clip
+# rendered beforehand by benchmarks.synthetic_lot; the stages are called one after the
+# other on the calling thread (not through run_processing, which paces
+# decoding to the clip's FPS), so per-stage timings don't depend on thread
+# scheduling. Analysis runs on every frame (no ANALYSIS_FPS gating) and
+# every rendition is encoded, as if the stream were watched.
+#
+# Run from the backend directory:
+#   python -m benchmarks.pipeline_throughput                     # report
+#   python -m benchmarks.pipeline_throughput --check             # exit 1 on regression
+#   python -m benchmarks.pipeline_throughput --update-baseline   # store this machine's numbers
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic_lot import write_clip
+from core.lot_registry import LotConfig
+from core.parking_monitor import ParkingMonitor
+from core.spot_state import SpotEventLog
+from core.stream_cache import RenditionCache, RENDITIONS
+from core.video_processor import VideoProcessor
+
+BASELINE_FILE = Path(__file__).parent / 'baselines.json'
+
+# Metrics compared against the baseline: (bigger is better, tolerance
+# multiplier); tail latency is noisy, so it gets a wider band
+METRICS = {
+    'decode_fps': (True, 1),
+    'analyze_fps': (True, 1),
+    'encode_fps': (True, 1),
+    'monitor_fps': (True, 1),
+    'p50_ms': (False, 1),
+    'p99_ms': (False, 2),
+    'peak_rss_mib': (False, 1),
+    'alloc_kib_per_frame': (False, 1),
+}
+
+
+class BenchPublisher:
+    """Publisher that keeps results in memory and encodes every rendition"""
+
+    def __init__(self):
+        self.cache = RenditionCache()
+        for name in RENDITIONS:
+            self.cache.subscribe(name)
+        self.counts = {}
+
+    def update_lot(self, lot_key, **counts):
+        self.counts.update(counts)
+
+    def is_streaming(self, lot_id):
+        return True
+
+    def event_log(self, lot_id):
+        return SpotEventLog()
+
+    def publish_frame(self, lot_id, seq, frame):
+        self.cache.publish(seq, frame)
+        self.cache.encode_active()
+
+
+def percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3) if len(samples) else None
+
+
+def fps(samples):
+    return round(len(samples) / sum(samples), 1) if len(samples) and sum(samples) > 0 else None
+
+
+def run_case(video, layout, warmup, alloc_frames, threads):
+    """Measure one clip; runs in its own process"""
+    cv2.setNumThreads(threads)
+    monitor = ParkingMonitor()
+    monitor.ANALYSIS_FPS = float('inf')  # Analyse every frame
+    processor = VideoProcessor(LotConfig('bench', Path(video), layout), monitor, BenchPublisher())
+    positions = processor.positions
+    monitor.original_frame_sizes[0] = processor.reference_size
+
+    timings = {'decode': [], 'analyze': [], 'encode': [], 'monitor': [], 'frame': []}
+    alloc = []
+    seq = 0
+    while True:
+        seq += 1
+        traced = warmup < seq <= warmup + alloc_frames
+        if traced:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+
+        t0 = time.perf_counter()
+        ret, frame = processor.cap.read()
+        if not ret:
+            break
+        t1 = time.perf_counter()
+        result = processor.analyze_frame((seq, frame, None))
+        t2 = time.perf_counter()
+        if result is not None:
+            processor.encode_frame(result)
+        t3 = time.perf_counter()
+
+        if traced:
+            # Peak Python/NumPy memory above what was live before the frame
+            alloc.append(tracemalloc.get_traced_memory()[1] - baseline)
+            tracemalloc.stop()
+            continue  # tracemalloc slows everything down; keep it out of the timings
+
+        monitor_frame = frame.copy()
+        t4 = time.perf_counter()
+        monitor.process_frame(monitor_frame, positions, 0)
+        t5 = time.perf_counter()
+
+        if seq > warmup + alloc_frames:
+            timings['decode'].append(t1 - t0)
+            timings['analyze'].append(t2 - t1)
+            timings['encode'].append(t3 - t2)
+            timings['monitor'].append(t5 - t4)
+            timings['frame'].append(t3 - t0)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    processor.cap.release()
+
+    width, height = processor.reference_size
+    return {
+        'spots': len(positions),
+        'resolution': f'{width}x{height}',
+        'frames': len(timings['frame']),
+        'decode_fps': fps(timings['decode']),
+        'analyze_fps': fps(timings['analyze']),
+        'encode_fps': fps(timings['encode']),
+        'monitor_fps': fps(timings['monitor']),
+        'p50_ms': percentile_ms(timings['frame'], 50),
+        'p99_ms': percentile_ms(timings['frame'], 99),
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'alloc_kib_per_frame': round(float(np.mean(alloc)) / 1024, 1) if alloc else None,
+    }
+
+
+def case_key(result):
+    return f"{result['spots']}@{result['resolution']}"
+
+
+def regressions(results, baseline, tolerance):
+    """Messages for every metric that is worse than the baseline by more than tolerance"""
+    problems = []
+    for result in results:
+        stored = baseline.get(case_key(result))
+        if stored is None:
+            continue
+        for metric, (higher_is_better, scale) in METRICS.items():
+            old, new = stored.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            allowed = tolerance * scale
+            if higher_is_better and new < old * (1 - allowed):
+                problems.append(f"{case_key(result)} {metric}: {new} < {old} (-{100 * (1 - new / old):.0f}%)")
+            elif not higher_is_better and new > old * (1 + allowed):
+                problems.append(f"{case_key(result)} {metric}: {new} > {old} (+{100 * (new / old - 1):.0f}%)")
+    return problems
+
+
+def parse_resolution(value):
+    width, _, height = value.partition('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless pipeline throughput benchmark on synthetic lots")
+    parser.add_argument('--spots', type=int, nargs='+', default=[50, 200])
+    parser.add_argument('--resolutions', type=parse_resolution, nargs='+',
+                        default=[(1280, 720), (1920, 1080)], help="WIDTHxHEIGHT")
+    parser.add_argument('--frames', type=int, default=150, help="measured frames per case")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--alloc-frames', type=int, default=10, help="frames traced for allocations")
+    parser.add_argument('--threads', type=int, default=1, help="OpenCV threads (fixed for stable numbers)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument('--check', action='store_true', help="exit 1 if any metric regressed past the baseline")
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for width, height in args.resolutions:
+        for spots in args.spots:
+            with tempfile.TemporaryDirectory(prefix='parking-bench-') as tmp:
+                video, layout, _ = write_clip(tmp, width, height, spots,
+                                              args.warmup + args.alloc_frames + args.frames, seed=args.seed)
+                # A fresh process per case so peak RSS and allocator state are its own
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                    results.append(pool.submit(run_case, video, layout, args.warmup,
+                                               args.alloc_frames, args.threads).result())
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':>16} {'decode':>8} {'analyze':>8} {'encode':>8} {'monitor':>8} "
+              f"{'p50 ms':>7} {'p99 ms':>7} {'rss MiB':>8} {'KiB/fr':>7}")
+        for r in results:
+            print(f"{case_key(r):>16} {r['decode_fps']:>8} {r['analyze_fps']:>8} {r['encode_fps']:>8} "
+                  f"{r['monitor_fps']:>8} {r['p50_ms']:>7} {r['p99_ms']:>7} {r['peak_rss_mib']:>8} "
+                  f"{r['alloc_kib_per_frame']:>7}")
+        print("(stage columns are frames per second)")
+
+    if args.update_baseline:
+        stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        stored['machine'] = {'platform': platform.platform(), 'processor': platform.processor(),
+                             'cpus': os.cpu_count(), 'opencv': cv2.__version__, 'threads': args.threads}
+        stored.setdefault('cases', {}).update({case_key(r): r for r in results})
+        args.baseline.write_text(json.dumps(stored, indent=2) + '\n')
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        if not args.baseline.exists():
+            sys.exit(f"No baseline at {args.baseline}; run with --update-baseline first")
+        problems = regressions(results, json.loads(args.baseline.read_text()).get('cases', {}),
+                               args.tolerance)
+        if problems:
+            print(f"Regressions past {args.tolerance:.0%}:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print(f"No regressions past {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
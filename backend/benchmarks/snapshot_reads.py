@@ -0,0 +1,118 @@
+# snapshot_reads.py
+# Hammer ParkingState with count updates (available + occupied == total
+# after every update, the total changing too) from writer threads while
+# reader threads serve /api/parking-data and /api/parking-details through
+# the Flask app's view functions, and check that no response ever shows a
+# torn pair. Also times a read with few and with many lots: the body is
+# serialized when a lot changes, so a read costs the same however many
+# lots and however much history there is. Exits 1 on a torn read.
+#
+# Run from the backend directory:
+#   python -m benchmarks.snapshot_reads [--seconds 3 --readers 4]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+def consistency(web, lot_keys, seconds, readers):
+    """(reads, torn reads, updates) while writers and readers run concurrently"""
+    stop = threading.Event()
+    counters = {'reads': 0, 'torn': 0, 'updates': 0}
+    lock = threading.Lock()
+
+    def write(key, seed):
+        rng = np.random.default_rng(seed)
+        updates = 0
+        while not stop.is_set():
+            total = int(rng.integers(10, 200))
+            occupied = int(rng.integers(0, total + 1))
+            web.update_lot(key, total=total, available=total - occupied, occupied=occupied)
+            updates += 1
+        with lock:
+            counters['updates'] += updates
+
+    def read():
+        reads = torn = 0
+        while not stop.is_set():
+            with web.app.test_request_context('/api/parking-data'):
+                lots = json.loads(web.get_parking_data().get_data())
+            for key in lot_keys[:2]:
+                with web.app.test_request_context(f'/api/parking-details?lot={key[3:]}'):
+                    lots[key + '-details'] = json.loads(web.get_parking_details().get_data())
+            for counts in lots.values():
+                reads += 1
+                torn += counts['available'] + counts['occupied'] != counts['total']
+        with lock:
+            counters['reads'] += reads
+            counters['torn'] += torn
+
+    threads = ([threading.Thread(target=write, args=(key, i)) for i, key in enumerate(lot_keys[:2])]
+               + [threading.Thread(target=read) for _ in range(readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counters['reads'], counters['torn'], counters['updates']
+
+
+def read_cost(web, repeat=2000):
+    """Microseconds per /api/parking-data and /api/parking-details call"""
+    timings = {}
+    for name, view, path in (('parking-data', web.get_parking_data, '/api/parking-data'),
+                             ('parking-details', web.get_parking_details, '/api/parking-details?lot=1')):
+        with web.app.test_request_context(path):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                view()
+            timings[name] = (time.perf_counter() - started) / repeat * 1e6
+    return timings
+
+
+def load_app(lots, tmp):
+    """Import app.py with a registry of `lots` lots and no video processing"""
+    config = os.path.join(tmp, f'lots-{lots}.json')
+    with open(config, 'w') as f:
+        json.dump({'lots': [{'id': str(i + 1), 'source': 'none.mp4', 'layout': 'none'} for i in range(lots)]}, f)
+    os.environ.update(LOTS_CONFIG=config, HISTORY_DB=os.path.join(tmp, 'history.db'))
+    sys.modules.pop('app', None)
+    import app
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Torn reads and read cost of the parking snapshots")
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--many', type=int, default=200, help="lot count for the second read-cost run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        web = load_app(2, tmp)
+        lot_keys = web.parking_state.lot_keys
+        reads, torn, updates = consistency(web, lot_keys, args.seconds, args.readers)
+        few = read_cost(web)
+        many_app = load_app(args.many, tmp)
+        for key in many_app.parking_state.lot_keys:
+            for available in range(50):  # Full history everywhere
+                many_app.update_lot(key, total=50, available=available, occupied=50 - available)
+        many = read_cost(many_app)
+
+    print(f"{updates} updates, {reads} counts read by {args.readers} readers, {torn} torn")
+    print(f"{'endpoint':>16} {'2 lots us':>10} {args.many:>4} lots us")
+    for name in few:
+        print(f"{name:>16} {few[name]:>10.1f} {many[name]:>12.1f}")
+    if torn:
+        print("FAIL: readers saw available + occupied != total")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# spot_analytics.py
+# Feed SpotAnalytics a synthetic stream of spot transitions and check that
+# throughput and memory stay flat as the event count grows, and that the
+# aggregates match a brute-force recount.
+#
+# Run from the backend directory:
+#   python -m benchmarks.spot_analytics [--events 2000000 --spots 500 --batch 8]
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from core.spot_analytics import DWELL_EDGES, SpotAnalytics
+
+
+def make_batches(events, spot_count, batch, seed=0):
+    """Batches of (spots, states, timestamp) like SpotStateTracker emits
+
+    Each batch flips `batch` distinct spots; timestamps advance by a few
+    seconds per batch, so a million events span weeks.
+    """
+    rng = np.random.default_rng(seed)
+    occupied = np.zeros(spot_count, dtype=bool)
+    timestamp = 1_700_000_000.0
+    for _ in range(events // batch):
+        spots = rng.choice(spot_count, batch, replace=False)
+        occupied[spots] = ~occupied[spots]
+        timestamp += float(rng.exponential(3.0)) + 0.5
+        yield spots, occupied[spots].copy(), timestamp
+
+
+def brute_force(spot_count, batches, start):
+    """Dwell histogram and arrivals recomputed from the full event list"""
+    occupied = np.zeros(spot_count, dtype=bool)
+    since = np.full(spot_count, start)
+    known = np.zeros(spot_count, dtype=bool)
+    dwell = []
+    arrivals = 0
+    for spots, states, timestamp in batches:
+        for spot, state in zip(spots, states):
+            if state and not occupied[spot]:
+                arrivals += 1
+            elif not state and occupied[spot] and known[spot]:
+                dwell.append(timestamp - since[spot])
+            occupied[spot] = state
+            since[spot] = timestamp
+            known[spot] = True
+    hist = np.bincount(np.searchsorted(DWELL_EDGES, dwell), minlength=len(DWELL_EDGES) + 1)
+    return hist, arrivals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming spot analytics")
+    parser.add_argument('--events', type=int, default=2_000_000)
+    parser.add_argument('--spots', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--checkpoints', type=int, default=5)
+    parser.add_argument('--verify', type=int, default=200_000,
+                        help="events to check against a brute-force recount (0 to skip)")
+    args = parser.parse_args()
+
+    if args.verify:
+        start = 1_700_000_000.0
+        batches = list(make_batches(args.verify, args.spots, args.batch, seed=1))
+        analytics = SpotAnalytics(utc_offset=0)
+        analytics.reset(np.zeros(args.spots, dtype=bool), start)
+        for spots, states, timestamp in batches:
+            analytics.append(spots, states, timestamp)
+        expected_hist, expected_arrivals = brute_force(args.spots, batches, start)
+        summary = analytics.lot_summary(batches[-1][2])
+        hist = [bin['count'] for bin in summary['dwell']['histogram']]
+        match = hist == expected_hist.tolist() and summary['turnover']['arrivals'] == expected_arrivals
+        print(f"Verified {args.verify} events against brute force: {'match' if match else 'MISMATCH'}")
+        if not match:
+            sys.exit(1)
+
+    analytics = SpotAnalytics(utc_offset=0)
+    analytics.reset(np.zeros(args.spots, dtype=bool), 1_700_000_000.0)
+    # tracemalloc slows every allocation down, so throughput here is pessimistic
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    step = args.events // args.checkpoints
+    print(f"{args.spots} spots, batches of {args.batch}")
+    print(f"{'events':>10} {'events/s':>10} {'us/event':>9} {'heap KB':>8}")
+
+    done = 0
+    next_checkpoint = step
+    elapsed, window_events = 0.0, 0
+    for spots, states, timestamp in make_batches(args.events, args.spots, args.batch):
+        # Only the append is timed, not generating the stream
+        start = time.perf_counter()
+        analytics.append(spots, states, timestamp)
+        elapsed += time.perf_counter() - start
+        done += len(spots)
+        window_events += len(spots)
+        if done >= next_checkpoint:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"{done:>10} {window_events / elapsed:>10.0f} {elapsed / window_events * 1e6:>9.2f} "
+                  f"{(current - baseline) / 1024:>8.1f}")
+            next_checkpoint += step
+            elapsed, window_events = 0.0, 0
+
+    start = time.perf_counter()
+    analytics.lot_summary()
+    print(f"lot_summary: {(time.perf_counter() - start) * 1000:.2f} ms, "
+          f"{analytics.events} transitions recorded")
+
+
+if __name__ == '__main__':
+    main()
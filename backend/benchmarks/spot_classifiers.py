@@ -0,0 +1,89 @@
+# spot_classifiers.py
+# Compare the spot classifiers (core/spot_classifier.py) on synthetic lots:
+# the linear model is trained on one lot and, like the edge classifier,
+# scores every spot of every frame of another lot (other seed, so other
+# cars and noise). Reports spots classified per second and precision and
+# recall of the occupied class against the ground truth; spots whose car
+# is driving in or out are left out of the counts. Decisions are raw
+# per-frame scores against the threshold, before any debouncing. Exits 1
+# if the linear classifier's precision or recall is below --min-quality.
+#
+# Run from the backend directory:
+#   python -m benchmarks.spot_classifiers [--spots 100 --width 1280 --height 720 --frames 300]
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_lot import ARRIVAL_FRAMES, SyntheticLot
+from core.spot_classifier import EdgeClassifier, patch_features, sample_patches, train_linear
+from core.spot_layout import SpotLayout
+from core.workspace import FrameWorkspace
+
+
+def render(args, seed, step=1):
+    """(layout, frames, truth, settled) of a synthetic lot, every step-th frame"""
+    lot = SyntheticLot(args.width, args.height, args.spots, seed, turnover=args.turnover)
+    layout = SpotLayout(lot.positions, lot.frame_size)
+    frames, truth, settled = [], [], []
+    for i, frame in enumerate(lot.frames(args.frames)):
+        if i % step:
+            continue
+        frames.append(frame)
+        truth.append(lot.occupied.copy())
+        settled.append((lot.progress == 0) | (lot.progress == ARRIVAL_FRAMES))
+    return layout, frames, np.array(truth), np.array(settled)
+
+
+def evaluate(classifier, layout, frames, truth, settled):
+    """(spots per second, precision, recall) over the frames"""
+    workspace = FrameWorkspace()
+    classifier.scores(layout, frames[0], workspace=workspace)  # Warm-up
+    decisions = []
+    started = time.perf_counter()
+    for frame in frames:
+        decisions.append(classifier.scores(layout, frame, workspace=workspace) > classifier.threshold)
+    elapsed = time.perf_counter() - started
+    decisions = np.array(decisions)
+    true_pos = (decisions & truth & settled).sum()
+    precision = true_pos / max(1, (decisions & settled).sum())
+    recall = true_pos / max(1, (truth & settled).sum())
+    return len(frames) * len(layout) / elapsed, precision, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and accuracy of the spot classifiers")
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--turnover', type=float, default=0.02)
+    parser.add_argument('--min-quality', type=float, default=0.95,
+                        help="lowest acceptable precision and recall of the linear classifier")
+    args = parser.parse_args()
+
+    # Train on every fifth frame of one lot
+    layout, frames, truth, settled = render(args, seed=0, step=5)
+    features = np.vstack([patch_features(sample_patches(frame, layout.corners))[mask]
+                          for frame, mask in zip(frames, settled)])
+    labels = np.concatenate([occupied[mask] for occupied, mask in zip(truth, settled)])
+    started = time.perf_counter()
+    linear = train_linear(features, labels)
+    print(f"Trained the linear classifier on {len(labels)} spots in {time.perf_counter() - started:.2f} s")
+
+    test = render(args, seed=1)
+    results = {classifier.name: evaluate(classifier, *test) for classifier in (EdgeClassifier(), linear)}
+    print(f"{args.spots} spots at {args.width}x{args.height}, {args.frames} frames")
+    print(f"{'classifier':>10} {'spots/s':>9} {'precision':>9} {'recall':>7}")
+    for name, (speed, precision, recall) in results.items():
+        print(f"{name:>10} {speed:>9.0f} {precision:>9.3f} {recall:>7.3f}")
+
+    _, precision, recall = results['linear']
+    if min(precision, recall) < args.min_quality:
+        print(f"FAIL: linear classifier precision or recall below {args.min_quality}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# spot_scoring.py
+# Compare the legacy per-spot countNonZero loop with the compiled SpotLayout.
+#
+# Run from the backend directory:
+#   python -m benchmarks.spot_scoring [--width 1920 --height 1080 --repeat 20]
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from core.spot_layout import SpotLayout, preprocess
+
+OCCUPANCY_THRESHOLD = 0.2
+
+
+def make_frame(width, height, seed=0):
+    """Noisy asphalt-like frame with some car-sized blobs"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 100, size=(height, width, 3), dtype=np.uint8)
+    for _ in range(width * height // 20000):
+        x, y = int(rng.integers(0, width - 90)), int(rng.integers(0, height - 40))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + 80, y + 30), color, -1)
+        cv2.line(frame, (x, y), (x + 80, y + 30), (255, 255, 255), 1)
+    return frame
+
+
+def make_positions(count, width, height, seed=0):
+    """Spots packed row by row in the lower part of the frame, like a real lot"""
+    rng = np.random.default_rng(seed)
+    spot_w, spot_h = 90, 30
+    lot_top = height // 3
+    cols = max(1, (width - 20) // (spot_w + 6))
+    rows = max(1, (height - lot_top - 20) // (spot_h + 4))
+    positions = []
+    for i in range(count):
+        row, col = (i // cols) % rows, i % cols
+        jitter = rng.integers(-2, 3, 2)
+        positions.append((10 + col * (spot_w + 6) + int(jitter[0]),
+                          lot_top + row * (spot_h + 4) + int(jitter[1]),
+                          spot_w, spot_h))
+    return positions
+
+
+def legacy_score(frame, positions):
+    """The original full-frame filter chain plus Python loop"""
+    processed = preprocess(frame)
+    occupied = []
+    for x, y, w, h in positions:
+        nonzero = cv2.countNonZero(processed[y:y+h, x:x+w])
+        occupied.append(nonzero > w * h * OCCUPANCY_THRESHOLD)
+    return np.array(occupied, dtype=bool)
+
+
+def time_call(fn, repeat):
+    fn()  # Warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs compiled spot scoring")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--spots', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    frame = make_frame(args.width, args.height)
+    print(f"Frame {args.width}x{args.height}, {args.repeat} runs each")
+    print(f"{'spots':>6} {'legacy ms':>10} {'layout ms':>10} {'speedup':>8} {'roi %':>6}  match")
+
+    for count in args.spots:
+        positions = make_positions(count, args.width, args.height)
+        layout = SpotLayout(positions, (args.width, args.height))
+
+        legacy_s, expected = time_call(lambda: legacy_score(frame, positions), args.repeat)
+        layout_s, (occupied, _) = time_call(
+            lambda: layout.score(frame, OCCUPANCY_THRESHOLD), args.repeat)
+
+        rx0, ry0, rx1, ry1 = layout.roi
+        roi_pct = 100.0 * (rx1 - rx0) * (ry1 - ry0) / (args.width * args.height)
+        match = np.array_equal(expected, occupied)
+        print(f"{count:>6} {legacy_s * 1000:>10.2f} {layout_s * 1000:>10.2f} "
+              f"{legacy_s / layout_s:>7.1f}x {roi_pct:>5.0f}%  {'yes' if match else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
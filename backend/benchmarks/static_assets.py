@@ -0,0 +1,88 @@
+# static_assets.py
+# Serve a stand-in frontend build (index.html plus a large JS bundle and a
+# CSS file with Vite-style fingerprinted names) through serve_react, and
+# compare the time per request with send_from_directory from disk, the way
+# the route used to serve it. Also reports the precompressed sizes. Exits 1
+# if the in-memory route is slower than reading from disk.
+#
+# Run from the backend directory:
+#   python -m benchmarks.static_assets [--bundle-kib 600 --requests 2000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from flask import send_from_directory
+
+
+def write_build(root, bundle_kib, seed=0):
+    """index.html, assets/index-<hash>.js and assets/index-<hash>.css of roughly realistic text"""
+    rng = np.random.default_rng(seed)
+    words = ['const', 'function', 'return', 'useState', 'props', 'className', 'div', 'span', 'lot',
+             'available', 'occupied', 'fetch', 'then', 'await', 'async', 'null', 'true', '=>', '{', '}']
+    assets = Path(root) / 'assets'
+    assets.mkdir(parents=True)
+    script = ' '.join(rng.choice(words, bundle_kib * 160))
+    (assets / 'index-4f9a1c2e.js').write_text(script[:bundle_kib * 1024])
+    (assets / 'index-8b3d0e7f.css').write_text('.card{display:flex;padding:8px}\n' * 800)
+    (Path(root) / 'index.html').write_text(
+        '<!doctype html><html><head><script type="module" src="/assets/index-4f9a1c2e.js"></script>'
+        '<link rel="stylesheet" href="/assets/index-8b3d0e7f.css"></head><body><div id="root"></div></body></html>')
+
+
+def per_request_us(client, paths, requests, headers):
+    started = time.perf_counter()
+    for i in range(requests):
+        response = client.get(paths[i % len(paths)], headers=headers)
+        response.get_data()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory static assets versus disk")
+    parser.add_argument('--bundle-kib', type=int, default=600)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(LOTS_CONFIG=os.path.join(tmp, 'lots.json'), HISTORY_DB=os.path.join(tmp, 'history.db'))
+        Path(tmp, 'lots.json').write_text('{"lots": []}')
+        build = Path(tmp) / 'static'
+        write_build(build, args.bundle_kib)
+
+        import app
+        from core.static_assets import StaticAssets
+        app.STATIC_DIR = str(build)
+        app.static_assets = StaticAssets(build)
+        started = time.perf_counter()
+        app.static_assets.load()
+        load_seconds = time.perf_counter() - started
+
+        # The route as it was: existence check and send_from_directory per request
+        app.app.add_url_rule('/disk/<path:path>', 'disk', lambda path: send_from_directory(str(build), path))
+
+        paths = ['/', '/assets/index-4f9a1c2e.js', '/assets/index-8b3d0e7f.css']
+        client = app.app.test_client()
+        encodings = {'Accept-Encoding': 'gzip, deflate, br'}
+        memory = per_request_us(client, paths, args.requests, encodings)
+        disk = per_request_us(client, ['/disk/index.html'] + [f'/disk{p}' for p in paths[1:]],
+                              args.requests, encodings)
+
+        print(f"Loaded {app.static_assets.stats()['files']} files in {load_seconds:.2f} s")
+        print(f"{'file':>28} {'bytes':>8} {'gzip':>8} {'br':>8}")
+        for path in ('index.html', 'assets/index-4f9a1c2e.js', 'assets/index-8b3d0e7f.css'):
+            variants = app.static_assets.get(path).variants
+            print(f"{path:>28} {len(variants['identity']):>8} {len(variants.get('gzip', b'')):>8} "
+                  f"{len(variants.get('br', b'')):>8}")
+        print(f"Per request: {memory:.1f} us from memory (compressed), {disk:.1f} us from disk (uncompressed)")
+
+    if memory > disk:
+        print("FAIL: serving from memory is slower than from disk")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
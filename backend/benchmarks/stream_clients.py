@@ -0,0 +1,178 @@
+# stream_clients.py
+# Hold many concurrent /api/video-stream clients against one server process
+# and measure what each client costs it. A synthetic lot is served by
+# either the ASGI app (uvicorn asgi:app) or the Flask development server
+# (threaded, as `python app.py` runs it); the clients are asyncio sockets
+# in this process that read the MJPEG stream and count frames. Server CPU,
+# RSS and thread count are read from /proc with one client and with
+# --clients clients. Exits 1 (ASGI only) if a client is refused, if
+# clients get less than --min-fps-ratio of the source frame rate, or if a
+# client adds more than --max-kib of RSS.
+#
+# Run from the backend directory (Linux):
+#   python -m benchmarks.stream_clients [--clients 500 --server flask]
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic_lot import write_clip
+
+BACKEND = Path(__file__).parent.parent
+TICKS = os.sysconf('SC_CLK_TCK')
+
+FLASK_SERVER = """
+import app
+app.setup_video_processing()
+app.app.run(host='127.0.0.1', port={port}, threaded=True)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_usage(pid):
+    """(CPU seconds, RSS KiB, threads) of a process, from /proc"""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / TICKS
+    status = dict(line.split(':', 1) for line in Path(f'/proc/{pid}/status').read_text().splitlines())
+    return cpu, int(status['VmRSS'].split()[0]), int(status['Threads'])
+
+
+class Client:
+    """One MJPEG stream reader counting the parts it receives"""
+
+    def __init__(self):
+        self.status = None
+        self.frames = 0
+        self.task = None
+
+    async def run(self, port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        await writer.drain()
+        headers = await reader.readuntil(b'\r\n\r\n')
+        self.status = int(headers.split()[1])
+        tail = b''
+        try:
+            while True:
+                chunk = await reader.read(1 << 16)
+                if not chunk:
+                    break
+                data = tail + chunk
+                self.frames += data.count(b'--frame\r\n')
+                tail = data[-10:]  # A boundary split across two reads
+        finally:
+            writer.close()
+
+
+async def measure(pid, clients, seconds):
+    """Server CPU share, RSS, threads and per-client FPS over `seconds`"""
+    cpu, _, _ = process_usage(pid)
+    frames = [client.frames for client in clients]
+    started = time.monotonic()
+    await asyncio.sleep(seconds)
+    elapsed = time.monotonic() - started
+    cpu_end, rss, threads = process_usage(pid)
+    fps = [(client.frames - before) / elapsed for client, before in zip(clients, frames)]
+    return {
+        'cpu': (cpu_end - cpu) / elapsed,
+        'rss_kib': rss,
+        'threads': threads,
+        'fps_mean': sum(fps) / len(fps),
+        'fps_min': min(fps),
+    }
+
+
+async def connect(clients, count, port, path):
+    for _ in range(count):
+        client = Client()
+        client.task = asyncio.ensure_future(client.run(port, path))
+        clients.append(client)
+    while any(client.status is None and not client.task.done() for client in clients):
+        await asyncio.sleep(0.1)
+
+
+async def run(args, port, pid):
+    path = f'/api/video-stream?lot=1&rendition={args.rendition}'
+    clients = []
+    await connect(clients, 1, port, path)
+    await asyncio.sleep(args.warmup)
+    one = await measure(pid, clients, args.seconds)
+
+    await connect(clients, args.clients - 1, port, path)
+    await asyncio.sleep(args.warmup)
+    many = await measure(pid, clients, args.seconds)
+    refused = sum(client.status != 200 for client in clients)
+    for client in clients:
+        client.task.cancel()
+    return one, many, refused
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server cost of concurrent video stream clients")
+    parser.add_argument('--server', choices=('asgi', 'flask'), default='asgi')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--rendition', default='thumb')
+    parser.add_argument('--fps', type=float, default=10.0, help="source frame rate")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--min-fps-ratio', type=float, default=0.8)
+    parser.add_argument('--max-kib', type=float, default=64.0, help="max server RSS per client")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video, layout, _ = write_clip(tmp, 640, 360, 24, int(args.fps * 10), args.fps)
+        config = Path(tmp) / 'lots.json'
+        config.write_text(json.dumps({'analysis_processes': 0, 'lots': [
+            {'id': '1', 'source': str(video), 'layout': str(layout)}]}))
+        env = dict(os.environ, LOTS_CONFIG=str(config), HISTORY_DB=str(Path(tmp) / 'history.db'),
+                   MAX_STREAM_VIEWERS=str(args.clients + 10), ANALYZER='embedded')
+        port = free_port()
+        if args.server == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port),
+                       '--log-level', 'warning', '--no-access-log', '--backlog', str(args.clients * 2)]
+        else:
+            command = [sys.executable, '-c', FLASK_SERVER.format(port=port)]
+        server = subprocess.Popen(command, cwd=BACKEND, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            one, many, refused = asyncio.run(run(args, port, server.pid))
+        finally:
+            server.terminate()
+            server.wait()
+
+    per_client_kib = (many['rss_kib'] - one['rss_kib']) / max(1, args.clients - 1)
+    per_client_cpu = (many['cpu'] - one['cpu']) / max(1, args.clients - 1)
+    print(f"{args.server} server, {args.rendition} rendition at {args.fps:g} FPS")
+    print(f"{'clients':>7} {'CPU %':>7} {'RSS MiB':>8} {'threads':>7} {'FPS mean':>9} {'FPS min':>8}")
+    for count, result in ((1, one), (args.clients, many)):
+        print(f"{count:>7} {100 * result['cpu']:>7.1f} {result['rss_kib'] / 1024:>8.1f} {result['threads']:>7} "
+              f"{result['fps_mean']:>9.1f} {result['fps_min']:>8.1f}")
+    print(f"Per extra client: {100 * per_client_cpu:.3f}% CPU, {per_client_kib:.1f} KiB RSS; {refused} refused")
+
+    if args.server == 'asgi' and (refused or many['fps_mean'] < args.min_fps_ratio * args.fps
+                                  or per_client_kib > args.max_kib):
+        print(f"FAIL: refused clients, mean FPS below {args.min_fps_ratio:.0%} of the source "
+              f"or more than {args.max_kib:.0f} KiB per client")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+# synthetic_lot.py
+# Deterministic synthetic parking-lot footage: a painted lot with N spots,
+# cars that drive in and out of them, slow lighting drift, flicker and
+# sensor noise. The same seed always gives the same frames, layout and
+# ground truth, so benchmarks don't need recorded clips.
+#
+# Write a clip and its layout, run from the backend directory:
+#   python -m benchmarks.synthetic_lot --out /tmp/lot [--spots 100 --width 1280 --height 720 --frames 300]
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from core.layout_file import save_layout
+
+ARRIVAL_FRAMES = 8  # Frames a car takes to drive into (or out of) its spot
+NOISE_FIELDS = 4  # Pre-rendered sensor noise fields, cycled through
+NOISE_OFFSET = 32  # Noise is stored biased by this much so it fits in uint8
+
+
+class SyntheticLot:
+    """Lot of `spots` spaces on a width x height frame
+
+    Spots are packed in double rows separated by aisles over the lower part
+    of the frame, sized so they all fit. Each frame every spot flips its
+    target state with probability `turnover`; cars then slide between the
+    aisle and the spot over ARRIVAL_FRAMES frames. `occupied` is the ground
+    truth of the last frame: spots whose car is fully parked.
+    """
+
+    def __init__(self, width=1280, height=720, spots=100, seed=0,
+                 occupancy=0.5, turnover=0.01, noise=4.0, flicker=3.0):
+        self.width, self.height = int(width), int(height)
+        self.seed = seed
+        self.turnover = turnover
+        self.flicker = flicker
+        self._rng = np.random.default_rng(seed)
+        self.positions = self._layout(int(spots))
+
+        count = len(self.positions)
+        self.target = self._rng.random(count) < occupancy
+        self.progress = np.where(self.target, ARRIVAL_FRAMES, 0)  # 0 = empty, ARRIVAL_FRAMES = parked
+        self.frame_index = 0
+
+        self._background = self._paint_background()
+        self._cars = [self._paint_car(w, h) for _, _, w, h in self.positions]
+        noise_rng = np.random.default_rng(seed + 1)
+        self._noise = [np.clip(noise_rng.normal(NOISE_OFFSET, noise, (self.height, self.width, 3)),
+                               0, 2 * NOISE_OFFSET).astype(np.uint8)
+                       for _ in range(NOISE_FIELDS)]
+
+    @property
+    def frame_size(self):
+        return self.width, self.height
+
+    @property
+    def occupied(self):
+        return self.progress == ARRIVAL_FRAMES
+
+    def _layout(self, count):
+        """Spot grid: pairs of facing rows with an aisle above each pair"""
+        top = self.height // 4
+        usable_w, usable_h = self.width - 20, self.height - top - 10
+        # Fewest columns (biggest spots, 2:1) whose rows and aisles still fit
+        for cols in range(1, count + 1):
+            rows = -(-count // cols)
+            spot_w = max(usable_w // cols, 8)
+            spot_h = spot_w // 2
+            if rows * spot_h + (rows // 2 + 1) * (spot_h // 2) <= usable_h:
+                break
+        aisle = spot_h // 2
+
+        positions = []
+        for i in range(count):
+            row, col = divmod(i, cols)
+            y = top + row * spot_h + (row // 2 + 1) * aisle
+            positions.append((10 + col * spot_w + 2, y + 2, spot_w - 4, spot_h - 4))
+        return positions
+
+    def _paint_background(self):
+        """Asphalt texture with white lines between the spots"""
+        rng = np.random.default_rng(self.seed + 2)
+        grain = rng.integers(70, 95, size=(self.height // 4 + 1, self.width // 4 + 1), dtype=np.uint8)
+        asphalt = cv2.resize(grain, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        frame = cv2.cvtColor(asphalt, cv2.COLOR_GRAY2BGR)
+        frame[: self.height // 4] = (90, 120, 100)  # Verge above the lot
+        for x, y, w, h in self.positions:
+            cv2.line(frame, (x - 2, y), (x - 2, y + h), (230, 230, 230), 2)
+            cv2.line(frame, (x + w + 1, y), (x + w + 1, y + h), (230, 230, 230), 2)
+        return frame
+
+    def _paint_car(self, w, h):
+        """Car sprite filling most of a w x h spot: body, windows and outline"""
+        color = tuple(int(c) for c in self._rng.integers(20, 235, 3))
+        car = np.zeros((h, w, 3), dtype=np.uint8)
+        mx, my = max(1, w // 10), max(1, h // 8)
+        cv2.rectangle(car, (mx, my), (w - mx - 1, h - my - 1), color, -1)
+        cv2.rectangle(car, (mx, my), (w - mx - 1, h - my - 1), (15, 15, 15), 1)
+        wx = w // 4
+        cv2.rectangle(car, (mx + wx, my + 2), (mx + 2 * wx, h - my - 3), (40, 40, 40), -1)
+        cv2.rectangle(car, (w - mx - wx, my + 2), (w - mx - 2, h - my - 3), (60, 60, 60), -1)
+        mask = np.zeros((h, w), dtype=bool)
+        mask[my:h - my, mx:w - mx] = True
+        return car, mask
+
+    def step(self):
+        """Advance one frame of traffic"""
+        flips = self._rng.random(len(self.positions)) < self.turnover
+        # A car only turns around once it has finished parking or leaving
+        settled = (self.progress == 0) | (self.progress == ARRIVAL_FRAMES)
+        self.target ^= flips & settled
+        self.progress = np.clip(self.progress + np.where(self.target, 1, -1), 0, ARRIVAL_FRAMES)
+        self.frame_index += 1
+
+    def render(self):
+        """BGR frame of the current traffic and lighting"""
+        frame = self._background.copy()
+        for (x, y, w, h), progress, (car, mask) in zip(self.positions, self.progress, self._cars):
+            if progress == 0:
+                continue
+            # Cars come from the aisle above the spot
+            y0 = y - (ARRIVAL_FRAMES - int(progress)) * h // ARRIVAL_FRAMES
+            top = max(0, -y0)
+            region = frame[y0 + top:y0 + h, x:x + w]
+            sprite_mask = mask[top:top + region.shape[0]]
+            region[sprite_mask] = car[top:top + region.shape[0]][sprite_mask]
+
+        # Slow daylight drift, per-frame flicker and sensor noise
+        i = self.frame_index
+        gain = 1.0 + 0.08 * np.sin(i / 150.0)
+        offset = self.flicker * np.sin(i * 1.7)
+        lit = cv2.convertScaleAbs(frame, alpha=gain, beta=offset - NOISE_OFFSET)
+        return cv2.add(lit, self._noise[i % NOISE_FIELDS])
+
+    def frames(self, count):
+        """Yield count frames, advancing the traffic before each"""
+        for _ in range(count):
+            self.step()
+            yield self.render()
+
+
+def write_clip(directory, width=1280, height=720, spots=100, frames=300, fps=30, seed=0, **options):
+    """Render a lot to directory/lot.mp4 plus directory/layout; returns (video, layout, truth)
+
+    truth is the ground-truth occupancy after every frame, as a
+    (frames, spots) bool array.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    lot = SyntheticLot(width, height, spots, seed, **options)
+    video, layout = directory / 'lot.mp4', directory / 'layout'
+    save_layout(layout, lot.positions, lot.frame_size)
+
+    writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*'mp4v'), fps, lot.frame_size)
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {video}")
+    truth = np.zeros((frames, len(lot.positions)), dtype=bool)
+    try:
+        for i, frame in enumerate(lot.frames(frames)):
+            writer.write(frame)
+            truth[i] = lot.occupied
+    finally:
+        writer.release()
+    return video, layout, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic parking-lot clip and its layout")
+    parser.add_argument('--out', required=True, help="output directory")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--spots', type=int, default=100)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--turnover', type=float, default=0.01, help="per-spot chance of a car arriving/leaving each frame")
+    args = parser.parse_args()
+
+    video, layout, truth = write_clip(args.out, args.width, args.height, args.spots, args.frames,
+                                      args.fps, args.seed, turnover=args.turnover)
+    np.save(Path(args.out) / 'truth.npy', truth)
+    print(f"Wrote {video} ({args.frames} frames at {args.width}x{args.height}), "
+          f"{layout} ({truth.shape[1]} spots) and truth.npy")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+from core.stream_cache import RENDITIONS, encode_renditions
+
+# How often workers report pipeline stats, in seconds
+STATS_INTERVAL = 2.0
+
+
+class ForwardingEventLog:
+    """Stand-in for SpotEventLog that hands reset/append to a publisher
+
+    Lets a VideoProcessor's SpotStateTracker write to an event log that lives
+    somewhere else (another process, shared memory).
+    """
+
+    def __init__(self, publisher, lot_id):
+        self.publisher = publisher
+        self.lot_id = lot_id
+
+    def reset(self, occupied, timestamp):
+        self.publisher.reset_spots(self.lot_id, occupied, timestamp)
+
+    def append(self, spots, states, timestamp):
+        self.publisher.append_spots(self.lot_id, spots, states, timestamp)
+
+
+class RemotePublisher:
+    """VideoProcessor publisher used inside an analysis worker process
+
+    Counts and spot events are sent to the API process over the results
+    queue; frames are JPEG-encoded here, only for the renditions that have
+    viewers, and dropped if the queue is full.
+    """
+
+    def __init__(self, results, subscriber_counts, lot_index):
+        self.results = results
+        self.viewer_counts = subscriber_counts  # Shared array, one slot per lot and rendition
+        self.lot_index = lot_index  # {lot_id: row in viewer_counts}
+        self.frames_dropped = 0
+
+    def send(self, method, *args, **kwargs):
+        self.results.put((method, args, kwargs))
+
+    def subscriber_counts(self, lot_id):
+        row = self.lot_index[lot_id] * len(RENDITIONS)
+        return {name: self.viewer_counts[row + i] for i, name in enumerate(RENDITIONS)}
+
+    def update_lot(self, lot_key, **counts):
+        self.send('update_lot', lot_key, **counts)
+
+    def is_streaming(self, lot_id):
+        return any(self.subscriber_counts(lot_id).values())
+
+    def event_log(self, lot_id):
+        return ForwardingEventLog(self, lot_id)
+
+    def reset_spots(self, lot_id, occupied, timestamp):
+        self.send('reset_spots', lot_id, occupied, timestamp)
+
+    def append_spots(self, lot_id, spots, states, timestamp):
+        self.send('append_spots', lot_id, spots, states, timestamp)
+
+    def publish_frame(self, lot_id, seq, frame):
+        self.publish_encoded(lot_id, seq, encode_renditions(frame, self.subscriber_counts(lot_id)))
+
+    def publish_encoded(self, lot_id, seq, encoded):
+        if not encoded:
+            return
+        try:
+            self.results.put_nowait(('publish_encoded', (lot_id, seq, encoded), {}))
+        except queue.Full:
+            # API process is behind - a newer frame will follow
+            self.frames_dropped += 1
+
+
+def _analysis_worker(lots, results, subscriber_counts, lot_index, stop):
+    """Entry point of an analysis process: run the VideoProcessors of one shard"""
+    # Imported here so the API process doesn't need them to start the pool
+    from core.parking_monitor import ParkingMonitor
+    from core.video_processor import VideoProcessor
+
+    monitor = ParkingMonitor()
+    publisher = RemotePublisher(results, subscriber_counts, lot_index)
+    processors = [VideoProcessor(lot, monitor, publisher) for lot in lots]
+    for processor in processors:
+        threading.Thread(target=processor.run_processing, daemon=True).start()
+
+    # Poll rather than stop.wait(): a worker killed while waiting on the event
+    # (e.g. Ctrl-C / SIGTERM to the whole process group) would leave set()
+    # blocked forever in the parent
+    parent = multiprocessing.parent_process()
+    while not stop.is_set():
+        time.sleep(STATS_INTERVAL)
+        if parent is not None and not parent.is_alive():
+            # Parent was killed without stopping us
+            break
+        for processor in processors:
+            stats = processor.pipeline_stats()
+            stats['frames_dropped_to_api'] = publisher.frames_dropped
+            publisher.send('set_pipeline_stats', processor.lot_key, stats)
+
+
+class AnalysisPool:
+    """Lots sharded round-robin across analysis worker processes
+
+    Each process runs the full decode/analyse/encode pipeline for its lots,
+    so per-spot Python work no longer contends on the web process's GIL. A
+    collector thread applies the results to `api` (the same publisher
+    interface the in-process VideoProcessors use) and mirrors the stream
+    subscriber counts back into shared memory for the workers.
+    """
+
+    # Methods of the API publisher that workers may call
+    FORWARDED = {'update_lot', 'publish_encoded', 'reset_spots', 'append_spots', 'set_pipeline_stats'}
+
+    def __init__(self, lots, processes, api, queue_size=256):
+        self.lots = list(lots)
+        self.processes = max(1, min(processes, len(self.lots)))
+        self.api = api
+        self._ctx = multiprocessing.get_context('spawn')
+        self.results = self._ctx.Queue(maxsize=queue_size)
+        self.subscriber_counts = self._ctx.Array('i', len(self.lots) * len(RENDITIONS), lock=False)
+        self.lot_index = {lot.id: i for i, lot in enumerate(self.lots)}
+        self._stop = self._ctx.Event()
+        self._shards = [self.lots[i::self.processes] for i in range(self.processes)]
+        self._workers = [None] * self.processes
+        self.restarts = 0
+
+    def _spawn(self, shard_idx):
+        worker = self._ctx.Process(
+            target=_analysis_worker,
+            args=(self._shards[shard_idx], self.results, self.subscriber_counts,
+                  self.lot_index, self._stop),
+            name=f'analysis-{shard_idx}',
+            daemon=True)
+        worker.start()
+        self._workers[shard_idx] = worker
+
+    def start(self):
+        for shard_idx in range(self.processes):
+            self._spawn(shard_idx)
+        threading.Thread(target=self._collect, name='analysis-collector', daemon=True).start()
+        print(f"Started {self.processes} analysis processes for {len(self.lots)} lots")
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._workers:
+            if worker is not None:
+                worker.join(timeout=2)
+
+    def _sync_subscribers(self):
+        for lot_id, row in self.lot_index.items():
+            counts = self.api.subscriber_counts(lot_id)
+            for i, name in enumerate(RENDITIONS):
+                self.subscriber_counts[row * len(RENDITIONS) + i] = counts.get(name, 0)
+
+    def _check_workers(self):
+        for shard_idx, worker in enumerate(self._workers):
+            if not self._stop.is_set() and not worker.is_alive():
+                print(f"Analysis process {shard_idx} exited ({worker.exitcode}), restarting")
+                self.restarts += 1
+                self._spawn(shard_idx)
+
+    def _collect(self):
+        last_check = last_sync = time.time()
+        while not self._stop.is_set():
+            if time.time() - last_sync > 0.1:
+                self._sync_subscribers()
+                last_sync = time.time()
+            try:
+                method, args, kwargs = self.results.get(timeout=0.25)
+            except queue.Empty:
+                method = None
+            if method in self.FORWARDED:
+                try:
+                    getattr(self.api, method)(*args, **kwargs)
+                except Exception as e:
+                    print(f"Error applying {method} from analysis process: {e}")
+            if time.time() - last_check > STATS_INTERVAL:
+                self._check_workers()
+                last_check = time.time()
+
+    def stats(self):
+        try:
+            queue_depth = self.results.qsize()
+        except NotImplementedError:  # macOS
+            queue_depth = None
+        return {
+            'processes': self.processes,
+            'restarts': self.restarts,
+            'result_queue_depth': queue_depth,
+            'shards': [[lot.id for lot in shard] for shard in self._shards]
+        }
@@ -0,0 +1,241 @@
+"""Offline analysis of recorded footage
+
+The video is split into frame ranges that a process pool scores in
+parallel, as fast as the cores allow. Workers only produce each spot's
+classifier score per frame (the expensive part); the debounced occupancy is then
+derived in frame order by a single SpotStateTracker on video time, so the
+result is the same whatever the chunking and worker count.
+
+Every analysed frame scores every spot: motion gating would make a chunk's
+ratios depend on where the chunk starts.
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from core.spot_analytics import SpotAnalytics
+from core.spot_layout import SpotLayout, analysis_size, downscale
+from core.spot_state import SpotStateTracker
+from core.workspace import FrameWorkspace
+
+MIN_CHUNK = 300  # Frames; smaller chunks spend more time seeking than scoring
+MAX_CHUNK = 9000
+CHUNKS_PER_WORKER = 4  # Several chunks per worker even out uneven chunk costs
+
+
+class BatchSettings:
+    """What the workers need to score a clip, picklable for the process pool"""
+
+    def __init__(self, positions, reference_size, classifier, analysis_width=None, step=1):
+        self.positions = [tuple(int(v) for v in p) for p in positions]
+        self.reference_size = tuple(reference_size) if reference_size else None
+        self.classifier = classifier  # An EdgeClassifier or LinearClassifier
+        self.analysis_width = analysis_width
+        self.step = max(1, int(step))
+
+
+def open_at(video, start):
+    """VideoCapture positioned on frame start
+
+    Falls back to reading forward from the beginning if the container
+    doesn't seek exactly.
+    """
+    cap = cv2.VideoCapture(str(video))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {video}")
+    if start and (not cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+                  or int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start):
+        cap.release()
+        cap = cv2.VideoCapture(str(video))
+        for _ in range(start):
+            if not cap.grab():
+                break
+    return cap
+
+
+def analyze_chunk(video, settings, start, stop):
+    """Classifier scores of frames [start, stop) (stop=None: to the end of the file)
+
+    Returns (start, frame indices, ratios) with one float32 row per analysed
+    frame; only frames whose index is a multiple of settings.step are scored.
+    """
+    cv2.setNumThreads(1)  # The pool already uses every core
+    cap = open_at(video, start)
+    layout = None
+    workspace = FrameWorkspace()
+    indices, rows = [], []
+    index = start
+    try:
+        while stop is None or index < stop:
+            if index % settings.step:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            height, width = frame.shape[:2]
+            size = analysis_size(width, height, settings.analysis_width)
+            if layout is None:
+                layout = SpotLayout(settings.positions, size, settings.reference_size or (width, height))
+            scores = settings.classifier.scores(layout, downscale(frame, size, workspace), workspace=workspace)
+            rows.append(scores.astype(np.float32))
+            indices.append(index)
+            index += 1
+    finally:
+        cap.release()
+    ratios = np.array(rows, dtype=np.float32).reshape(-1, len(settings.positions))
+    return start, np.array(indices, dtype=np.int64), ratios
+
+
+def _analyze_chunk(args):
+    return analyze_chunk(*args)
+
+
+def plan_chunks(frame_count, workers):
+    """[start, stop) ranges covering frame_count frames; the last one runs to EOF"""
+    if frame_count <= 0:
+        return [(0, None)]
+    size = min(MAX_CHUNK, max(MIN_CHUNK, -(-frame_count // (workers * CHUNKS_PER_WORKER))))
+    starts = list(range(0, frame_count, size))
+    return [(start, starts[i + 1] if i + 1 < len(starts) else None) for i, start in enumerate(starts)]
+
+
+class Timeline:
+    """Per-frame, per-spot debounced occupancy, built in frame order
+
+    Occupancy is kept packed (a bit per spot and frame). The per-frame free
+    counts and each spot's occupied frames and transitions are added up a
+    chunk at a time, so no frames x spots matrix is ever built.
+    """
+
+    def __init__(self, spot_count, tracker, keep_ratios=False):
+        self.spot_count = spot_count
+        self.tracker = tracker
+        self.keep_ratios = keep_ratios
+        self.frames, self.times, self.bits, self.free, self.ratios = [], [], [], [], []
+        self.occupied_frames = np.zeros(spot_count, dtype=np.int64)  # Per spot
+        self.transitions = np.zeros(spot_count, dtype=np.int64)  # Per spot
+        self._last = None  # Occupancy of the last frame so far
+
+    def extend(self, indices, ratios, fps, start_time):
+        """Run a chunk's ratios through the state tracker"""
+        bits = np.empty((len(indices), (self.spot_count + 7) // 8), dtype=np.uint8)
+        times = start_time + indices / fps
+        for row, (ratio, timestamp) in enumerate(zip(ratios, times)):
+            self.tracker.update(ratio, timestamp)
+            bits[row] = self.tracker.bits
+        self.frames.append(indices)
+        self.times.append(indices / fps)
+        self.bits.append(bits)
+        if self.keep_ratios:
+            self.ratios.append(ratios.astype(np.float16))
+
+        if len(indices):
+            occupied = np.unpackbits(bits, axis=1, count=self.spot_count)  # This chunk only
+            self.free.append((self.spot_count - occupied.sum(axis=1)).astype(np.uint16))
+            self.occupied_frames += occupied.sum(axis=0, dtype=np.int64)
+            self.transitions += (np.diff(occupied, axis=0) != 0).sum(axis=0)
+            if self._last is not None:
+                self.transitions += occupied[0] != self._last
+            self._last = occupied[-1].copy()
+
+    def columns(self):
+        """Arrays written to the timeline file"""
+        frames = np.concatenate(self.frames) if self.frames else np.zeros(0, dtype=np.int64)
+        columns = {
+            'frame': frames.astype(np.int32),
+            'time': np.concatenate(self.times) if self.times else np.zeros(0),
+            # One packed row per frame; np.unpackbits(bits, axis=1, count=spots)
+            'occupied': (np.concatenate(self.bits) if self.bits
+                         else np.zeros((0, (self.spot_count + 7) // 8), dtype=np.uint8)),
+            'free': np.concatenate(self.free) if self.free else np.zeros(0, dtype=np.uint16),
+            'spots': np.int32(self.spot_count),
+        }
+        if self.keep_ratios:
+            columns['ratio'] = (np.concatenate(self.ratios) if self.ratios
+                                else np.zeros((0, self.spot_count), dtype=np.float16))
+        return columns
+
+
+def run_batch(video, settings, monitor, out, workers=None, start_time=0.0, keep_ratios=False):
+    """Analyse a whole video file and write out (.npz timeline) plus out.json (summary)
+
+    monitor supplies the dwell setting (a ParkingMonitor); the threshold and
+    hysteresis are the classifier's.
+    Returns the summary dict.
+    """
+    video, out = Path(video), Path(out)
+    cap = cv2.VideoCapture(str(video))
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {video}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    workers = workers or os.cpu_count() or 1
+    chunks = plan_chunks(frame_count, workers)
+    spot_count = len(settings.positions)
+    threshold, hysteresis = settings.classifier.threshold, settings.classifier.hysteresis
+    analytics = SpotAnalytics()
+    tracker = SpotStateTracker(spot_count, threshold + hysteresis, threshold - hysteresis,
+                               monitor.MIN_DWELL, analytics)
+    timeline = Timeline(spot_count, tracker, keep_ratios)
+
+    started = time.perf_counter()
+    jobs = [(video, settings, start, stop) for start, stop in chunks]
+    if workers == 1:
+        results = map(_analyze_chunk, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        results = pool.map(_analyze_chunk, jobs)
+    try:
+        # map() yields in submission order, so chunks are merged in frame order
+        for _, indices, ratios in results:
+            timeline.extend(indices, ratios, fps, start_time)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - started
+
+    columns = timeline.columns()
+    out.parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(out, **columns)
+
+    analysed = len(columns['frame'])
+    duration = (columns['frame'][-1] + 1) / fps if analysed else 0.0
+    summary = {
+        'video': str(video),
+        'fps': fps,
+        'frames_analysed': analysed,
+        'step': settings.step,
+        'classifier': settings.classifier.name,
+        'video_seconds': round(duration, 3),
+        'start_time': start_time,
+        'spots': spot_count,
+        'workers': workers,
+        'chunks': len(chunks),
+        'wall_seconds': round(elapsed, 3),
+        'frames_per_second': round(analysed / elapsed, 1) if elapsed else None,
+        'speed_vs_realtime': round(duration / elapsed, 2) if elapsed else None,
+        'free': {
+            'mean': round(float(columns['free'].mean()), 2) if analysed else None,
+            'min': int(columns['free'].min()) if analysed else None,
+            'max': int(columns['free'].max()) if analysed else None,
+        },
+        'spot_occupied_fraction': ([round(float(v), 4) for v in timeline.occupied_frames / analysed]
+                                   if analysed else []),
+        'spot_transitions': [int(v) for v in timeline.transitions],
+        'analytics': analytics.lot_summary(now=start_time + duration),
+    }
+    summary_path = out.with_suffix('.json')
+    summary_path.write_text(json.dumps(summary, indent=2) + '\n')
+    return summary
@@ -0,0 +1,168 @@
+import itertools
+import threading
+import time
+
+PENDING = object()  # next_frame(encode=False): the newest frame has yet to be encoded
+
+
+class StreamViewer:
+    """One connected stream client"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, rendition):
+        self.id = next(self._ids)
+        self.rendition = rendition
+        self.connected_at = time.time()
+        self.last_seq = 0
+        self.delivered = 0
+        self.skipped = 0
+
+
+class FrameHub:
+    """Per-lot broadcast of encoded frames to stream viewers
+
+    The producer calls publish() once per new frame; viewers block in
+    wait_next() until the sequence number moves past the last frame they
+    got. A viewer that is slow to send just wakes up to the newest frame
+    (the ones in between count as skipped), so it never holds up the
+    producer or the other viewers. Viewers that can't block a thread (asyncio
+    streams) register a listener to be told about publishes and then call
+    next_frame(). Still-frame requests hold() a rendition instead, which
+    keeps it encoded for a while without taking a viewer slot.
+    """
+
+    def __init__(self, cache, max_viewers=None):
+        self.cache = cache
+        self.max_viewers = max_viewers
+        self.seq = 0
+        self.viewers = {}
+        self.rejected = 0
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._holds = {}  # {rendition: monotonic time the still-frame hold lapses}
+
+    def subscribe(self, rendition):
+        """Register a viewer, or return None when the viewer cap is reached"""
+        with self._cond:
+            if self.max_viewers is not None and len(self.viewers) >= self.max_viewers:
+                self.rejected += 1
+                return None
+            viewer = StreamViewer(rendition)
+            self.viewers[viewer.id] = viewer
+        self.cache.subscribe(rendition)
+        return viewer
+
+    def unsubscribe(self, viewer):
+        with self._cond:
+            if self.viewers.pop(viewer.id, None) is None:
+                return
+        self.cache.unsubscribe(viewer.rendition)
+
+    def hold(self, rendition, seconds):
+        """Keep rendition subscribed for `seconds` more, as a still-frame fetch does
+
+        The hold counts as one subscriber however often it is renewed and
+        lapses once no fetch has renewed it for `seconds`. Returns True if
+        the hold was just taken, i.e. the newest frame may be stale.
+        """
+        with self._cond:
+            held = rendition in self._holds
+            self._holds[rendition] = time.monotonic() + seconds
+        if held:
+            return False
+        self.cache.subscribe(rendition)
+        self._arm(rendition, seconds)
+        return True
+
+    def _arm(self, rendition, delay):
+        timer = threading.Timer(delay, self._expire, (rendition,))
+        timer.daemon = True
+        timer.start()
+
+    def _expire(self, rendition):
+        with self._cond:
+            remaining = self._holds[rendition] - time.monotonic()
+            if remaining <= 0:
+                del self._holds[rendition]
+        if remaining > 0:
+            self._arm(rendition, remaining)  # Renewed meanwhile
+        else:
+            self.cache.unsubscribe(rendition)
+
+    def wait_publish(self, timeout):
+        """Block until the next publish (or timeout); returns whether one happened"""
+        with self._cond:
+            seq = self.seq
+            return self._cond.wait_for(lambda: self.seq != seq, timeout)
+
+    def add_listener(self, callback):
+        """Call callback(seq) on every publish, from the publishing thread"""
+        self._listeners.append(callback)
+
+    def publish(self, seq):
+        """Wake every viewer waiting for a frame newer than seq - 1"""
+        with self._cond:
+            self.seq = seq
+            self._cond.notify_all()
+        for callback in self._listeners:
+            callback(seq)
+
+    def wait_next(self, viewer, timeout=None):
+        """Block until a frame other than the viewer's last one is published
+
+        Returns the jpeg bytes of the newest frame, or None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq != viewer.last_seq, timeout):
+                return None
+            seq = self.seq
+        return self._deliver(viewer, seq)
+
+    def next_frame(self, viewer, encode=True):
+        """Like wait_next() without waiting: None unless a newer frame was published
+
+        With encode=False it never encodes or waits for an encode: if the
+        viewer's rendition of the newest frame isn't encoded yet it returns
+        PENDING and leaves the viewer where it was.
+        """
+        with self._cond:
+            seq = self.seq
+        if seq == viewer.last_seq:
+            return None
+        return self._deliver(viewer, seq, encode)
+
+    def _deliver(self, viewer, seq, encode=True):
+        entry = self.cache.get(viewer.rendition, encode)
+        if entry is None:
+            return PENDING
+        if viewer.last_seq:
+            viewer.skipped += max(0, seq - viewer.last_seq - 1)
+        # Even if this rendition isn't ready yet, wait for the next publish
+        viewer.last_seq = seq
+        data = entry[1]
+        if data is None:
+            return None
+        viewer.delivered += 1
+        return data
+
+    def stats(self):
+        with self._cond:
+            viewers = list(self.viewers.values())
+            held = sorted(self._holds)
+        now = time.time()
+        return {
+            'viewers': len(viewers),
+            'max_viewers': self.max_viewers,
+            'rejected': self.rejected,
+            'held': held,  # Renditions kept encoded for still-frame fetches
+            'seq': self.seq,
+            'clients': [{
+                'id': viewer.id,
+                'rendition': viewer.rendition,
+                'connected_seconds': round(now - viewer.connected_at, 1),
+                'lag': max(0, self.seq - viewer.last_seq),  # Frames behind the newest
+                'delivered': viewer.delivered,
+                'skipped': viewer.skipped
+            } for viewer in viewers]
+        }
@@ -0,0 +1,187 @@
+"""Spot layout files
+
+Layouts are stored as versioned JSON:
+
+    {
+      "format": "parkingvision-layout",
+      "version": 1,
+      "frame_size": [1920, 1080],
+      "spots": [[x, y, w, h], ...],
+      "hash": "sha256:..."
+    }
+
+frame_size is the resolution the spots were drawn on (null if unknown) and
+hash covers frame_size and spots, so a truncated or corrupted copy is
+rejected instead of silently changing the lot. Files from older versions
+(a pickled list of tuples) are still read, without unpickling anything but
+plain lists, tuples and numbers, and can be converted with:
+
+    python -m core.layout_file migrate assets/coordinate-video-1 ...
+"""
+import hashlib
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FORMAT = 'parkingvision-layout'
+VERSION = 1
+
+
+class StoredLayout:
+    """Spot positions read from a layout file"""
+
+    def __init__(self, positions, frame_size=None, content_hash=None, legacy=False):
+        self.positions = positions
+        self.frame_size = frame_size
+        self.hash = content_hash or layout_hash(positions, frame_size)
+        self.legacy = legacy
+
+
+def _normalize(positions):
+    return [tuple(int(v) for v in spot) for spot in positions]
+
+
+def layout_hash(positions, frame_size=None):
+    """Content hash of a layout, independent of JSON formatting"""
+    canonical = json.dumps({'frame_size': list(frame_size) if frame_size else None,
+                            'spots': [list(spot) for spot in _normalize(positions)]},
+                           separators=(',', ':'), sort_keys=True)
+    return 'sha256:' + hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    """Unpickler that refuses to load anything that needs a global (class or function)"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from a layout file")
+
+
+def _parse(data):
+    if data.lstrip().startswith(b'{'):
+        document = json.loads(data)
+        if document.get('format') != FORMAT:
+            raise ValueError("Not a layout file")
+        if document.get('version', 0) > VERSION:
+            raise ValueError(f"Layout version {document['version']} is newer than supported ({VERSION})")
+        positions = _normalize(document['spots'])
+        frame_size = tuple(document['frame_size']) if document.get('frame_size') else None
+        content_hash = layout_hash(positions, frame_size)
+        if document.get('hash') and document['hash'] != content_hash:
+            raise ValueError("Layout hash mismatch (file corrupted, or edited by hand: remove \"hash\" to accept it)")
+        return StoredLayout(positions, frame_size, content_hash)
+
+    # Legacy format: pickled list of (x, y, w, h) tuples
+    return StoredLayout(_normalize(_PlainUnpickler(io.BytesIO(data)).load()), legacy=True)
+
+
+def _format(document):
+    """JSON with one spot per line, so layouts diff nicely"""
+    spots = ',\n'.join('    ' + json.dumps(spot) for spot in document['spots'])
+    header = {key: value for key, value in document.items() if key not in ('spots', 'hash')}
+    lines = [f'  "{key}": {json.dumps(value)},' for key, value in header.items()]
+    lines.append(f'  "spots": [\n{spots}\n  ],' if spots else '  "spots": [],')
+    lines.append(f'  "hash": {json.dumps(document["hash"])}')
+    return '{\n' + '\n'.join(lines) + '\n}\n'
+
+
+def load_layout(path):
+    """Read a layout file (JSON, or a legacy pickle)"""
+    with open(path, 'rb') as f:
+        return _parse(f.read())
+
+
+def save_layout(path, positions, frame_size=None):
+    """Write a layout atomically: readers see the old file or the new one, never a mix"""
+    path = Path(path)
+    positions = _normalize(positions)
+    document = {
+        'format': FORMAT,
+        'version': VERSION,
+        'frame_size': list(frame_size) if frame_size else None,
+        'spots': [list(spot) for spot in positions],
+        'hash': layout_hash(positions, frame_size)
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(_format(document))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return document['hash']
+
+
+class LayoutWatcher:
+    """Notices when a layout file changes on disk
+
+    poll() is cheap enough to call from a processing loop: it only stats the
+    file, at most once per `interval` seconds, and reads it when the mtime or
+    size moved. It returns the new StoredLayout when the content hash
+    differs from the last one seen, otherwise None. A file that fails to
+    parse keeps the current layout.
+    """
+
+    def __init__(self, path, current_hash=None, interval=1.0):
+        self.path = Path(path)
+        self.current_hash = current_hash
+        self.interval = interval
+        self.reloads = 0
+        self.errors = 0
+        self._last_check = time.monotonic()
+        self._stat = self._stat_key()
+
+    def _stat_key(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self._last_check < self.interval:
+            return None
+        self._last_check = now
+
+        stat = self._stat_key()
+        if stat is None or stat == self._stat:
+            return None
+        self._stat = stat
+        try:
+            stored = load_layout(self.path)
+        except Exception as e:
+            self.errors += 1
+            print(f"Ignoring unreadable layout {self.path}: {e}")
+            return None
+        if stored.hash == self.current_hash:
+            return None
+        self.current_hash = stored.hash
+        self.reloads += 1
+        return stored
+
+
+def migrate(paths):
+    """Rewrite legacy pickled layout files in the JSON format"""
+    for path in paths:
+        stored = load_layout(path)
+        if not stored.legacy:
+            print(f"{path}: already version {VERSION}")
+            continue
+        save_layout(path, stored.positions, stored.frame_size)
+        print(f"{path}: converted {len(stored.positions)} spots")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'migrate':
+        print("Usage: python -m core.layout_file migrate <layout file> ...")
+        sys.exit(2)
+    migrate(sys.argv[2:])
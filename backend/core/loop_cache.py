@@ -0,0 +1,261 @@
+"""Per-frame results of looped video files
+
+A lot whose source is a file plays it in a loop, so from the second pass
+on every frame has been seen before. LoopCache keeps, per frame index, the
+edge ratios the analysis produced and the JPEG renditions that were
+encoded; a cached frame then needs no decode, filter chain or encode.
+
+Entries are keyed by a fingerprint of the source file, the layout hash and
+the detector parameters, so any change starts a new cache. The cache stops
+filling once max_bytes are stored rather than evicting: for a loop, the
+first frames staying cached beats every frame missing.
+
+Two stores: in memory, or on disk (a data file read through mmap plus an
+index), which also survives restarts.
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from core.stream_cache import RENDITIONS
+
+SAMPLE_BYTES = 1 << 20  # Read from each end of the source for its fingerprint
+
+# Disk caches, one directory per lot and key (LOOP_CACHE_DIR overrides)
+DEFAULT_DIR = Path(__file__).parent.parent / 'data' / 'loop-cache'
+
+
+def source_fingerprint(path):
+    """Cheap identity of a video file: size, mtime and its first and last MiB"""
+    path = Path(path)
+    stat = path.stat()
+    digest = hashlib.sha256(f'{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if stat.st_size > SAMPLE_BYTES:
+            f.seek(max(SAMPLE_BYTES, stat.st_size - SAMPLE_BYTES))
+            digest.update(f.read(SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+def cache_key(source, layout_hash, params):
+    """Key of a lot's cache: anything that changes the stored results changes it"""
+    identity = {'source': source_fingerprint(source), 'layout': layout_hash,
+                'params': params, 'renditions': RENDITIONS}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+
+class CachedFrame:
+    """A frame served from the cache: ratios (or None if it wasn't analysed) and JPEGs"""
+
+    def __init__(self, key, index, ratios, encoded):
+        self.key = key  # Of the cache it came from
+        self.index = index
+        self.ratios = ratios
+        self.encoded = encoded
+
+
+class _MemoryStore:
+    def __init__(self, capacity, renditions):
+        self.seen = np.zeros(capacity, dtype=bool)
+        self.ratios = {}
+        self.encoded = {name: {} for name in renditions}
+        self.frame_count = None
+
+    def get_ratios(self, index):
+        return self.ratios.get(index)
+
+    def put_ratios(self, index, ratios):
+        self.ratios[index] = ratios.astype(np.float32)
+
+    def get_encoded(self, name, index):
+        return self.encoded[name].get(index)
+
+    def put_encoded(self, name, index, data):
+        self.encoded[name][index] = data
+
+    def flush(self):
+        pass
+
+
+class _DiskStore:
+    """Blobs appended to data.bin, located through an index memmap
+
+    Index row of a frame: seen flag, then (offset, length) of the ratios
+    and of each rendition, -1 while missing. Blobs are written before the
+    index entry that points at them, so a crash loses entries, not
+    consistency.
+    """
+
+    def __init__(self, directory, capacity, renditions):
+        directory.mkdir(parents=True, exist_ok=True)
+        self.directory = directory
+        self.renditions = list(renditions)
+        columns = 1 + 2 * (1 + len(self.renditions))
+        index_path = directory / 'index.npy'
+        if index_path.exists():
+            self.index = np.load(index_path, mmap_mode='r+')
+        else:
+            self.index = np.lib.format.open_memmap(index_path, mode='w+', dtype=np.int64,
+                                                   shape=(capacity, columns))
+            self.index[:] = -1
+            self.index[:, 0] = 0
+        self.seen = self.index[:, 0]
+        # Not opened for appending: writers reserve their offset under _lock
+        # and write there with os.pwrite, as the analysis and encoder threads
+        # both add blobs. A blob is on disk before its index entry
+        self._fd = os.open(directory / 'data.bin', os.O_RDWR | os.O_CREAT, 0o644)
+        self._end = os.fstat(self._fd).st_size
+        self._lock = threading.Lock()
+        self._map = None
+        meta = directory / 'meta.json'
+        self.frame_count = json.loads(meta.read_text()).get('frame_count') if meta.exists() else None
+
+    def _read(self, column, index):
+        offset, length = self.index[index, column], self.index[index, column + 1]
+        if offset < 0:
+            return None
+        end = offset + length
+        mapped = self._map
+        if mapped is None or len(mapped) < end:
+            # The file grew since it was mapped. The old map isn't closed, as
+            # another thread may be reading it; it goes when unreferenced
+            mapped = self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        return mapped[offset:end]
+
+    def _write(self, column, index, data):
+        with self._lock:
+            offset = self._end
+            self._end += len(data)
+        view = memoryview(data)
+        written = 0
+        while written < len(view):
+            written += os.pwrite(self._fd, view[written:], offset + written)
+        self.index[index, column + 1] = len(data)
+        self.index[index, column] = offset
+
+    def get_ratios(self, index):
+        data = self._read(1, index)
+        return None if data is None else np.frombuffer(data, dtype=np.float32)
+
+    def put_ratios(self, index, ratios):
+        self._write(1, index, ratios.astype(np.float32).tobytes())
+
+    def get_encoded(self, name, index):
+        return self._read(3 + 2 * self.renditions.index(name), index)
+
+    def put_encoded(self, name, index, data):
+        self._write(3 + 2 * self.renditions.index(name), index, data)
+
+    def flush(self):
+        self.index.flush()
+        (self.directory / 'meta.json').write_text(json.dumps({'frame_count': self.frame_count}))
+
+
+class LoopCache:
+    """Per-frame ratios and JPEG renditions of one lot's looped source file
+
+    Written by the analysis and encoder threads, read by the decoder; each
+    entry is complete before the flag or index entry that exposes it.
+    """
+
+    def __init__(self, key, capacity, max_bytes, directory=None):
+        self.key = key
+        self.capacity = int(capacity)
+        self.max_bytes = int(max_bytes)
+        self.renditions = list(RENDITIONS)
+        if directory is None:
+            self.store = _MemoryStore(self.capacity, self.renditions)
+            self.bytes = 0
+        else:
+            self.store = _DiskStore(Path(directory), self.capacity, self.renditions)
+            self.bytes = os.path.getsize(Path(directory) / 'data.bin')
+        self.hits = 0
+        self.misses = 0
+        self.full = self.bytes >= self.max_bytes
+        self._lock = threading.Lock()  # Byte accounting, shared by the analysis and encoder threads
+
+    @property
+    def frame_count(self):
+        """Frames in the source, once one pass has reached the end"""
+        return self.store.frame_count
+
+    def set_frame_count(self, count):
+        if self.store.frame_count is None and 0 < count <= self.capacity:
+            self.store.frame_count = count
+            self.store.flush()
+
+    def _fits(self, size):
+        with self._lock:
+            if self.bytes + size > self.max_bytes:
+                self.full = True
+                return False
+            self.bytes += size
+            return True
+
+    def lookup(self, index, wanted):
+        """CachedFrame for index if it and every wanted rendition are cached, else None"""
+        if index >= self.capacity or not self.store.seen[index]:
+            self.misses += 1
+            return None
+        encoded = {}
+        for name in wanted:
+            data = self.store.get_encoded(name, index)
+            if data is None:
+                self.misses += 1
+                return None
+            encoded[name] = data
+        self.hits += 1
+        return CachedFrame(self.key, index, self.store.get_ratios(index), encoded)
+
+    def store_analysis(self, index, ratios):
+        """Record that frame index was processed, with its ratios if it was analysed"""
+        if index is None or index >= self.capacity:
+            return
+        if ratios is not None and self.store.get_ratios(index) is None and self._fits(ratios.size * 4):
+            self.store.put_ratios(index, ratios)
+        self.store.seen[index] = True
+
+    def store_encoded(self, index, encoded):
+        if index is None or index >= self.capacity:
+            return
+        for name, data in encoded.items():
+            if self.store.get_encoded(name, index) is None and self._fits(len(data)):
+                self.store.put_encoded(name, index, data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'frames': int(self.store.seen.sum()),
+            'frame_count': self.frame_count,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'full': self.full,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None
+        }
+
+
+def open_loop_cache(lot, key, capacity, cache_dir=None):
+    """Memory or disk LoopCache for a lot, per lot.loop_cache and lot.loop_cache_mb
+
+    A disk cache lives in cache_dir/lot<id>-<key prefix>; directories of the
+    same lot with another key are stale and removed.
+    """
+    max_bytes = lot.loop_cache_mb * (1 << 20)
+    if lot.loop_cache == 'memory':
+        return LoopCache(key, capacity, max_bytes)
+    cache_dir = Path(cache_dir or os.environ.get('LOOP_CACHE_DIR', DEFAULT_DIR))
+    directory = cache_dir / f'lot{lot.id}-{key[:16]}'
+    if cache_dir.exists():
+        for stale in cache_dir.glob(f'lot{lot.id}-*'):
+            if stale != directory:
+                shutil.rmtree(stale, ignore_errors=True)
+    return LoopCache(key, capacity, max_bytes, directory)
@@ -0,0 +1,119 @@
+import json
+import os
+from pathlib import Path
+
+from core.spot_classifier import CLASSIFIERS
+
+# Default location of the lot registry, next to app.py
+DEFAULT_CONFIG = Path(__file__).parent.parent / "lots.json"
+
+LOOP_CACHE_MODES = (None, 'memory', 'disk')
+DEFAULT_LOOP_CACHE_MB = 256
+
+
+class LotConfig:
+    """One camera / parking lot from the registry"""
+
+    def __init__(self, lot_id, source, layout, name=None, analysis_width=None,
+                 loop_cache=None, loop_cache_mb=DEFAULT_LOOP_CACHE_MB, classifier=None,
+                 classifier_model=None):
+        self.id = str(lot_id)
+        self.source = source  # Video file path, or a camera URL / device index
+        self.layout = Path(layout)
+        self.name = name or f"Parking Lot {self.id}"
+        self.analysis_width = int(analysis_width) if analysis_width else None  # None = source width
+        if loop_cache not in LOOP_CACHE_MODES:
+            raise ValueError(f"loop_cache of lot {self.id} must be 'memory', 'disk' or null")
+        self.loop_cache = loop_cache  # Cache results of a looped file source (None = off)
+        self.loop_cache_mb = float(loop_cache_mb)
+        self.classifier = classifier or 'edge'  # How spots are scored, see core.spot_classifier
+        if self.classifier not in CLASSIFIERS:
+            raise ValueError(f"classifier of lot {self.id} must be one of {', '.join(CLASSIFIERS)}")
+        self.classifier_model = Path(classifier_model) if classifier_model else None
+        if self.classifier == 'linear' and self.classifier_model is None:
+            raise ValueError(f"Lot {self.id} uses the linear classifier but has no classifier_model")
+
+    @property
+    def key(self):
+        """Key used for the lot in parking_data and the JSON APIs"""
+        return f'lot{self.id}'
+
+    @property
+    def is_file(self):
+        return isinstance(self.source, Path)
+
+    def to_dict(self):
+        return {'id': self.id, 'key': self.key, 'name': self.name}
+
+
+class LotRegistry:
+    """Lots loaded from lots.json plus the analysis process settings"""
+
+    def __init__(self, lots, analysis_processes='auto'):
+        self.lots = lots
+        self.analysis_processes = analysis_processes
+
+    def __iter__(self):
+        return iter(self.lots)
+
+    def __len__(self):
+        return len(self.lots)
+
+    def get(self, lot_id):
+        return next((lot for lot in self.lots if lot.id == str(lot_id)), None)
+
+    def process_count(self):
+        """Number of analysis worker processes; 0 means analyse in-process"""
+        if self.analysis_processes == 'auto':
+            return min(len(self.lots), os.cpu_count() or 1)
+        return min(len(self.lots), max(0, int(self.analysis_processes)))
+
+
+def _resolve_source(source, base_dir):
+    """Files are relative to the config file; URLs and device indexes pass through"""
+    if isinstance(source, int) or '://' in str(source):
+        return source
+    path = Path(source)
+    return path if path.is_absolute() else base_dir / path
+
+
+def load_lot_registry(path=None, monitor=None):
+    """Load the lot registry
+
+    Reads LOTS_CONFIG (or lots.json next to app.py). Without a config file
+    the lots fall back to the ParkingMonitor's video and coordinate files.
+    """
+    path = Path(path or os.environ.get('LOTS_CONFIG', DEFAULT_CONFIG))
+    if not path.exists():
+        if monitor is None:
+            raise FileNotFoundError(f"Lot registry not found: {path}")
+        print(f"Lot registry not found at {path}, using built-in lots")
+        lots = [LotConfig(i + 1, video_path, pos_file)
+                for i, (video_path, pos_file) in enumerate(zip(monitor.video_paths, monitor.pos_files))]
+        return LotRegistry(lots)
+
+    with open(path) as f:
+        config = json.load(f)
+
+    base_dir = path.parent
+    lots = []
+    for entry in config.get('lots', []):
+        layout = Path(entry['layout'])
+        model = entry.get('classifier_model', config.get('classifier_model'))
+        if model and not Path(model).is_absolute():
+            model = base_dir / model
+        lots.append(LotConfig(entry['id'],
+                              _resolve_source(entry['source'], base_dir),
+                              layout if layout.is_absolute() else base_dir / layout,
+                              entry.get('name'),
+                              entry.get('analysis_width', config.get('analysis_width')),
+                              entry.get('loop_cache', config.get('loop_cache')),
+                              entry.get('loop_cache_mb', config.get('loop_cache_mb', DEFAULT_LOOP_CACHE_MB)),
+                              entry.get('classifier', config.get('classifier')),
+                              model))
+
+    ids = [lot.id for lot in lots]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate lot ids in {path}")
+
+    return LotRegistry(lots, config.get('analysis_processes', 'auto'))
@@ -0,0 +1,140 @@
+from bisect import bisect_left
+
+from core.stream_cache import RENDITIONS
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Timed sections of one lot's pipeline
+STAGES = (
+    'decode',      # cap.read()
+    'resize',      # Downscale to the analysis resolution
+    'motion',      # Per-spot change detection
+    'preprocess',  # Filter chain over the spot ROI
+    'score',       # Summed-area table and per-spot counts
+    'draw',        # Overlay for the stream
+    'publish',     # Handing the counts to the API / shared memory
+    'analyze',     # Whole analysis stage, including the above
+    'encode',      # Encoder stage: JPEG renditions and hand-off to viewers
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram
+
+    observe() is a bisect and two additions, so it can sit on the per-frame
+    hot path. Each histogram is only written by one thread (the stage it
+    times); readers take a snapshot with to_dict().
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    def to_dict(self):
+        counts = list(self.counts)
+        return {'counts': counts, 'sum': round(self.sum, 6), 'count': sum(counts)}
+
+
+class LotMetrics:
+    """Stage latency histograms of one lot"""
+
+    def __init__(self):
+        self.stages = {name: Histogram() for name in STAGES}
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def to_dict(self):
+        return {name: histogram.to_dict() for name, histogram in self.stages.items()}
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def _family(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def render_prometheus(pipeline_stats, stream_stats):
+    """Prometheus text exposition (format 0.0.4) of the pipeline and stream stats
+
+    pipeline_stats is {lot_key: VideoProcessor.pipeline_stats()} and
+    stream_stats is {lot_key: FrameHub.stats()}; lots whose stats come from
+    another process are rendered the same way.
+    """
+    lots = {key: stats for key, stats in pipeline_stats.items() if 'timings' in stats}
+    lines = []
+
+    _family(lines, 'parkingvision_stage_seconds', 'histogram', 'Time spent per frame in each pipeline stage')
+    for key, stats in lots.items():
+        for stage, histogram in stats['timings'].items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram['counts']):
+                cumulative += count
+                lines.append(f'parkingvision_stage_seconds_bucket{_labels(lot=key, stage=stage, le=bound)} {cumulative}')
+            lines.append(f'parkingvision_stage_seconds_sum{_labels(lot=key, stage=stage)} {histogram["sum"]}')
+            lines.append(f'parkingvision_stage_seconds_count{_labels(lot=key, stage=stage)} {histogram["count"]}')
+
+    _family(lines, 'parkingvision_frames_decoded_total', 'counter', 'Frames read from the video source')
+    for key, stats in lots.items():
+        lines.append(f'parkingvision_frames_decoded_total{_labels(lot=key)} {stats["decode"]["frames"]}')
+
+    _family(lines, 'parkingvision_decode_restarts_total', 'counter', 'Video loops and camera reconnects')
+    for key, stats in lots.items():
+        lines.append(f'parkingvision_decode_restarts_total{_labels(lot=key)} {stats["decode"]["restarts"]}')
+
+    _family(lines, 'parkingvision_decode_fps', 'gauge', 'Frame rate over the last 100 frames, loop cache hits included')
+    for key, stats in lots.items():
+        lines.append(f'parkingvision_decode_fps{_labels(lot=key)} {stats["decode"]["fps"]}')
+
+    _family(lines, 'parkingvision_frames_processed_total', 'counter', 'Frames handled by a pipeline stage')
+    for key, stats in lots.items():
+        for stage in ('analyze', 'encode'):
+            lines.append(f'parkingvision_frames_processed_total{_labels(lot=key, stage=stage)} {stats[stage]["processed"]}')
+
+    _family(lines, 'parkingvision_frames_dropped_total', 'counter',
+            'Frames a stage never handled: queue overflow or too late')
+    for key, stats in lots.items():
+        for stage in ('analyze', 'encode'):
+            for reason in ('overflow', 'late'):
+                count = stats[stage]['dropped' if reason == 'overflow' else 'late']
+                lines.append(f'parkingvision_frames_dropped_total{_labels(lot=key, stage=stage, reason=reason)} {count}')
+
+    _family(lines, 'parkingvision_errors_total', 'counter', 'Exceptions caught in a pipeline stage')
+    for key, stats in lots.items():
+        lines.append(f'parkingvision_errors_total{_labels(lot=key, stage="decode")} {stats["decode"]["errors"]}')
+        for stage in ('analyze', 'encode'):
+            lines.append(f'parkingvision_errors_total{_labels(lot=key, stage=stage)} {stats[stage]["errors"]}')
+
+    cached = {key: stats['loop_cache'] for key, stats in lots.items() if stats.get('loop_cache')}
+    _family(lines, 'parkingvision_loop_cache_lookups_total', 'counter', 'Loop cache lookups by the decoder')
+    for key, cache in cached.items():
+        lines.append(f'parkingvision_loop_cache_lookups_total{_labels(lot=key, result="hit")} {cache["hits"]}')
+        lines.append(f'parkingvision_loop_cache_lookups_total{_labels(lot=key, result="miss")} {cache["misses"]}')
+
+    _family(lines, 'parkingvision_loop_cache_bytes', 'gauge', 'Bytes stored in the loop cache')
+    for key, cache in cached.items():
+        lines.append(f'parkingvision_loop_cache_bytes{_labels(lot=key)} {cache["bytes"]}')
+
+    _family(lines, 'parkingvision_stream_viewers', 'gauge', 'Connected video stream clients')
+    for key, stats in stream_stats.items():
+        renditions = dict.fromkeys(RENDITIONS, 0)
+        for client in stats['clients']:
+            renditions[client['rendition']] += 1
+        for rendition, count in renditions.items():
+            lines.append(f'parkingvision_stream_viewers{_labels(lot=key, rendition=rendition)} {count}')
+
+    _family(lines, 'parkingvision_stream_viewers_rejected_total', 'counter',
+            'Stream clients turned away at the viewer cap')
+    for key, stats in stream_stats.items():
+        lines.append(f'parkingvision_stream_viewers_rejected_total{_labels(lot=key)} {stats["rejected"]}')
+
+    return '\n'.join(lines) + '\n'
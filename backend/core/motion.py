@@ -0,0 +1,88 @@
+import cv2
+import numpy as np
+
+
+class SpotChangeDetector:
+    """Cheap per-spot change detector used to gate occupancy scoring
+
+    Compares each spot's mean intensity on a downscaled grayscale copy of the
+    layout ROI against the value it had when the spot was last scored. Only
+    spots that moved by more than `tolerance` grey levels need the full
+    threshold pipeline; every `rescore_interval` seconds all spots are
+    re-scored anyway so slow drift can't hide a change.
+    """
+
+    def __init__(self, layout, tolerance=4.0, rescore_interval=10.0, downscale=4):
+        self.layout = layout
+        self.tolerance = tolerance
+        self.rescore_interval = rescore_interval
+        self.downscale = max(1, int(downscale))
+
+        rx0, ry0, rx1, ry1 = layout.roi
+        d = self.downscale
+        self._size = (max(1, (rx1 - rx0) // d), max(1, (ry1 - ry0) // d))
+
+        # Spot corners in the downscaled ROI; every spot keeps at least one pixel
+        x0, y0, x1, y1 = layout.roi_corners(slice(None), layout.roi)
+        sw, sh = self._size
+        self._x0 = (x0 // d).clip(0, sw - 1)
+        self._y0 = (y0 // d).clip(0, sh - 1)
+        self._x1 = np.maximum(x1 // d, self._x0 + 1).clip(0, sw)
+        self._y1 = np.maximum(y1 // d, self._y0 + 1).clip(0, sh)
+        self._areas = ((self._x1 - self._x0) * (self._y1 - self._y0)).clip(1).astype(np.float64)
+
+        # The ROI is cut to a multiple of the factor, so INTER_AREA averages
+        # whole blocks, and a power-of-two factor is reached by halvings,
+        # INTER_AREA's fast path (spots past the cut keep their other pixels)
+        self._halvings = []
+        while d > 1 and d % 2 == 0:
+            d //= 2
+            self._halvings.append(np.empty((sh * d, sw * d, 3), np.uint8))
+
+        # Reused every frame; the downscaled ROI size is fixed by the layout
+        self._small = self._halvings[-1] if self._halvings and d == 1 else np.empty((sh, sw, 3), np.uint8)
+        self._gray = np.empty((sh, sw), np.uint8)
+        self._integral = np.empty((sh + 1, sw + 1), np.int32)
+
+        self._reference = None
+        self._last_full = None
+
+    def spot_means(self, frame):
+        """Mean grey level of every spot on the downscaled ROI"""
+        roi = self.layout.crop(frame)
+        if roi.size == 0:
+            return np.zeros(len(self.layout), dtype=np.float64)
+        sw, sh = self._size
+        small = roi[:sh * self.downscale, :sw * self.downscale]
+        for half in self._halvings:
+            small = cv2.resize(small, half.shape[1::-1], dst=half, interpolation=cv2.INTER_AREA)
+        if small is not self._small:
+            small = cv2.resize(small, self._size, dst=self._small, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        integral = cv2.integral(gray, sum=self._integral, sdepth=cv2.CV_32S)
+        sums = (integral[self._y1, self._x1].astype(np.int64)
+                - integral[self._y0, self._x1]
+                - integral[self._y1, self._x0]
+                + integral[self._y0, self._x0])
+        return sums / self._areas
+
+    def changed_spots(self, frame, now):
+        """Indices of the spots that need scoring on this frame
+
+        Returns every spot on the first call and on each forced full re-score.
+        """
+        means = self.spot_means(frame)
+        if (self._reference is None or self._last_full is None
+                or now - self._last_full >= self.rescore_interval):
+            self._reference = means
+            self._last_full = now
+            return np.arange(len(self.layout))
+
+        changed = np.flatnonzero(np.abs(means - self._reference) > self.tolerance)
+        # Unchanged spots keep their old reference so slow drift still adds up
+        self._reference[changed] = means[changed]
+        return changed
+
+    def reset(self):
+        """Score every spot on the next frame, e.g. after frames were skipped"""
+        self._reference = None
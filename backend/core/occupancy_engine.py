@@ -0,0 +1,261 @@
+"""Occupancy detection shared by the server and the CLI monitor
+
+An OccupancyEngine keeps the detection state of any number of lots (each
+added under a key with add_lot()) and scores frames for them in two ways:
+
+- update(): one live frame of one lot. The frame is downscaled to the
+  lot's analysis size, only spots whose region changed are re-scored
+  (SpotChangeDetector) and the scores are debounced by the lot's
+  SpotStateTracker. VideoProcessor and ParkingMonitor.process_frame both
+  run on this.
+- process_batch(): a stack of frames, from several lots and/or
+  consecutive frames of one lot, in one call. The per-frame work
+  (downscaling, the filter chain and counting, or patch sampling) runs
+  across a thread pool, since OpenCV releases the GIL, and each lot's
+  frames are then classified in one vectorized call. Every spot is
+  scored, as motion gating only helps frame by frame. The headless CLI
+  monitor runs all its lots through this.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    from core.motion import SpotChangeDetector
+    from core.spot_classifier import load_classifier
+    from core.spot_layout import SpotLayout, analysis_size, downscale
+    from core.spot_state import SpotEventLog, SpotStateTracker
+    from core.workspace import FrameWorkspace
+except ImportError:  # Imported by core/parking_monitor.py run directly
+    from motion import SpotChangeDetector
+    from spot_classifier import load_classifier
+    from spot_layout import SpotLayout, analysis_size, downscale
+    from spot_state import SpotEventLog, SpotStateTracker
+    from workspace import FrameWorkspace
+
+MAX_THREADS = 8  # Default pool size cap; more threads mostly contend for memory bandwidth
+
+
+class EngineLot:
+    """Detection state of one lot in an OccupancyEngine
+
+    `positions` are drawn on `reference_size` frames (None: on frames of
+    the size being analysed); set them with OccupancyEngine.set_positions().
+    `scores` holds the latest classifier score and `occupied` the debounced
+    state of every spot.
+    """
+
+    def __init__(self, key, classifier, analysis_width=None, event_log=None, workspace=None, metrics=None):
+        self.key = key
+        self.classifier = classifier
+        self.analysis_width = analysis_width  # None = analyse at the source width
+        self.event_log = event_log if event_log is not None else SpotEventLog()
+        self.workspace = workspace if workspace is not None else FrameWorkspace()
+        self.metrics = metrics  # LotMetrics the stages are timed into, if any
+        self.positions = []
+        self.reference_size = None
+        self.layout = None  # Compiled at the analysis size
+        self.change_detector = None
+        self.spot_state = None
+        self.scores = np.zeros(0, dtype=np.float64)
+        self.occupied = np.zeros(0, dtype=bool)
+        self.analyses = 0
+        self.spots_scored = 0
+        self.spots_skipped = 0
+
+    def analysis_size(self, width, height):
+        """Frame size occupancy is scored at: the source size capped at analysis_width"""
+        return analysis_size(width, height, self.analysis_width)
+
+    def observe(self, stage, seconds):
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+
+
+class OccupancyEngine:
+    """Spot occupancy of several lots, frame by frame or in batches
+
+    `monitor` (a ParkingMonitor) supplies the settings: MIN_DWELL,
+    CHANGE_TOLERANCE, FULL_RESCORE_INTERVAL and the default edge threshold.
+    update() may run on one thread per lot; process_batch() calls are
+    serialized (compiling, scoring and debouncing all run under one lock),
+    and a lot should not be fed by both at the same time.
+    """
+
+    def __init__(self, monitor, threads=None):
+        self.monitor = monitor
+        self.threads = threads or min(os.cpu_count() or 1, MAX_THREADS)
+        self.lots = {}
+        self._pool = None  # Started by the first process_batch() that can use it
+        self._local = threading.local()  # Batch buffers (a FrameWorkspace) per pool thread
+        self._batch_lock = threading.Lock()
+
+    def add_lot(self, key, positions=(), reference_size=None, classifier=None, analysis_width=None,
+                event_log=None, workspace=None, metrics=None):
+        """Register a lot (replacing any lot with that key) and return its EngineLot
+
+        classifier defaults to the monitor's edge classifier; event_log (a
+        SpotEventLog or stand-in) receives the committed spot changes.
+        """
+        if classifier is None:
+            classifier = load_classifier('edge', monitor=self.monitor)
+        lot = EngineLot(key, classifier, analysis_width, event_log, workspace, metrics)
+        lot.positions = positions
+        lot.reference_size = reference_size
+        self.lots[key] = lot
+        return lot
+
+    def set_positions(self, key, positions, reference_size=None):
+        """New spot positions for a lot; recompiled before its next frame
+
+        Layouts are matched by identity, so pass a new list rather than
+        editing the old one in place.
+        """
+        lot = self.lots[key]
+        lot.positions = positions
+        lot.reference_size = reference_size
+
+    def _compile(self, lot, size, source_size):
+        """Recompile the lot's layout and reset its state if the positions or frame size changed"""
+        reference = lot.reference_size or source_size
+        if lot.layout is not None and lot.layout.matches(lot.positions, size, reference):
+            return
+        lot.layout = SpotLayout(lot.positions, size, reference)
+        lot.change_detector = SpotChangeDetector(
+            lot.layout, self.monitor.CHANGE_TOLERANCE, self.monitor.FULL_RESCORE_INTERVAL)
+        lot.scores = np.zeros(len(lot.layout), dtype=np.float64)
+        lot.occupied = np.zeros(len(lot.layout), dtype=bool)
+        threshold, hysteresis = lot.classifier.threshold, lot.classifier.hysteresis
+        lot.spot_state = SpotStateTracker(len(lot.layout), threshold + hysteresis, threshold - hysteresis,
+                                          self.monitor.MIN_DWELL, lot.event_log)
+
+    def update(self, key, frame, now=None, timestamp=None):
+        """Analyse one frame of a lot and return its debounced occupancy
+
+        Spots whose region hasn't changed keep their last score. `now` is
+        the monotonic time used for forced full re-scores and `timestamp`
+        the wall-clock time of any state change (both default to the
+        current time).
+        """
+        lot = self.lots[key]
+        height, width = frame.shape[:2]
+        size = lot.analysis_size(width, height)
+        if lot.layout is not None and lot.layout.frame_size != size:
+            lot.workspace.clear()  # Don't keep buffers for the old resolution
+        start = time.perf_counter()
+        frame = downscale(frame, size, lot.workspace)
+        lot.observe('resize', time.perf_counter() - start)
+        self._compile(lot, size, (width, height))
+
+        start = time.perf_counter()
+        spots = lot.change_detector.changed_spots(frame, time.monotonic() if now is None else now)
+        lot.observe('motion', time.perf_counter() - start)
+        if len(spots) == len(lot.layout):
+            lot.scores = lot.classifier.scores(lot.layout, frame, metrics=lot.metrics, workspace=lot.workspace)
+        elif len(spots):
+            lot.scores[spots] = lot.classifier.scores(lot.layout, frame, spots, lot.metrics, lot.workspace)
+
+        lot.spot_state.update(lot.scores, time.time() if timestamp is None else timestamp)
+        lot.occupied = lot.spot_state.occupied
+        lot.analyses += 1
+        lot.spots_scored += len(spots)
+        lot.spots_skipped += len(lot.layout) - len(spots)
+        return lot.occupied
+
+    def apply_scores(self, key, scores, timestamp=None):
+        """Debounce scores computed elsewhere (e.g. replayed from a cache) as the lot's latest
+
+        The change detector's reference frame is stale afterwards, so the
+        next update() scores every spot. Returns the debounced occupancy.
+        """
+        lot = self.lots[key]
+        lot.scores[:] = scores
+        lot.spot_state.update(lot.scores, time.time() if timestamp is None else timestamp)
+        lot.occupied = lot.spot_state.occupied
+        lot.change_detector.reset()
+        return lot.occupied
+
+    def _map(self, fn, items):
+        if self.threads <= 1 or len(items) <= 1:
+            return list(map(fn, items))
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='occupancy')
+        return list(self._pool.map(fn, items))
+
+    def process_batch(self, frames, lots=None, timestamps=None):
+        """Score a batch of frames in one call; returns (occupied, scores) matrices
+
+        frames is a (frames, height, width, 3) array or a list of frames,
+        lots the key of each frame's lot (None: every frame belongs to the
+        only lot). Both matrices have a row per frame and a column per spot,
+        padded to the largest lot with False and NaN.
+
+        Without timestamps, occupied is each frame's scores against the
+        classifier threshold and no lot state changes. With a timestamp per
+        frame the scores go through each lot's state tracker in frame order
+        and occupied is the debounced state after every frame, as update()
+        would leave it.
+        """
+        count = len(frames)
+        if lots is None:
+            if len(self.lots) != 1:
+                raise ValueError("process_batch() needs the lot of each frame when the engine has several lots")
+            lots = [next(iter(self.lots))] * count
+        keys = list(lots)
+        if len(keys) != count or (timestamps is not None and len(timestamps) != count):
+            raise ValueError("process_batch() needs one lot and timestamp per frame")
+
+        with self._batch_lock:
+            # Compile each lot's layout for its frames' analysis size
+            sources = {}
+            for frame, key in zip(frames, keys):
+                sources.setdefault(key, set()).add((frame.shape[1], frame.shape[0]))
+            for key, sizes in sources.items():
+                if len(sizes) > 1:
+                    raise ValueError(f"Frames of lot {key} in one batch must have the same size")
+                source_size = sizes.pop()
+                self._compile(self.lots[key], self.lots[key].analysis_size(*source_size), source_size)
+
+            # Downscale and filter and count (or sample) every frame across
+            # the pool, each thread in its own reused buffers ...
+            def extract(index):
+                lot = self.lots[keys[index]]
+                workspace = getattr(self._local, 'workspace', None)
+                if workspace is None:
+                    workspace = self._local.workspace = FrameWorkspace()
+                frame = downscale(frames[index], lot.layout.frame_size, workspace)
+                return lot.classifier.frame_features(lot.layout, frame, workspace)
+
+            features = self._map(extract, range(count))
+
+            # ... then classify each lot's frames in one call
+            width = max((len(self.lots[key].layout) for key in keys), default=0)
+            scores = np.full((count, width), np.nan)
+            for key in dict.fromkeys(keys):
+                lot = self.lots[key]
+                rows = [i for i, k in enumerate(keys) if k == key]
+                scores[rows, :len(lot.layout)] = lot.classifier.batch_scores(lot.layout, [features[i] for i in rows])
+
+            occupied = np.zeros((count, width), dtype=bool)
+            if timestamps is None:
+                for i, key in enumerate(keys):
+                    spots = len(self.lots[key].layout)
+                    occupied[i, :spots] = scores[i, :spots] > self.lots[key].classifier.threshold
+                return occupied, scores
+
+            for i, key in enumerate(keys):
+                lot = self.lots[key]
+                spots = len(lot.layout)
+                occupied[i, :spots] = self.apply_scores(key, scores[i, :spots], timestamps[i])
+                lot.analyses += 1
+                lot.spots_scored += spots
+            return occupied, scores
+
+    def close(self):
+        """Stop the batch thread pool"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
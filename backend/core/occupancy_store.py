@@ -0,0 +1,302 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'occupancy.db')
+
+# How often each lot's counts are sampled, in seconds
+SAMPLE_INTERVAL = float(os.environ.get('HISTORY_SAMPLE_INTERVAL', 5.0))
+
+# Rollup levels as {name: bucket width in seconds}, finest first
+RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# How long each level is kept, in seconds (None = forever)
+RETENTION = {'raw': 2 * 86400, 'minute': 90 * 86400, 'hour': None, 'day': None}
+
+# A query never returns more points than this; coarser levels are used instead
+MAX_POINTS = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    lot TEXT NOT NULL,
+    time REAL NOT NULL,
+    total INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    occupied INTEGER NOT NULL,
+    PRIMARY KEY (lot, time)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    lot TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    sum_occupied REAL NOT NULL,
+    min_occupied INTEGER NOT NULL,
+    max_occupied INTEGER NOT NULL,
+    PRIMARY KEY (lot, resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+
+class SampleRing:
+    """Preallocated ring buffer of a lot's most recent samples"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros((capacity, 3), dtype=np.int32)  # total, available, occupied
+        self.size = 0
+        self._next = 0
+
+    def append(self, timestamp, total, available, occupied):
+        self.time[self._next] = timestamp
+        self.counts[self._next] = (total, available, occupied)
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def oldest(self):
+        if self.size == 0:
+            return None
+        return self.time[(self._next - self.size) % self.capacity]
+
+    def range(self, start, end):
+        """Samples with start <= time < end as (times, counts), oldest first"""
+        first = (self._next - self.size) % self.capacity
+        order = (np.arange(self.size) + first) % self.capacity
+        times = self.time[order]
+        lo, hi = np.searchsorted(times, [start, end])
+        return times[lo:hi], self.counts[order[lo:hi]]
+
+
+class Rollup:
+    """Running aggregate of one time bucket"""
+
+    __slots__ = ('bucket', 'samples', 'total', 'sum_occupied', 'min_occupied', 'max_occupied')
+
+    def __init__(self, bucket, samples=0, total=0, sum_occupied=0.0, min_occupied=None, max_occupied=None):
+        self.bucket = bucket
+        self.samples = samples
+        self.total = total
+        self.sum_occupied = sum_occupied
+        self.min_occupied = min_occupied
+        self.max_occupied = max_occupied
+
+    def add(self, total, occupied):
+        self.samples += 1
+        self.total = total
+        self.sum_occupied += occupied
+        self.min_occupied = occupied if self.min_occupied is None else min(self.min_occupied, occupied)
+        self.max_occupied = occupied if self.max_occupied is None else max(self.max_occupied, occupied)
+
+
+class OccupancyStore:
+    """Persistent per-lot occupancy history in SQLite (WAL mode)
+
+    Samples are appended to a raw table and to an in-memory ring buffer,
+    and folded into per-minute, per-hour and per-day rollups as they
+    arrive, so a range query reads at most MAX_POINTS rows of whichever
+    level fits. Writes are batched and committed by flush(); the open
+    bucket of each level is rewritten on every flush so queries see it.
+    Only one process should open the store for writing; others can open it
+    read-only.
+    """
+
+    def __init__(self, path=None, readonly=False, ring_capacity=4096):
+        self.path = path or os.environ.get('HISTORY_DB', DEFAULT_PATH)
+        self.readonly = readonly
+        self.ring_capacity = ring_capacity
+        self.rings = {}
+        self._rollups = {}  # {(lot, resolution): Rollup of the open bucket}
+        self._pending = []
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+        if not readonly:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = self._connect()
+            self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        # A read-only store waits for the writer to create the database
+        if self._conn is None and os.path.exists(self.path):
+            self._conn = self._connect()
+        return self._conn
+
+    def close(self):
+        if not self.readonly:
+            self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def record(self, lot, timestamp, total, available, occupied):
+        """Add one sample of a lot; persisted on the next flush()"""
+        with self._lock:
+            ring = self.rings.get(lot)
+            if ring is None:
+                ring = self.rings[lot] = SampleRing(self.ring_capacity)
+            ring.append(timestamp, total, available, occupied)
+            self._pending.append((lot, timestamp, total, available, occupied))
+            for resolution, width in RESOLUTIONS.items():
+                bucket = int(timestamp // width) * width
+                rollup = self._rollups.get((lot, resolution))
+                if rollup is None or rollup.bucket != bucket:
+                    if rollup is not None:
+                        self._write_rollup(lot, resolution, rollup)
+                    rollup = self._load_rollup(lot, resolution, bucket)
+                    self._rollups[(lot, resolution)] = rollup
+                rollup.add(total, occupied)
+
+    def _load_rollup(self, lot, resolution, bucket):
+        """Resume a bucket written before a restart, or start a new one"""
+        row = self._conn.execute(
+            'SELECT samples, total, sum_occupied, min_occupied, max_occupied FROM rollups '
+            'WHERE lot = ? AND resolution = ? AND bucket = ?', (lot, resolution, bucket)).fetchone()
+        return Rollup(bucket, *row) if row else Rollup(bucket)
+
+    def _write_rollup(self, lot, resolution, rollup):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (lot, resolution, rollup.bucket, rollup.samples, rollup.total,
+             rollup.sum_occupied, rollup.min_occupied, rollup.max_occupied))
+
+    def flush(self):
+        """Commit pending samples and the open rollup buckets"""
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)', self._pending)
+            self._pending = []
+            for (lot, resolution), rollup in self._rollups.items():
+                self._write_rollup(lot, resolution, rollup)
+            if time.time() - self._last_prune > 3600:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        self._last_prune = now = time.time()
+        if RETENTION['raw'] is not None:
+            self._conn.execute('DELETE FROM samples WHERE time < ?', (now - RETENTION['raw'],))
+        for resolution in RESOLUTIONS:
+            if RETENTION[resolution] is not None:
+                self._conn.execute('DELETE FROM rollups WHERE resolution = ? AND bucket < ?',
+                                   (resolution, now - RETENTION[resolution]))
+
+    def pick_resolution(self, start, end, resolution='auto'):
+        """Finest level at or above the requested one that fits in MAX_POINTS"""
+        levels = ['raw'] + list(RESOLUTIONS)
+        first = 0 if resolution == 'auto' else levels.index(resolution)
+        for level in levels[first:]:
+            width = SAMPLE_INTERVAL if level == 'raw' else RESOLUTIONS[level]
+            if (end - start) / width <= MAX_POINTS:
+                return level
+        return levels[-1]
+
+    def query(self, lot, start, end, resolution='auto'):
+        """History of a lot between two epoch times as (resolution used, points)
+
+        Each point has the bucket start time, the average occupied and
+        available counts and, for rollups, the occupied min/max and sample
+        count.
+        """
+        resolution = self.pick_resolution(start, end, resolution)
+        if resolution == 'raw':
+            return resolution, self._query_raw(lot, start, end)
+
+        width = RESOLUTIONS[resolution]
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return resolution, []
+            rows = conn.execute(
+                'SELECT bucket, samples, total, sum_occupied, min_occupied, max_occupied FROM rollups '
+                'WHERE lot = ? AND resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket LIMIT ?',
+                (lot, resolution, int(start // width) * width, end, MAX_POINTS + 1)).fetchall()
+        points = []
+        for bucket, samples, total, sum_occupied, min_occupied, max_occupied in rows[:MAX_POINTS]:
+            occupied = sum_occupied / samples
+            points.append({
+                'time': bucket,
+                'occupied': round(occupied, 2),
+                'available': round(total - occupied, 2),
+                'total': total,
+                'min_occupied': min_occupied,
+                'max_occupied': max_occupied,
+                'samples': samples
+            })
+        return resolution, points
+
+    def _query_raw(self, lot, start, end):
+        with self._lock:
+            ring = self.rings.get(lot)
+            if ring is not None and ring.oldest() is not None and ring.oldest() <= start:
+                # Recent enough to answer from memory
+                times, counts = ring.range(start, end)
+                rows = [(float(t), int(c[0]), int(c[1]), int(c[2])) for t, c in zip(times, counts)]
+            else:
+                conn = self._connection()
+                if conn is None:
+                    return []
+                rows = conn.execute(
+                    'SELECT time, total, available, occupied FROM samples '
+                    'WHERE lot = ? AND time >= ? AND time < ? ORDER BY time LIMIT ?',
+                    (lot, start, end, MAX_POINTS)).fetchall()
+        return [{'time': t, 'occupied': occupied, 'available': available, 'total': total}
+                for t, total, available, occupied in rows[:MAX_POINTS]]
+
+
+class OccupancySampler:
+    """Thread that samples every lot's counts into an OccupancyStore
+
+    `counts` is called with no arguments and returns {lot_key: (total,
+    available, occupied)}. Lots whose total is still 0 (layout not loaded
+    yet) are skipped.
+    """
+
+    def __init__(self, store, counts, interval=SAMPLE_INTERVAL, flush_interval=5.0):
+        self.store = store
+        self.counts = counts
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='occupancy-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        next_sample = time.time()
+        last_flush = time.time()
+        while not self._stop.wait(max(0.0, next_sample - time.time())):
+            now = time.time()
+            next_sample += self.interval
+            if next_sample < now:
+                # Fell behind (e.g. suspended) - don't backfill
+                next_sample = now + self.interval
+            try:
+                for lot, (total, available, occupied) in self.counts().items():
+                    if total > 0:
+                        self.store.record(lot, now, total, available, occupied)
+                if now - last_flush >= self.flush_interval:
+                    self.store.flush()
+                    last_flush = now
+            except Exception as e:
+                print(f"Error recording occupancy history: {e}")
+        self.store.flush()
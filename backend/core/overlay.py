@@ -0,0 +1,185 @@
+"""Overlay drawn on analysed frames: spot outlines, labels and the status banner
+
+The outlines only change when a spot changes state, so they are rendered
+once into a layer with a mask of the pixels they cover; each frame then
+gets them with one masked copy instead of a cv2.rectangle call per spot.
+Spot labels (scores that change every frame) stay out of the layer and
+are drawn straight onto each frame. The anti-aliased status text is rendered into an alpha patch that is only
+redone when the text changes.
+"""
+import cv2
+import numpy as np
+
+FREE_COLOR = (0, 255, 0)  # Green
+OCCUPIED_COLOR = (0, 0, 255)  # Red
+LABEL_COLOR = (255, 255, 255)
+BANNER_COLOR = (0, 200, 0)
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+LABEL_OFFSET = 5  # Labels sit this far inside the bottom-left corner of a spot
+
+
+class SpotOverlay:
+    """Spot outlines (and optional labels) of one layout at one frame size
+
+    `layer` holds every spot drawn in its current state and `mask` the
+    pixels that were drawn. update() re-renders only the spots whose state
+    changed: the box around such a spot is cleared and every spot whose
+    box overlaps it is drawn again, clipped to it, in layout order, which
+    leaves the same pixels as drawing all spots from scratch. draw()
+    composites the layer onto a frame with one cv2.copyTo over the
+    bounding box of all spots, then puts the labels given to update()
+    onto the frame with cv2.putText; they usually change every frame, so
+    caching them would mean re-rendering the whole layer each time.
+    """
+
+    def __init__(self, positions, frame_size, thickness=(2, 2), label_scale=None):
+        self.positions = positions
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.thickness = thickness  # (free, occupied)
+        self.colors = (FREE_COLOR, OCCUPIED_COLOR)
+        self.label_scale = label_scale  # Font scale of the labels
+        width, height = self.frame_size
+        self.layer = np.zeros((height, width, 3), np.uint8)
+        self.mask = np.zeros((height, width), np.uint8)
+
+        # Box each spot's drawing can touch, clipped to the frame
+        pos = np.array(positions, dtype=np.int64).reshape(-1, 4)
+        x, y, w, h = pos[:, 0], pos[:, 1], pos[:, 2], pos[:, 3]
+        pad = max(thickness) // 2 + 1
+        x0, y0, x1, y1 = x - pad, y - pad, x + w + pad + 1, y + h + pad + 1
+        self.boxes = np.stack([x0.clip(0, width), y0.clip(0, height),
+                               x1.clip(0, width), y1.clip(0, height)], axis=1)
+        bx0, by0, bx1, by1 = self.boxes.T
+        overlapping = ((bx0[:, None] < bx1[None, :]) & (bx0[None, :] < bx1[:, None])
+                       & (by0[:, None] < by1[None, :]) & (by0[None, :] < by1[:, None]))
+        self.overlaps = [np.flatnonzero(row) for row in overlapping]
+        visible = (bx1 > bx0) & (by1 > by0)
+        if visible.any():
+            self.roi = (int(bx0[visible].min()), int(by0[visible].min()),
+                        int(bx1[visible].max()), int(by1[visible].max()))
+        else:
+            self.roi = (0, 0, 0, 0)
+
+        self.occupied = None  # State the layer was rendered for
+        self.labels = None  # Drawn onto the frame by draw(), not into the layer
+        self._label_origins = [(int(sx) + LABEL_OFFSET, int(sy + sh) - LABEL_OFFSET)
+                               for sx, sy, sh in zip(x, y, h)]
+        self.redrawn = 0  # Spots re-rendered so far, for stats
+
+    def matches(self, positions, frame_size):
+        """True if this overlay was built for this positions list (by identity) and frame size"""
+        return positions is self.positions and tuple(frame_size) == self.frame_size
+
+    def _draw_spot(self, spot, layer, mask, ox, oy):
+        x, y, w, h = self.positions[spot]
+        state = int(self.occupied[spot])
+        color, thickness = self.colors[state], self.thickness[state]
+        corner1, corner2 = (x - ox, y - oy), (x + w - ox, y + h - oy)
+        cv2.rectangle(layer, corner1, corner2, color, thickness)
+        cv2.rectangle(mask, corner1, corner2, 255, thickness)
+
+    def _redraw(self, spot):
+        x0, y0, x1, y1 = (int(v) for v in self.boxes[spot])
+        if x1 <= x0 or y1 <= y0:
+            return
+        layer, mask = self.layer[y0:y1, x0:x1], self.mask[y0:y1, x0:x1]
+        layer[:] = 0
+        mask[:] = 0
+        for other in self.overlaps[spot]:
+            self._draw_spot(other, layer, mask, x0, y0)
+
+    def update(self, occupied, labels=None):
+        """Bring the layer up to date with a state vector; `labels` are drawn by the next draw()
+
+        Returns the number of spots whose state changed.
+        """
+        occupied = np.asarray(occupied, dtype=bool)
+        if self.occupied is None or len(occupied) != len(self.occupied):
+            changed = np.arange(len(occupied))
+        else:
+            changed = np.flatnonzero(occupied != self.occupied)
+        self.labels = labels
+        self.occupied = occupied.copy()
+
+        if len(changed) * 4 > len(occupied):
+            # Cheaper to start over than to redraw each neighbourhood
+            self.layer[:] = 0
+            self.mask[:] = 0
+            for spot in range(len(occupied)):
+                self._draw_spot(spot, self.layer, self.mask, 0, 0)
+        else:
+            for spot in changed:
+                self._redraw(spot)
+        self.redrawn += len(changed)
+        return len(changed)
+
+    def draw(self, frame):
+        """Composite the outlines (and labels) onto frame (in place) and return it"""
+        x0, y0, x1, y1 = self.roi
+        if x1 > x0 and y1 > y0:
+            cv2.copyTo(self.layer[y0:y1, x0:x1], self.mask[y0:y1, x0:x1], frame[y0:y1, x0:x1])
+        if self.labels is not None and self.label_scale is not None:
+            for label, origin in zip(self.labels, self._label_origins):
+                cv2.putText(frame, label, origin, FONT, self.label_scale, LABEL_COLOR, 1)
+        return frame
+
+
+class StatusBanner:
+    """Anti-aliased line of text, rendered again only when the text changes
+
+    The text's coverage is drawn once into a patch of blend weights; each
+    frame cv2.blendLinear mixes the colour into the frame through them,
+    which is what cv2.putText with LINE_AA does to the pixels under the
+    text.
+    """
+
+    def __init__(self, origin=(20, 30), color=BANNER_COLOR, scale=1, thickness=2):
+        self.origin = origin
+        self.color = color
+        self.scale = scale
+        self.thickness = thickness
+        self.text = None
+        self.box = (0, 0, 0, 0)
+        self._coverage = None
+        self._weights = None  # (frame weight, colour weight) float32 patches
+        self._fill = None  # Patch of the text colour
+        self.renders = 0
+
+    def _render(self, text):
+        (text_w, text_h), baseline = cv2.getTextSize(text, FONT, self.scale, self.thickness)
+        pad = self.thickness + 1
+        x0 = max(self.origin[0] - pad, 0)
+        y0 = max(self.origin[1] - text_h - pad, 0)
+        x1 = self.origin[0] + text_w + pad
+        y1 = self.origin[1] + baseline + pad
+        shape = (y1 - y0, x1 - x0)
+        if self._fill is None or self._fill.shape[:2] != shape:
+            # Digits are all as wide, so a changing count usually keeps the buffers
+            self._coverage = np.empty(shape, np.uint8)
+            self._weights = (np.empty(shape, np.float32), np.empty(shape, np.float32))
+            self._fill = np.empty(shape + (3,), np.uint8)
+            self._fill[:] = self.color
+        self._coverage[:] = 0
+        cv2.putText(self._coverage, text, (self.origin[0] - x0, self.origin[1] - y0), FONT, self.scale,
+                    255, self.thickness, cv2.LINE_AA)
+        frame_weight, color_weight = self._weights
+        np.multiply(self._coverage, np.float32(1 / 255), out=color_weight)
+        np.subtract(1, color_weight, out=frame_weight)
+        self.box = (x0, y0, x1, y1)
+        self.text = text
+        self.renders += 1
+
+    def draw(self, frame, text):
+        """Blend text onto frame (in place) and return it"""
+        if text != self.text:
+            self._render(text)
+        x0, y0, x1, y1 = self.box
+        region = frame[y0:y1, x0:x1]
+        h, w = region.shape[:2]
+        if (h, w) == self._fill.shape[:2]:
+            cv2.blendLinear(region, self._fill, *self._weights, dst=region)
+        elif h and w:  # Frame smaller than the text
+            cv2.blendLinear(region, self._fill[:h, :w].copy(), self._weights[0][:h, :w].copy(),
+                            self._weights[1][:h, :w].copy(), dst=region)
+        return frame
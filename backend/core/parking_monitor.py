@@ -1,8 +1,21 @@
+import argparse
 import cv2
-import pickle
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
+import time
+
+try:
+    from core.layout_file import load_layout, save_layout
+    from core.occupancy_engine import OccupancyEngine
+    from core.overlay import SpotOverlay, StatusBanner
+    from core.spot_classifier import EdgeClassifier
+except ImportError:  # Run directly as core/parking_monitor.py
+    from layout_file import load_layout, save_layout
+    from occupancy_engine import OccupancyEngine
+    from overlay import SpotOverlay, StatusBanner
+    from spot_classifier import EdgeClassifier
 
 class ParkingMonitor:
     def __init__(self):
@@ -10,11 +23,24 @@ class ParkingMonitor:
         self.drawing = False
         self.current_idx = -1
         self.start_pos = None
+        self._dirty = False  # Edits not saved yet
+        self._last_edit = 0.0
         
         # Configuration
         self.SPOT_WIDTH, self.SPOT_HEIGHT = 90, 30
         self.OCCUPANCY_THRESHOLD = 0.2
+        self.OCCUPANCY_HYSTERESIS = 0.03  # Edge ratio band around the threshold where a spot keeps its state
+        self.MIN_DWELL = 2.0  # Seconds a new spot state must hold before it is reported
         self.FRAME_SKIP = 1  # Process every frame for smooth playback
+        self.ANALYSIS_FPS = 2.0  # Occupancy analysis rate, independent of the stream FPS
+        self.CHANGE_TOLERANCE = 4.0  # Mean grey-level change that makes a spot get re-scored
+        self.FULL_RESCORE_INTERVAL = 10.0  # Seconds between forced re-scores of every spot
+        self.SAVE_DEBOUNCE = 0.5  # Seconds the editor waits after the last edit before saving
+        
+        # Scores the spots in process_frame; replace it to try another classifier
+        self.classifier = EdgeClassifier(self.OCCUPANCY_THRESHOLD, self.OCCUPANCY_HYSTERESIS)
+        # Detection state of every lot, shared with the VideoProcessors built on this monitor
+        self.engine = OccupancyEngine(self)
         
         # Get the directory where this script is located
         script_dir = Path(__file__).parent
@@ -31,27 +57,38 @@ class ParkingMonitor:
             assets_dir / "coordinate-video-3"
         ]
         self.original_frame_sizes = {}  # To store original video dimensions as {video_idx: (width, height)}
+        self._overlays = {}  # Cached spot outlines and status text as {video_idx: (SpotOverlay, StatusBanner)}
 
     def load_positions(self, pos_file):
         """Load parking positions from file"""
         try:
             if pos_file.exists():
-                with open(pos_file, 'rb') as f:
-                    return pickle.load(f)
+                return load_layout(pos_file).positions
         except Exception as e:
             print(f"Error loading positions: {e}")
         return []
 
-    def save_positions(self, positions, pos_file):
+    def save_positions(self, positions, pos_file, frame_size=None):
         """Save parking positions to file"""
         try:
-            # Create directory if it doesn't exist
-            pos_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(pos_file, 'wb') as f:
-                pickle.dump(positions, f)
+            save_layout(pos_file, positions, frame_size)
+            self._dirty = False
         except Exception as e:
             print(f"Error saving positions: {e}")
 
+    def _mark_dirty(self):
+        self._dirty = True
+        self._last_edit = time.monotonic()
+
+    def _save_if_settled(self, pos_file, video_idx):
+        """Save pending edits once no new edit has come in for SAVE_DEBOUNCE seconds
+
+        A running app reloads the file on every save, so a drag is written
+        once when it settles rather than on every mouse move.
+        """
+        if self._dirty and time.monotonic() - self._last_edit >= self.SAVE_DEBOUNCE:
+            self.save_positions(self.positions, pos_file, self.original_frame_sizes.get(video_idx))
+
     def get_config_frame(self, video_path, video_idx):
         """Get properly scaled first frame from video"""
         print(f"Trying to open video: {video_path}")
@@ -86,6 +123,7 @@ class ParkingMonitor:
     def _mouse_handler(self, event, x, y, flags, param):
         """Mouse callback for spot configuration"""
         pos_file, video_idx = param
+        edited = False
         
         if event == cv2.EVENT_LBUTTONDOWN:
             # Check if clicking existing spot
@@ -98,7 +136,7 @@ class ParkingMonitor:
             
             # Add new spot
             self.positions.append((x, y, self.SPOT_WIDTH, self.SPOT_HEIGHT))
-            self.save_positions(self.positions, pos_file)
+            edited = True
         
         elif event == cv2.EVENT_MOUSEMOVE and self.drawing:
             if self.current_idx >= 0 and self.start_pos:
@@ -108,7 +146,7 @@ class ParkingMonitor:
                 new_h = max(20, h + dy)
                 self.positions[self.current_idx] = (px, py, new_w, new_h)
                 self.start_pos = (x, y)
-                self.save_positions(self.positions, pos_file)
+                edited = True
         
         elif event == cv2.EVENT_LBUTTONUP:
             self.drawing = False
@@ -118,8 +156,11 @@ class ParkingMonitor:
             for i, (px, py, w, h) in enumerate(self.positions[:]):
                 if px <= x <= px+w and py <= y <= py+h:
                     self.positions.pop(i)
-                    self.save_positions(self.positions, pos_file)
+                    edited = True
                     break
+        
+        if edited:
+            self._mark_dirty()
 
     def configure_spots(self, frame, pos_file, video_idx):
         """Interactive spot configuration with proper scaling"""
@@ -145,51 +186,56 @@ class ParkingMonitor:
             
             cv2.imshow("Configure Parking Spots", display_frame)
             key = cv2.waitKey(1)
+            self._save_if_settled(pos_file, video_idx)
             
             if key == 27:  # ESC
-                self.save_positions(self.positions, pos_file)
+                self.save_positions(self.positions, pos_file, self.original_frame_sizes.get(video_idx))
                 print(f"Saved {len(self.positions)} spots")
                 break
             elif key == ord('r'):  # Reset
                 self.positions = []
+                self._mark_dirty()
                 print("Reset all spots")
         
         cv2.destroyWindow("Configure Parking Spots")
 
     def process_frame(self, frame, positions, video_idx):
-        """Process frame with proper scaling"""
-        if video_idx in self.original_frame_sizes:
-            frame = cv2.resize(frame, self.original_frame_sizes[video_idx])
+        """Analyse a frame and draw the spots and free count on it (in place)
         
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (3, 3), 1)
-        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                     cv2.THRESH_BINARY_INV, 25, 16)
-        processed = cv2.medianBlur(thresh, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        processed = cv2.dilate(processed, kernel, iterations=1)
+        Scoring and debouncing go through the occupancy engine, as for the
+        server's lots, so an outline changes colour only once its spot has
+        held the new state for MIN_DWELL seconds, as the server would
+        publish it. Spots are scaled to the frame rather than the frame to
+        the size the spots were drawn on. Edge spots are labelled with
+        their edge pixel count, other classifiers' with their score.
+        """
+        height, width = frame.shape[:2]
+        lot = self.engine.lots.get(video_idx)
+        if lot is None:
+            lot = self.engine.add_lot(video_idx, classifier=self.classifier)
+        self.engine.set_positions(video_idx, positions, self.original_frame_sizes.get(video_idx))
+        occupied = self.engine.update(video_idx, frame)
+        layout, scores = lot.layout, lot.scores
+        free_count = int(len(occupied) - occupied.sum())
         
-        free_count = 0
-        for x, y, w, h in positions:
-            spot = processed[y:y+h, x:x+w]
-            nonzero = cv2.countNonZero(spot)
-            
-            if nonzero > (w * h * self.OCCUPANCY_THRESHOLD):
-                color = (0, 0, 255)  # Red - occupied
-                thickness = 2
-            else:
-                color = (0, 255, 0)  # Green - free
-                thickness = 3
-                free_count += 1
-            
-            cv2.rectangle(frame, (x, y), (x+w, y+h), color, thickness)
-            cv2.putText(frame, str(nonzero), (x+5, y+h-5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1)
+        if lot.classifier.name == 'edge':
+            labels = [str(count) for count in np.rint(scores * np.maximum(layout.areas, 1)).astype(int)]
+        else:
+            labels = [f"{score:.2f}" for score in scores]
+
+        # Outlines (red occupied, green free) come from a cached layer where
+        # only spots whose state changed are redrawn; the labels change
+        # every frame and are drawn straight onto it
+        overlay, banner = self._overlays.get(video_idx, (None, None))
+        if overlay is None or not overlay.matches(layout.positions, (width, height)):
+            overlay = SpotOverlay(layout.positions, (width, height), thickness=(3, 2), label_scale=0.5)
+            banner = StatusBanner()
+            self._overlays[video_idx] = (overlay, banner)
+        overlay.update(occupied, labels)
+        overlay.draw(frame)
         
         # Display status
-        status = f"Free: {free_count}/{len(positions)}"
-        cv2.putText(frame, status, (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                   1, (0, 200, 0), 2, cv2.LINE_AA)
+        banner.draw(frame, f"Free: {free_count}/{len(positions)}")
         return frame
 
     def monitor(self):
@@ -264,6 +310,113 @@ class ParkingMonitor:
         cv2.destroyAllWindows()
         print("Monitoring stopped")
 
+    def monitor_headless(self, frames=None, batch=1, report_interval=5.0):
+        """Monitor every configured video without windows, all lots at once
+
+        Each step reads `batch` consecutive frames of every lot (one reader
+        thread per lot, reading the next step while this one is scored) and
+        scores all of them with one OccupancyEngine.process_batch() call.
+        With a single scoring thread there is nothing to spread the batch
+        across and skipping unchanged spots wins, so every frame goes
+        through the motion-gated OccupancyEngine.update() instead. Spot states are debounced on video time, so a video plays
+        as fast as it can be analysed. Prints each lot's free count every
+        report_interval seconds. Stops after `frames` frames per lot (None:
+        on Ctrl-C); videos loop.
+        """
+        lots = []  # (video_idx, capture, fps)
+        for i, video_path in enumerate(self.video_paths):
+            try:
+                stored = load_layout(self.pos_files[i]) if self.pos_files[i].exists() else None
+            except Exception as e:
+                print(f"Error loading positions: {e}")
+                stored = None
+            if stored is None or not stored.positions:
+                print(f"Skipping video {i+1} - no spots configured")
+                continue
+            cap = cv2.VideoCapture(str(video_path))
+            if not cap.isOpened():
+                print(f"Failed to open video {i+1}")
+                continue
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            self.engine.add_lot(i, stored.positions, stored.frame_size, classifier=self.classifier)
+            lots.append((i, cap, fps))
+            print(f"Video {i+1} ready with {len(stored.positions)} spots, FPS: {fps}")
+        if not lots:
+            print("No videos available for monitoring!")
+            return
+
+        read_counts = {i: 0 for i, _, _ in lots}
+
+        def read(lot, count):
+            """Next `count` frames of a lot as (frames, video timestamps)"""
+            i, cap, fps = lot
+            got, times = [], []
+            while len(got) < count:
+                ret, frame = cap.read()
+                if not ret:
+                    # Loop video when it ends
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                got.append(frame)
+                times.append(read_counts[i] / fps)
+                read_counts[i] += 1
+            return got, times
+
+        batched = self.engine.threads > 1
+        mode = f"{batch} frames per lot and batch" if batched else "frame by frame, motion-gated"
+        print(f"\nMonitoring {len(lots)} lots headless, {mode} (Ctrl-C to stop)...")
+        readers = ThreadPoolExecutor(max_workers=len(lots), thread_name_prefix='reader')
+        started = last_report = time.monotonic()
+        processed = requested = 0
+
+        def submit():
+            """Start reading the next batch of every lot, up to `frames` frames per lot"""
+            nonlocal requested
+            count = batch if frames is None else min(batch, frames - requested)
+            requested += count
+            return [readers.submit(read, lot, count) for lot in lots] if count > 0 else []
+
+        try:
+            pending = submit()
+            while pending:
+                results = [future.result() for future in pending]
+                pending = submit()
+                batch_frames, keys, timestamps = [], [], []
+                for (i, _, _), (got, times) in zip(lots, results):
+                    batch_frames += got
+                    keys += [i] * len(got)
+                    timestamps += times
+                if not batch_frames:
+                    break
+                if batched:
+                    self.engine.process_batch(batch_frames, keys, timestamps)
+                else:
+                    for frame, key, timestamp in zip(batch_frames, keys, timestamps):
+                        self.engine.update(key, frame, timestamp, timestamp)
+                processed += len(batch_frames) // len(lots)  # Short reads at a failing source count less
+
+                now = time.monotonic()
+                if now - last_report >= report_interval:
+                    last_report = now
+                    counts = []
+                    for i, _, _ in lots:
+                        occupied = self.engine.lots[i].occupied
+                        counts.append(f"Lot {i+1}: {int(len(occupied) - occupied.sum())}/{len(occupied)} free")
+                    print(f"{', '.join(counts)} ({processed / (now - started):.1f} frames/s per lot)")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            readers.shutdown(cancel_futures=True)
+            for _, cap, _ in lots:
+                cap.release()
+            self.engine.close()
+
+        elapsed = time.monotonic() - started
+        print(f"Monitoring stopped after {processed} frames per lot in {elapsed:.1f} s "
+              f"({processed * len(lots) / max(elapsed, 1e-9):.1f} frames/s over all lots)")
+
     def run(self):
         """Main execution flow"""
         try:
@@ -310,5 +463,18 @@ class ParkingMonitor:
             cv2.destroyAllWindows()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Configure parking spots and monitor the videos")
+    parser.add_argument('--headless', action='store_true',
+                        help="skip configuration and windows; analyse every lot concurrently in batches")
+    parser.add_argument('--frames', type=int, help="stop after this many frames per lot (headless)")
+    parser.add_argument('--batch', type=int, default=4, help="consecutive frames per lot and batch (headless)")
+    parser.add_argument('--threads', type=int, help="batch scoring threads (headless, default: CPU count up to 8)")
+    args = parser.parse_args()
+    
     monitor = ParkingMonitor()
-    monitor.run()
\ No newline at end of file
+    if args.headless:
+        if args.threads:
+            monitor.engine.threads = args.threads
+        monitor.monitor_headless(args.frames, max(1, args.batch))
+    else:
+        monitor.run()
\ No newline at end of file
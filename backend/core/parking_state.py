@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+
+HISTORY_LEN = 50  # History entries kept per lot, one per change
+
+
+def _json(value):
+    """Bytes as Flask's jsonify() writes them: sorted keys, compact, trailing newline"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':')).encode() + b'\n'
+
+
+class LotSnapshot:
+    """One lot's counts and history at one version, never modified
+
+    The JSON bodies the API serves are serialized once, when the snapshot is
+    made, so a request only picks up bytes. Versions restart at 0 with the
+    process, so the etag also carries the modification time (in shared mode
+    the analyzer's, so every web worker gives the same etag).
+    """
+
+    __slots__ = ('key', 'total', 'available', 'occupied', 'history', 'version', 'modified',
+                 'etag', 'counts_json', 'details_json')
+
+    def __init__(self, key, total, available, occupied, history, version, modified):
+        counts = {'total': total, 'available': available, 'occupied': occupied}
+        for name, value in (('key', key), ('total', total), ('available', available),
+                            ('occupied', occupied), ('history', tuple(history)), ('version', version),
+                            ('modified', modified), ('etag', f'{key}.{version}.{int(modified * 1e6):x}'),
+                            ('counts_json', _json(counts).rstrip()),
+                            ('details_json', _json({**counts, 'history': list(history)}))):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LotSnapshot is immutable")
+
+    def counts(self):
+        return {'total': self.total, 'available': self.available, 'occupied': self.occupied}
+
+
+class AllLotsSnapshot:
+    """Every lot's counts at once: the /api/parking-data body and its validators"""
+
+    __slots__ = ('etag', 'modified', 'body')
+
+    def __init__(self, lot_keys, snapshots):
+        object.__setattr__(self, 'etag', '-'.join(snapshots[key].etag for key in lot_keys))
+        object.__setattr__(self, 'modified', max((snapshots[key].modified for key in lot_keys), default=0))
+        object.__setattr__(self, 'body', b'{' + b','.join(
+            json.dumps(key).encode() + b':' + snapshots[key].counts_json
+            for key in sorted(lot_keys)) + b'}\n')
+
+    def __setattr__(self, name, value):
+        raise AttributeError("AllLotsSnapshot is immutable")
+
+
+class ParkingState:
+    """Latest snapshot of every lot, replaced (never mutated) on each change
+
+    Writers take `changed` (so updates to one lot serialize), build the new
+    LotSnapshot and AllLotsSnapshot and swap them in; readers take no lock.
+    Replacing a dict value or an attribute is atomic, so a reader gets
+    either the old or the new snapshot, each self-consistent: available and
+    occupied always belong together. `changed` is notified and every
+    listener called after each swap.
+    """
+
+    def __init__(self, lot_keys):
+        self.lot_keys = list(lot_keys)
+        now = time.time()
+        self.lots = {key: LotSnapshot(key, 0, 0, 0, (), 0, now) for key in self.lot_keys}
+        self.all_lots = AllLotsSnapshot(self.lot_keys, self.lots)
+        self.changed = threading.Condition()
+        self.listeners = []  # Called from the writing thread, e.g. to wake an event loop
+
+    def __contains__(self, lot_key):
+        return lot_key in self.lots
+
+    def __getitem__(self, lot_key):
+        return self.lots[lot_key]
+
+    def _swap(self, snapshot):
+        self.lots[snapshot.key] = snapshot
+        self.all_lots = AllLotsSnapshot(self.lot_keys, self.lots)
+        self.changed.notify_all()
+
+    def _notify(self):
+        for callback in self.listeners:
+            callback()
+
+    def update(self, lot_key, **counts):
+        """Apply new counts; a new version (and history entry) only if something changed"""
+        with self.changed:
+            lot = self.lots[lot_key]
+            current = lot.counts()
+            if all(current[name] == value for name, value in counts.items()):
+                return False
+            current.update(counts)
+            entry = {
+                'time': time.strftime("%H:%M:%S"),
+                'available': current['available'],
+                'occupied': current['occupied']
+            }
+            self._swap(LotSnapshot(lot_key, current['total'], current['available'], current['occupied'],
+                                   lot.history[-(HISTORY_LEN - 1):] + (entry,), lot.version + 1, time.time()))
+        self._notify()
+        return True
+
+    def mirror(self, lot_key, total, available, occupied, history, version, modified):
+        """Replace a lot's snapshot with another process's copy (shared mode)"""
+        with self.changed:
+            lot = self.lots[lot_key]
+            if lot.version == version and lot.modified == modified:
+                return False
+            self._swap(LotSnapshot(lot_key, total, available, occupied, history, version, modified))
+        self._notify()
+        return True
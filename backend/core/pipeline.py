@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+
+
+class LatestQueue:
+    """Bounded ring queue that drops the oldest item instead of blocking
+
+    A producer never waits on a slow consumer: when the queue is full the
+    stalest item is discarded and counted. Items older than max_age seconds
+    (judged by the timestamp the producer passed to put) are dropped on get.
+    """
+
+    def __init__(self, maxsize=2, max_age=None):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.late = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, timestamp=None):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append((time.monotonic() if timestamp is None else timestamp, item))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest fresh item, or None on timeout/close"""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                while self._items:
+                    timestamp, item = self._items.popleft()
+                    if self.max_age is not None and time.monotonic() - timestamp > self.max_age:
+                        self.late += 1
+                        continue
+                    return item
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class PipelineStage:
+    """Worker thread that applies fn to items from inbox and forwards results
+
+    fn returns the item for the next stage, or None to stop it here. Each
+    call's duration also goes into histogram (a metrics.Histogram) if given.
+    """
+
+    def __init__(self, name, fn, inbox, outbox=None, histogram=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.histogram = histogram
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.inbox.close()
+
+    def _run(self):
+        while self._running:
+            item = self.inbox.get(timeout=0.5)
+            if item is None:
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in {self.name}: {e}")
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                self.busy_time += elapsed
+                if self.histogram is not None:
+                    self.histogram.observe(elapsed)
+            self.processed += 1
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+
+    def stats(self):
+        return {
+            'queue_depth': len(self.inbox),
+            'queue_size': self.inbox.maxsize,
+            'dropped': self.inbox.dropped,
+            'late': self.inbox.late,
+            'processed': self.processed,
+            'errors': self.errors,
+            'busy_seconds': round(self.busy_time, 3)
+        }
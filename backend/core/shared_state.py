@@ -0,0 +1,471 @@
+import json
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from core.analysis_pool import ForwardingEventLog
+from core.spot_state import SpotEventLog
+from core.stream_cache import RENDITIONS, encode_renditions
+
+# Segment names are f"{SHM_PREFIX}-{lot_id}"
+SHM_PREFIX = os.environ.get('SHM_PREFIX', 'parkingvision')
+
+MAGIC = 0x50564C54  # "PVLT"
+MAX_SPOTS = 4096
+EVENT_CAPACITY = 4096  # Must match SpotEventLog's capacity
+HISTORY_LEN = 50
+STATS_BYTES = 64 * 1024
+FRAME_CAPACITY = {'full': 4 * 1024 * 1024, 'thumb': 256 * 1024}
+
+# A web worker wanting a rendition keeps touching its timestamp; the analyzer
+# encodes it while the timestamp is fresher than this
+WANTED_TIMEOUT = 2.0
+
+# A segment whose heartbeat is older than this belongs to a dead analyzer;
+# readers then retry attaching after REATTACH_MIN, doubling up to REATTACH_MAX
+HEARTBEAT_TIMEOUT = 10.0
+REATTACH_MIN, REATTACH_MAX = 0.5, 5.0
+
+# Header slots (int64)
+H_MAGIC, H_GENERATION, H_SEQLOCK, H_TOTAL, H_AVAILABLE, H_OCCUPIED, H_VERSION = range(7)
+H_HISTORY_LEN, H_SPOT_COUNT, H_NEXT_SEQ, H_VALID_FROM, H_STATS_SEQLOCK, H_STATS_LEN = range(7, 13)
+# Float slots (float64); wanted timestamps follow, one per rendition
+F_MODIFIED, F_HEARTBEAT, F_WANTED = range(3)
+# Frame meta slots (int64), one block per rendition
+M_SEQLOCK, M_ACTIVE, M_SEQ, M_LEN0, M_LEN1 = range(5)
+
+
+class SharedLotState:
+    """Shared-memory segment holding one lot's counts, spot log, stats and frames
+
+    The analyzer daemon is the only writer. Counts, history and the spot
+    event log are guarded by a seqlock (the counter is odd while a write is
+    in progress and readers retry if it moved). Each JPEG rendition is
+    double-buffered under the rendition's own seqlock: the writer makes it
+    odd, fills the inactive slot, flips M_ACTIVE and makes it even again.
+    A reader keeps a copy only if the counter was even and unchanged
+    across it, so it can't return a slot that was being overwritten.
+    """
+
+    def __init__(self, lot_id, create=False, prefix=SHM_PREFIX):
+        self.lot_id = str(lot_id)
+        self.name = f"{prefix}-{self.lot_id}"
+        size = self._layout(None)
+        if create:
+            try:
+                # Leftover from an analyzer that didn't shut down cleanly
+                stale = shared_memory.SharedMemory(name=self.name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            # Readers must not unlink the analyzer's segment when they exit
+            try:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self.owner = create
+        self._event_next = None  # Writer: event log next_seq as of the last write_state()
+        self._layout(self.shm.buf)
+        if create:
+            self.header[:] = 0
+            self.floats[:] = 0
+            self.header[H_MAGIC] = MAGIC
+            self.header[H_GENERATION] = time.time_ns()
+            self.header[H_NEXT_SEQ] = 1
+            self.header[H_VALID_FROM] = 1
+
+    def _layout(self, buf):
+        """Map named arrays onto buf (or just measure the size when buf is None)"""
+        offset = 0
+
+        def alloc(dtype, shape):
+            nonlocal offset
+            dtype = np.dtype(dtype)
+            offset = -(-offset // 8) * 8  # Keep every array 8-byte aligned
+            count = int(np.prod(shape))
+            array = None
+            if buf is not None:
+                array = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            offset += count * dtype.itemsize
+            return array
+
+        self.header = alloc(np.int64, (16,))
+        self.floats = alloc(np.float64, (F_WANTED + len(RENDITIONS),))
+        self.history = alloc(np.float64, (HISTORY_LEN, 3))  # (epoch, available, occupied)
+        self.occupied = alloc(np.bool_, (MAX_SPOTS,))
+        self.last_change = alloc(np.float64, (MAX_SPOTS,))
+        self.event_seq = alloc(np.int64, (EVENT_CAPACITY,))
+        self.event_spot = alloc(np.int32, (EVENT_CAPACITY,))
+        self.event_state = alloc(np.bool_, (EVENT_CAPACITY,))
+        self.event_time = alloc(np.float64, (EVENT_CAPACITY,))
+        self.stats = alloc(np.uint8, (STATS_BYTES,))
+        self.frame_meta = {}
+        self.frame_data = {}
+        for name in RENDITIONS:
+            self.frame_meta[name] = alloc(np.int64, (5,))
+            self.frame_data[name] = alloc(np.uint8, (2, FRAME_CAPACITY.get(name, FRAME_CAPACITY['full'])))
+        return offset
+
+    def close(self):
+        # Drop the numpy views first, or the buffer can't be released
+        self.header = self.floats = self.history = None
+        self.occupied = self.last_change = self.stats = None
+        self.event_seq = self.event_spot = self.event_state = self.event_time = None
+        self.frame_meta = self.frame_data = {}
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    # --- Writer side (analyzer daemon) ---
+
+    def write_state(self, lot, event_log):
+        """Publish counts, history and the spot events recorded since the last call
+
+        The first call, and any after the log was reset or wrapped, copies
+        the whole log. Raises ValueError if the layout has more spots than
+        the segment holds.
+        """
+        exported = event_log.export(since=self._event_next)
+        full = exported['slots'] is None
+        if full and len(exported['occupied']) > MAX_SPOTS:
+            raise ValueError(f"Lot {self.lot_id} has {len(exported['occupied'])} spots, "
+                             f"shared memory holds at most {MAX_SPOTS}")
+        self.header[H_SEQLOCK] += 1
+        try:
+            self.header[H_TOTAL] = lot['total']
+            self.header[H_AVAILABLE] = lot['available']
+            self.header[H_OCCUPIED] = lot['occupied']
+            self.header[H_VERSION] = lot['version']
+            self.floats[F_MODIFIED] = lot['modified']
+            history = lot['history'][-HISTORY_LEN:]
+            self.header[H_HISTORY_LEN] = len(history)
+            for i, (epoch, available, occupied) in enumerate(history):
+                self.history[i] = (epoch, available, occupied)
+            self.header[H_NEXT_SEQ] = exported['next_seq']
+            self.header[H_VALID_FROM] = exported['valid_from']
+            if full:
+                spot_count = len(exported['occupied'])
+                self.header[H_SPOT_COUNT] = spot_count
+                self.occupied[:spot_count] = exported['occupied']
+                self.last_change[:spot_count] = exported['last_change']
+                slots = slice(None)
+            else:
+                spots = exported['spots']
+                self.occupied[spots] = exported['occupied']
+                self.last_change[spots] = exported['last_change']
+                slots = exported['slots']
+            self.event_seq[slots] = exported['seq']
+            self.event_spot[slots] = exported['spot']
+            self.event_state[slots] = exported['state']
+            self.event_time[slots] = exported['time']
+        finally:
+            self.header[H_SEQLOCK] += 1
+        self._event_next = exported['next_seq']
+
+    def write_frame(self, rendition, seq, data):
+        """Write an encoded frame into the inactive slot and flip to it"""
+        meta, slots = self.frame_meta[rendition], self.frame_data[rendition]
+        if len(data) > slots.shape[1]:
+            return False
+        target = 1 - int(meta[M_ACTIVE])
+        meta[M_SEQLOCK] += 1
+        try:
+            slots[target, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+            meta[M_LEN0 + target] = len(data)
+            meta[M_SEQ] = seq
+            meta[M_ACTIVE] = target
+        finally:
+            meta[M_SEQLOCK] += 1
+        return True
+
+    def write_stats(self, stats):
+        """Publish a stats dict as JSON; the largest sections are left out if it doesn't fit"""
+        data = json.dumps(stats).encode()
+        if len(data) > STATS_BYTES:
+            sizes = {name: len(json.dumps(value)) for name, value in stats.items()}
+            stats = dict(stats, dropped=[])
+            for name in sorted(sizes, key=sizes.get, reverse=True):
+                del stats[name]
+                stats['dropped'].append(name)
+                data = json.dumps(stats).encode()
+                if len(data) <= STATS_BYTES:
+                    break
+            else:
+                return False
+        self.header[H_STATS_SEQLOCK] += 1
+        self.stats[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.header[H_STATS_LEN] = len(data)
+        self.header[H_STATS_SEQLOCK] += 1
+        return True
+
+    def heartbeat(self):
+        self.floats[F_HEARTBEAT] = time.time()
+
+    def wanted(self, rendition):
+        """True while some web worker has viewers for this rendition"""
+        index = F_WANTED + list(RENDITIONS).index(rendition)
+        return time.time() - self.floats[index] < WANTED_TIMEOUT
+
+    # --- Reader side (web workers) ---
+
+    def want(self, rendition):
+        self.floats[F_WANTED + list(RENDITIONS).index(rendition)] = time.time()
+
+    def _read_consistent(self, lock_array, lock_index, read, retries=50):
+        for _ in range(retries):
+            before = int(lock_array[lock_index])
+            if before % 2:
+                time.sleep(0)
+                continue
+            result = read()
+            if int(lock_array[lock_index]) == before:
+                return before, result
+        return None, None
+
+    def state_seqlock(self):
+        return int(self.header[H_SEQLOCK])
+
+    def read_state(self):
+        """Consistent copy of counts, history and event log, or None if the writer kept interfering"""
+        def read():
+            spot_count = int(self.header[H_SPOT_COUNT])
+            history_len = int(self.header[H_HISTORY_LEN])
+            return {
+                'total': int(self.header[H_TOTAL]),
+                'available': int(self.header[H_AVAILABLE]),
+                'occupied': int(self.header[H_OCCUPIED]),
+                'version': int(self.header[H_VERSION]),
+                'modified': float(self.floats[F_MODIFIED]),
+                'history': self.history[:history_len].copy(),
+                'event_log': {
+                    'next_seq': int(self.header[H_NEXT_SEQ]),
+                    'valid_from': int(self.header[H_VALID_FROM]),
+                    'seq': self.event_seq.copy(),
+                    'spot': self.event_spot.copy(),
+                    'state': self.event_state.copy(),
+                    'time': self.event_time.copy(),
+                    'occupied': self.occupied[:spot_count].copy(),
+                    'last_change': self.last_change[:spot_count].copy()
+                }
+            }
+        return self._read_consistent(self.header, H_SEQLOCK, read)
+
+    def frame_seq(self, rendition):
+        return int(self.frame_meta[rendition][M_SEQ])
+
+    def read_frame(self, rendition):
+        """(seq, jpeg bytes) of the newest frame of a rendition, or (0, None)"""
+        meta, slots = self.frame_meta[rendition], self.frame_data[rendition]
+
+        def read():
+            active, seq = int(meta[M_ACTIVE]), int(meta[M_SEQ])
+            length = int(meta[M_LEN0 + active])
+            return seq, slots[active, :length].tobytes()
+
+        _, result = self._read_consistent(meta, M_SEQLOCK, read)
+        if result is None or not result[1]:
+            return 0, None  # Polled again shortly
+        return result
+
+    def read_stats(self):
+        def read():
+            length = int(self.header[H_STATS_LEN])
+            return self.stats[:length].tobytes()
+        _, data = self._read_consistent(self.header, H_STATS_SEQLOCK, read)
+        try:
+            return json.loads(data) if data else None
+        except ValueError:
+            return None
+
+
+class SharedStatePublisher:
+    """VideoProcessor / AnalysisPool publisher of the standalone analyzer
+
+    Keeps each lot's counts, history and spot event log here and mirrors
+    them into the lot's SharedLotState after every change, so any number of
+    web workers can serve them.
+    """
+
+    def __init__(self, lots, prefix=SHM_PREFIX):
+        self.segments = {lot.id: SharedLotState(lot.id, create=True, prefix=prefix) for lot in lots}
+        self.lot_data = {lot.key: {'total': 0, 'available': 0, 'occupied': 0, 'history': [],
+                                   'version': 0, 'modified': time.time()} for lot in lots}
+        self.event_logs = {lot.id: SpotEventLog(EVENT_CAPACITY) for lot in lots}
+        self.lot_ids = {lot.key: lot.id for lot in lots}
+        self._locks = {lot.id: threading.Lock() for lot in lots}
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+
+    def heartbeat(self):
+        for segment in self.segments.values():
+            segment.heartbeat()
+
+    def _write_state(self, lot_id):
+        lot_key = f'lot{lot_id}'
+        with self._locks[lot_id]:
+            self.segments[lot_id].write_state(self.lot_data[lot_key], self.event_logs[lot_id])
+
+    def update_lot(self, lot_key, **counts):
+        lot = self.lot_data[lot_key]
+        if all(lot[name] == value for name, value in counts.items()):
+            return False
+        lot.update(counts)
+        # Same history rule as the web app: one entry per change, last 50 kept
+        lot['history'] = lot['history'][-(HISTORY_LEN - 1):] + [(time.time(), lot['available'], lot['occupied'])]
+        lot['version'] += 1
+        lot['modified'] = time.time()
+        self._write_state(self.lot_ids[lot_key])
+        return True
+
+    def subscriber_counts(self, lot_id):
+        segment = self.segments[lot_id]
+        return {name: int(segment.wanted(name)) for name in RENDITIONS}
+
+    def is_streaming(self, lot_id):
+        return any(self.subscriber_counts(lot_id).values())
+
+    def event_log(self, lot_id):
+        return ForwardingEventLog(self, lot_id)
+
+    def reset_spots(self, lot_id, occupied, timestamp):
+        if len(occupied) > MAX_SPOTS:
+            # Refuse before the log takes a layout the segment can't mirror
+            raise ValueError(f"Lot {lot_id} has {len(occupied)} spots, shared memory holds at most {MAX_SPOTS}")
+        self.event_logs[lot_id].reset(occupied, timestamp)
+        self._write_state(lot_id)
+
+    def append_spots(self, lot_id, spots, states, timestamp):
+        self.event_logs[lot_id].append(spots, states, timestamp)
+        self._write_state(lot_id)
+
+    def publish_frame(self, lot_id, seq, frame):
+        self.publish_encoded(lot_id, seq, encode_renditions(frame, self.subscriber_counts(lot_id)))
+
+    def publish_encoded(self, lot_id, seq, encoded):
+        segment = self.segments[lot_id]
+        for name, data in encoded.items():
+            if not segment.write_frame(name, seq, data):
+                print(f"Frame for lot {lot_id} ({name}) exceeds shared memory slot, dropped")
+
+    def set_pipeline_stats(self, lot_key, stats):
+        self.segments[self.lot_ids[lot_key]].write_stats(stats)
+
+
+class SharedStateReader:
+    """Web-worker side: mirrors the analyzer's shared memory into the API state
+
+    Polls each lot's segment and replays changes on `api` (the app's
+    ApiPublisher): counts and history via mirror_lot, the spot event log via
+    load_event_log, and new frames of watched renditions via
+    publish_encoded. It also marks the renditions this worker's viewers want.
+    Segments are re-attached when the analyzer restarts.
+    """
+
+    def __init__(self, lots, api, poll_interval=0.02, prefix=SHM_PREFIX):
+        self.lots = list(lots)
+        self.api = api
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.segments = {}
+        self._seen = {}  # {lot_id: (generation, state seqlock, {rendition: frame seq})}
+        self._retry = {}  # {lot_id: (time of the next attach attempt, delay after that)}
+        self._running = False
+
+    def start(self):
+        self._running = True
+        threading.Thread(target=self._run, name='shared-state-reader', daemon=True).start()
+
+    def stop(self):
+        self._running = False
+
+    def _attach(self, lot_id):
+        """The lot's segment, re-attached once the analyzer behind it restarted
+
+        While the analyzer is missing or dead the last segment (or None)
+        is kept and attaching is retried with a growing delay.
+        """
+        segment = self.segments.get(lot_id)
+        now = time.time()
+        if segment is not None and now - segment.floats[F_HEARTBEAT] <= HEARTBEAT_TIMEOUT:
+            self._retry.pop(lot_id, None)
+            return segment
+        retry_at, delay = self._retry.get(lot_id, (0.0, REATTACH_MIN))
+        if now < retry_at:
+            return segment
+        self._retry[lot_id] = (now + delay, min(delay * 2, REATTACH_MAX))
+        try:
+            fresh = SharedLotState(lot_id, prefix=self.prefix)
+        except FileNotFoundError:
+            return segment
+        if fresh.header[H_MAGIC] != MAGIC or (
+                segment is not None and fresh.header[H_GENERATION] == segment.header[H_GENERATION]):
+            fresh.close()  # Not written yet, or the same dead analyzer's segment
+            return segment
+        if segment is not None:
+            segment.close()
+        self.segments[lot_id] = fresh
+        return fresh
+
+    def _run(self):
+        last_stats = 0.0
+        while self._running:
+            read_stats = time.time() - last_stats > 1.0
+            if read_stats:
+                last_stats = time.time()
+            for lot in self.lots:
+                try:
+                    segment = self._attach(lot.id)
+                    if segment is None:
+                        continue
+                    self._poll(lot, segment)
+                    if read_stats:
+                        stats = segment.read_stats()
+                        if stats:
+                            self.api.set_pipeline_stats(lot.key, stats)
+                except Exception as e:
+                    print(f"Error reading shared state for lot {lot.id}: {e}")
+            time.sleep(self.poll_interval)
+
+    def _poll(self, lot, segment):
+        generation = int(segment.header[H_GENERATION])
+        seen_generation, seen_lock, seen_frames = self._seen.get(lot.id, (None, None, {}))
+        if generation != seen_generation:
+            seen_lock, seen_frames = None, {}
+
+        # Counts, history and spot events
+        if segment.state_seqlock() != seen_lock:
+            lock, state = segment.read_state()
+            if state is not None:
+                history = [{'time': time.strftime("%H:%M:%S", time.localtime(epoch)),
+                            'available': int(available), 'occupied': int(occupied)}
+                           for epoch, available, occupied in state['history']]
+                self.api.mirror_lot(lot.key, state['total'], state['available'], state['occupied'],
+                                    history, state['version'], state['modified'])
+                self.api.load_event_log(lot.id, state['event_log'])
+                seen_lock = lock
+
+        # Frames, only for renditions someone here is watching
+        viewers = self.api.subscriber_counts(lot.id)
+        newest = None
+        for name, count in viewers.items():
+            if count <= 0:
+                continue
+            segment.want(name)
+            seq = segment.frame_seq(name)
+            if seq and seq != seen_frames.get(name):
+                seq, data = segment.read_frame(name)
+                if data is not None:
+                    self.api.publish_encoded(lot.id, seq, {name: data})
+                    seen_frames[name] = seq
+                    newest = seq
+        self._seen[lot.id] = (generation, seen_lock, seen_frames)
+        return newest
@@ -0,0 +1,200 @@
+import threading
+import time
+
+import numpy as np
+
+# Upper edges of the dwell-time histogram bins, in seconds; one more bin
+# collects everything longer than the last edge
+DWELL_EDGES = np.array([60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400], dtype=np.float64)
+
+
+def hour_of_day_seconds(timestamps, utc_offset):
+    """Seconds from a fixed origin up to each timestamp, split by hour of day
+
+    Returns an array of shape (len(timestamps), 24). The difference of two
+    rows is how much of the interval between them fell in each hour of the
+    day, so any interval is split in constant time however long it is.
+    """
+    local = np.asarray(timestamps, dtype=np.float64)[..., None] + utc_offset
+    days, second_of_day = np.divmod(local, 86400)
+    return days * 3600 + np.clip(second_of_day - np.arange(24) * 3600, 0, 3600)
+
+
+class SpotAnalytics:
+    """Streaming dwell, turnover and time-of-day aggregates for one lot
+
+    Fed the same reset()/append() calls as SpotEventLog, and does a
+    constant amount of work per state change, vectorised over each batch.
+    Memory is fixed by the number of spots: a dwell histogram, arrival
+    count and occupied seconds per hour of day for every spot, plus the
+    start of its current session. Sessions that were already running when
+    tracking started have an unknown start, so their dwell is left out of
+    the histograms.
+    """
+
+    def __init__(self, utc_offset=None):
+        self.utc_offset = utc_offset
+        self._lock = threading.Lock()
+        self._init(np.zeros(0, dtype=bool), time.time())
+
+    def _init(self, occupied, timestamp):
+        spot_count = len(occupied)
+        self.started = timestamp
+        self.occupied = np.array(occupied, dtype=bool)
+        self.session_start = np.full(spot_count, timestamp, dtype=np.float64)
+        self.session_known = np.zeros(spot_count, dtype=bool)
+        self.arrivals = np.zeros(spot_count, dtype=np.int64)
+        self.dwell_count = np.zeros(spot_count, dtype=np.int64)
+        self.dwell_hist = np.zeros((spot_count, len(DWELL_EDGES) + 1), dtype=np.int64)
+        self.dwell_total = np.zeros(spot_count, dtype=np.float64)
+        self.occupied_seconds = np.zeros((spot_count, 24), dtype=np.float64)  # Closed sessions only
+        self.occupied_count = int(self.occupied.sum())
+        self.peak_occupied = self.occupied_count
+        self.peak_time = timestamp
+        self.events = 0
+
+    def _offset(self, timestamp):
+        if self.utc_offset is not None:
+            return self.utc_offset
+        return time.localtime(timestamp).tm_gmtoff
+
+    def reset(self, occupied, timestamp):
+        """Start tracking a new layout, or resync the current one"""
+        occupied = np.asarray(occupied, dtype=bool)
+        with self._lock:
+            if len(occupied) != len(self.occupied):
+                self._init(occupied, timestamp)
+                return
+        # Same layout (e.g. the analysis restarted): keep the aggregates
+        changed = np.flatnonzero(occupied != self.occupied)
+        self.append(changed, occupied[changed], timestamp)
+
+    def append(self, spots, states, timestamp):
+        """Record that each spot in spots changed to the matching state"""
+        spots = np.asarray(spots, dtype=np.int64)
+        states = np.asarray(states, dtype=bool)
+        with self._lock:
+            if len(spots) == 0 or len(self.occupied) == 0:
+                return
+            was = self.occupied[spots]
+            arrived = spots[states & ~was]
+            departed = spots[~states & was]
+
+            if len(departed):
+                starts = self.session_start[departed]
+                known = departed[self.session_known[departed]]
+                dwell = timestamp - self.session_start[known]
+                np.add.at(self.dwell_hist, (known, np.searchsorted(DWELL_EDGES, dwell)), 1)
+                np.add.at(self.dwell_total, known, dwell)
+                np.add.at(self.dwell_count, known, 1)
+                offset = self._offset(timestamp)
+                split = hour_of_day_seconds(timestamp, offset) - hour_of_day_seconds(starts, offset)
+                np.add.at(self.occupied_seconds, departed, split)
+
+            np.add.at(self.arrivals, arrived, 1)
+            changed = np.concatenate([arrived, departed])
+            self.occupied[arrived] = True
+            self.occupied[departed] = False
+            self.session_start[changed] = timestamp
+            self.session_known[changed] = True
+
+            self.occupied_count += len(arrived) - len(departed)
+            if self.occupied_count > self.peak_occupied:
+                self.peak_occupied = self.occupied_count
+                self.peak_time = timestamp
+            self.events += len(changed)
+
+    def _profile(self, now, spot=None):
+        """Occupied seconds per hour of day, open sessions included up to now"""
+        offset = self._offset(now)
+        if spot is not None:
+            seconds = self.occupied_seconds[spot]
+            if self.occupied[spot]:
+                seconds = seconds + hour_of_day_seconds(now, offset) - \
+                    hour_of_day_seconds(self.session_start[spot], offset)
+            return seconds
+        seconds = self.occupied_seconds.sum(axis=0)
+        starts = self.session_start[self.occupied]
+        if len(starts):
+            seconds = seconds + len(starts) * hour_of_day_seconds(now, offset) - \
+                hour_of_day_seconds(starts, offset).sum(axis=0)
+        return seconds
+
+    def _observed(self, now):
+        """Seconds of tracking per hour of day"""
+        offset = self._offset(now)
+        return hour_of_day_seconds(now, offset) - hour_of_day_seconds(self.started, offset)
+
+    @staticmethod
+    def _dwell_summary(hist, total, sessions):
+        return {
+            'sessions': int(sessions),
+            'mean_seconds': round(float(total) / sessions, 1) if sessions else None,
+            'histogram': [{'le': None if edge is None else float(edge), 'count': int(count)}
+                          for edge, count in zip(list(DWELL_EDGES) + [None], hist)]
+        }
+
+    def lot_summary(self, now=None):
+        """Aggregates over every spot of the lot"""
+        now = time.time() if now is None else now
+        with self._lock:
+            spot_count = len(self.occupied)
+            observed = self._observed(now)
+            profile = self._profile(now)
+            current = now - self.session_start[self.occupied]
+            summary = {
+                'spots': spot_count,
+                'tracking_since': self.started,
+                'events': self.events,
+                'occupied': self.occupied_count,
+                'peak': {'occupied': self.peak_occupied, 'time': self.peak_time},
+                'turnover': {
+                    'arrivals': int(self.arrivals.sum()),
+                    'per_spot_per_day': round(float(self.arrivals.sum()) / spot_count /
+                                              max(now - self.started, 1) * 86400, 3) if spot_count else None
+                },
+                'dwell': self._dwell_summary(self.dwell_hist.sum(axis=0), self.dwell_total.sum(),
+                                             self.dwell_count.sum()),
+                'current_sessions': {
+                    'count': len(current),
+                    'mean_seconds': round(float(current.mean()), 1) if len(current) else None,
+                    'max_seconds': round(float(current.max()), 1) if len(current) else None
+                }
+            }
+        # Average fraction of spots occupied in each hour of the day
+        with np.errstate(invalid='ignore', divide='ignore'):
+            occupancy = profile / (observed * spot_count)
+        summary['hourly_occupancy'] = [round(float(value), 4) if np.isfinite(value) else None
+                                       for value in occupancy]
+        observed_hours = np.isfinite(occupancy)
+        if observed_hours.any() and occupancy[observed_hours].max() > 0:
+            summary['peak_hour'] = int(np.flatnonzero(observed_hours)[np.argmax(occupancy[observed_hours])])
+        else:
+            summary['peak_hour'] = None
+        return summary
+
+    def spot_summary(self, spot, now=None):
+        """Aggregates of one spot, or None if there is no such spot"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if not 0 <= spot < len(self.occupied):
+                return None
+            observed = self._observed(now)
+            profile = self._profile(now, spot)
+            occupied = bool(self.occupied[spot])
+            in_state = round(now - self.session_start[spot], 1)
+            summary = {
+                'spot': spot,
+                'occupied': occupied,
+                'current_session_seconds': in_state if occupied else None,
+                'vacant_seconds': None if occupied else in_state,
+                'since_known': bool(self.session_known[spot]),  # False: state predates tracking
+                'arrivals': int(self.arrivals[spot]),
+                'dwell': self._dwell_summary(self.dwell_hist[spot], self.dwell_total[spot],
+                                             self.dwell_count[spot])
+            }
+        with np.errstate(invalid='ignore', divide='ignore'):
+            occupancy = profile / observed
+        summary['hourly_occupancy'] = [round(float(value), 4) if np.isfinite(value) else None
+                                       for value in occupancy]
+        return summary
@@ -0,0 +1,277 @@
+"""Spot classifiers: turn a frame and a SpotLayout into per-spot scores
+
+A classifier scores every spot (or a subset, for motion gating) of a frame
+in one call and says where its scores flip: a spot is occupied above
+`threshold`, and the SpotStateTracker keeps a spot's state within
+`hysteresis` of it. Two backends:
+
+- 'edge' (default): the adaptive-threshold edge ratio, i.e. the share of a
+  spot's pixels on an edge (see SpotLayout.score). No model needed.
+- 'linear': gradient-orientation (HOG-like) and colour histograms of each
+  spot, resampled to a fixed patch, scored by a logistic regression whose
+  weights come from train_classifier.py. The output is P(occupied).
+
+Both are CPU-only and classify all spots of a frame in one vectorized
+batch. For several frames at once, frame_features() does the per-frame
+work (OpenCV filtering or patch sampling, fine to run on threads) and
+batch_scores() classifies all of them in one call.
+"""
+import hashlib
+import time
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from core.spot_layout import SpotLayout
+except ImportError:  # Imported by core/parking_monitor.py run directly
+    from spot_layout import SpotLayout
+
+PATCH_SIZE = (32, 16)  # (width, height) every spot is resampled to
+SUBSAMPLE = 2  # Samples per patch pixel and axis, averaged (a cheap box filter)
+CELL = 8  # HOG cell size in patch pixels
+ORIENTATIONS = 9  # Unsigned gradient orientation bins
+COLOUR_BINS = 8  # Per channel, plus as many for chroma (max - min channel)
+FEATURE_VERSION = 1  # Bumped when patch_features() changes; old models are refused
+
+CLASSIFIERS = ('edge', 'linear')
+
+
+def sample_patches(frame, corners, patch_size=PATCH_SIZE):
+    """Resample the boxes (x0, y0, x1, y1 arrays) of a BGR frame to patches
+
+    One fancy-index gather builds a (spots, SUBSAMPLE * h, SUBSAMPLE * w, 3)
+    grid of samples over every box, which is then averaged down to
+    (spots, h, w, 3) float32. Empty boxes give black patches.
+    """
+    pw, ph = patch_size
+    x0, y0, x1, y1 = (np.asarray(c, dtype=np.int64) for c in corners)
+    height, width = frame.shape[:2]
+    steps_x = (np.arange(pw * SUBSAMPLE) + 0.5) / (pw * SUBSAMPLE)
+    steps_y = (np.arange(ph * SUBSAMPLE) + 0.5) / (ph * SUBSAMPLE)
+    xs = (x0[:, None] + steps_x[None, :] * (x1 - x0)[:, None]).astype(np.int64).clip(0, max(width - 1, 0))
+    ys = (y0[:, None] + steps_y[None, :] * (y1 - y0)[:, None]).astype(np.int64).clip(0, max(height - 1, 0))
+    flat = (ys[:, :, None] * width + xs[:, None, :]).ravel()
+    samples = np.take(frame.reshape(-1, 3), flat, axis=0).reshape(len(x0), ph, SUBSAMPLE, pw, SUBSAMPLE, 3)
+    patches = samples[:, :, 0, :, 0].astype(np.float32)
+    for dy in range(SUBSAMPLE):
+        for dx in range(SUBSAMPLE):
+            if dy or dx:
+                patches += samples[:, :, dy, :, dx]
+    patches *= 1.0 / (SUBSAMPLE * SUBSAMPLE)
+    patches[(x1 <= x0) | (y1 <= y0)] = 0
+    return patches
+
+
+def patch_features(patches):
+    """Feature matrix (spots, features) of a batch of BGR float32 patches
+
+    Per patch: gradient-orientation histograms of CELL x CELL cells weighted
+    by gradient magnitude and L2-normalised over the patch (HOG without the
+    overlapping blocks), histograms of each colour channel and of chroma,
+    and the grey-level standard deviation and mean gradient magnitude.
+    """
+    count, ph, pw = patches.shape[:3]
+    gray = patches @ np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR weights
+
+    gx = np.zeros_like(gray)
+    gy = np.zeros_like(gray)
+    gx[:, :, 1:-1] = gray[:, :, 2:] - gray[:, :, :-2]
+    gy[:, 1:-1, :] = gray[:, 2:, :] - gray[:, :-2, :]
+    magnitude = np.hypot(gx, gy)
+    orientation = np.arctan2(gy, gx) % np.pi
+    bins = np.minimum((orientation * (ORIENTATIONS / np.pi)).astype(np.int64), ORIENTATIONS - 1)
+
+    # One bincount over (patch, cell row, cell column, orientation)
+    cells_y, cells_x = ph // CELL, pw // CELL
+    cell_y = np.minimum(np.arange(ph) // CELL, cells_y - 1)
+    cell_x = np.minimum(np.arange(pw) // CELL, cells_x - 1)
+    cell = cell_y[:, None] * cells_x + cell_x[None, :]
+    index = (np.arange(count)[:, None, None] * (cells_y * cells_x) + cell) * ORIENTATIONS + bins
+    hog = np.bincount(index.ravel(), weights=magnitude.ravel(),
+                      minlength=count * cells_y * cells_x * ORIENTATIONS).reshape(count, -1)
+    hog /= np.linalg.norm(hog, axis=1, keepdims=True) + 1e-6
+
+    # Histograms as pixel fractions; values are 0..255
+    pixels = ph * pw
+    levels = np.minimum((patches * (COLOUR_BINS / 256.0)).astype(np.int64), COLOUR_BINS - 1)
+    channel = np.arange(3) * COLOUR_BINS
+    index = (np.arange(count)[:, None, None, None] * (3 * COLOUR_BINS)) + channel + levels
+    colour = np.bincount(index.ravel(), minlength=count * 3 * COLOUR_BINS).reshape(count, -1) / pixels
+    b, g, r = patches[..., 0], patches[..., 1], patches[..., 2]
+    spread = np.maximum(np.maximum(b, g), r) - np.minimum(np.minimum(b, g), r)
+    chroma = np.minimum((spread * (COLOUR_BINS / 256.0)).astype(np.int64), COLOUR_BINS - 1)
+    index = np.arange(count)[:, None, None] * COLOUR_BINS + chroma
+    chroma = np.bincount(index.ravel(), minlength=count * COLOUR_BINS).reshape(count, -1) / pixels
+
+    texture = np.stack([gray.reshape(count, -1).std(axis=1) / 64.0,
+                        magnitude.reshape(count, -1).mean(axis=1) / 64.0], axis=1)
+    return np.hstack([hog, colour, chroma, texture]).astype(np.float64)
+
+
+class EdgeClassifier:
+    """Edge ratio of each spot against a fixed threshold (the original rule)"""
+
+    name = 'edge'
+
+    def __init__(self, threshold=0.2, hysteresis=0.03):
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+
+    def params(self):
+        """What the scores depend on, for cache keys"""
+        return {'classifier': self.name, 'threshold': self.threshold, 'hysteresis': self.hysteresis}
+
+    def scores(self, layout, frame, spots=None, metrics=None, workspace=None):
+        """Edge ratio of every spot, or of `spots` in that order"""
+        _, counts = layout.score(frame, self.threshold, spots, metrics, workspace)
+        areas = layout.areas if spots is None else layout.areas[spots]
+        return counts / np.maximum(areas, 1)
+
+    def frame_features(self, layout, frame, workspace=None):
+        """Edge pixel count of every spot; batch_scores() turns a list of these into ratios"""
+        return layout.score(frame, self.threshold, workspace=workspace)[1]
+
+    def batch_scores(self, layout, features):
+        """(frames, spots) edge ratios from the frame_features() of each frame"""
+        if not len(features):
+            return np.zeros((0, len(layout)))
+        return np.stack(features) / np.maximum(layout.areas, 1)
+
+    def crop_scores(self, crops):
+        """Edge ratios of standalone spot images (for evaluation on labelled crops)"""
+        ratios = np.empty(len(crops))
+        for i, crop in enumerate(crops):
+            height, width = crop.shape[:2]
+            ratios[i] = self.scores(SpotLayout([(0, 0, width, height)], (width, height)), crop)[0]
+        return ratios
+
+
+class LinearClassifier:
+    """Logistic regression on patch_features() of each spot
+
+    `mean` and `std` standardise the features; the score is
+    sigmoid(standardised features @ weights + bias).
+    """
+
+    name = 'linear'
+
+    def __init__(self, weights, bias, mean, std, patch_size=PATCH_SIZE, threshold=0.5, hysteresis=0.1,
+                 source=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.patch_size = (int(patch_size[0]), int(patch_size[1]))
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.source = source  # Model file, if loaded from one
+
+    def params(self):
+        return {'classifier': self.name, 'threshold': self.threshold, 'hysteresis': self.hysteresis,
+                'model': hash_array(self.weights, self.mean, self.std, np.float64(self.bias))}
+
+    def predict(self, features):
+        """P(occupied) of each row of a feature matrix"""
+        logits = ((features - self.mean) / self.std) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -30, 30)))
+
+    def scores(self, layout, frame, spots=None, metrics=None, workspace=None):
+        """P(occupied) of every spot, or of `spots` in that order"""
+        corners = layout.corners if spots is None else tuple(c[spots] for c in layout.corners)
+        if len(corners[0]) == 0:
+            return np.zeros(0)
+        start = time.perf_counter()
+        patches = sample_patches(frame, corners, self.patch_size)
+        sampled = time.perf_counter()
+        scores = self.predict(patch_features(patches))
+        if metrics is not None:
+            metrics.observe('preprocess', sampled - start)
+            metrics.observe('score', time.perf_counter() - sampled)
+        return scores
+
+    def frame_features(self, layout, frame, workspace=None):
+        """Resampled patch of every spot; batch_scores() featurizes and scores a list of these"""
+        return sample_patches(frame, layout.corners, self.patch_size)
+
+    def batch_scores(self, layout, features):
+        """(frames, spots) P(occupied) from the frame_features() of each frame, in one prediction"""
+        if not len(features) or not len(layout):
+            return np.zeros((len(features), len(layout)))
+        return self.predict(patch_features(np.concatenate(features))).reshape(len(features), len(layout))
+
+    def crop_scores(self, crops):
+        return self.predict(crop_features(crops, self.patch_size))
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 patch_size=np.array(self.patch_size), threshold=self.threshold,
+                 hysteresis=self.hysteresis, feature_version=FEATURE_VERSION)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['feature_version']) != FEATURE_VERSION:
+                raise ValueError(f"{path} was trained on other features (version {int(data['feature_version'])}, "
+                                 f"expected {FEATURE_VERSION}); retrain it with train_classifier.py")
+            return cls(data['weights'], data['bias'], data['mean'], data['std'], tuple(data['patch_size']),
+                       float(data['threshold']), float(data['hysteresis']), source=Path(path))
+
+
+def hash_array(*arrays):
+    """Short digest of some arrays' bytes"""
+    digest = hashlib.sha256()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def crop_features(crops, patch_size=PATCH_SIZE):
+    """patch_features() of standalone BGR spot images of any size"""
+    patches = np.concatenate([
+        sample_patches(crop, ([0], [0], [crop.shape[1]], [crop.shape[0]]), patch_size) for crop in crops
+    ]) if len(crops) else np.zeros((0, patch_size[1], patch_size[0], 3), np.float32)
+    return patch_features(patches)
+
+
+def train_linear(features, labels, l2=1.0, iterations=25, patch_size=PATCH_SIZE):
+    """Fit a LinearClassifier with iteratively reweighted least squares (Newton's method)
+
+    `l2` is the ridge penalty on the standardised weights, which also keeps
+    perfectly separable training sets from diverging.
+    """
+    labels = np.asarray(labels, dtype=np.float64)
+    mean = features.mean(axis=0)
+    std = features.std(axis=0)
+    std[std < 1e-9] = 1.0
+    x = np.hstack([(features - mean) / std, np.ones((len(features), 1))])
+    penalty = np.full(x.shape[1], l2)
+    penalty[-1] = 0.0  # Don't shrink the bias
+    theta = np.zeros(x.shape[1])
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-np.clip(x @ theta, -30, 30)))
+        gradient = x.T @ (p - labels) + penalty * theta
+        hessian = (x.T * (p * (1 - p) + 1e-9)) @ x + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return LinearClassifier(theta[:-1], theta[-1], mean, std, patch_size)
+
+
+def load_classifier(name=None, model=None, monitor=None):
+    """Classifier by name: 'edge' (default) or 'linear' with a model file
+
+    The edge classifier takes its threshold and hysteresis from the
+    monitor's OCCUPANCY_THRESHOLD and OCCUPANCY_HYSTERESIS if given.
+    """
+    name = name or 'edge'
+    if name == 'edge':
+        if monitor is None:
+            return EdgeClassifier()
+        return EdgeClassifier(monitor.OCCUPANCY_THRESHOLD, monitor.OCCUPANCY_HYSTERESIS)
+    if name == 'linear':
+        if not model:
+            raise ValueError("The linear classifier needs a model file (classifier_model)")
+        return LinearClassifier.load(model)
+    raise ValueError(f"Unknown classifier {name!r}, expected one of {', '.join(CLASSIFIERS)}")
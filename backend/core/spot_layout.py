@@ -0,0 +1,221 @@
+import time
+
+import cv2
+import numpy as np
+
+# Pixels of context the filter chain reads around each output pixel:
+# GaussianBlur 3x3 (1) + adaptiveThreshold block 25 (12) + medianBlur 5 (2) + dilate 3x3 (1).
+# Cropping with this margin gives exactly the same mask inside the spots as
+# filtering the whole frame.
+FILTER_MARGIN = 16
+
+DILATE_KERNEL = np.ones((3, 3), np.uint8)
+
+
+def preprocess(frame, workspace=None):
+    """Run the occupancy filter chain on a BGR frame (or a crop of one)
+
+    With a FrameWorkspace the chain ping-pongs between two reused buffers;
+    the result is then only valid until the next call with that workspace.
+    """
+    if workspace is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        blur = cv2.GaussianBlur(gray, (3, 3), 1)
+        thresh = cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                       cv2.THRESH_BINARY_INV, 25, 16)
+        processed = cv2.medianBlur(thresh, 5)
+        return cv2.dilate(processed, DILATE_KERNEL, iterations=1)
+
+    shape = frame.shape[:2]
+    a = workspace.buffer('filter_a', shape)
+    b = workspace.buffer('filter_b', shape)
+    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=a)
+    cv2.GaussianBlur(a, (3, 3), 1, dst=b)
+    cv2.adaptiveThreshold(b, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                          cv2.THRESH_BINARY_INV, 25, 16, dst=a)
+    cv2.medianBlur(a, 5, dst=b)
+    return cv2.dilate(b, DILATE_KERNEL, dst=a, iterations=1)
+
+
+def analysis_size(width, height, target):
+    """Frame size occupancy is scored at: the source size capped at target width (None: uncapped)"""
+    if not target or width <= target:
+        return width, height
+    return target, max(1, round(height * target / width))
+
+
+def downscale(frame, size, workspace=None):
+    """Resize a frame down to size (width, height) for analysis
+
+    Halves with INTER_AREA (which only has a fast path for a factor of 2)
+    while the frame is at least twice the target, then finishes with
+    INTER_LINEAR: about as cheap as a single linear resize, without its
+    aliasing at large factors. With a workspace every step writes into a
+    reused buffer.
+    """
+    size = (int(size[0]), int(size[1]))
+    height, width = frame.shape[:2]
+    level = 0
+    while width >= 2 * size[0] and height >= 2 * size[1]:
+        width, height = width // 2, height // 2
+        dst = None if workspace is None else workspace.buffer(f'half{level}', (height, width) + frame.shape[2:])
+        frame = cv2.resize(frame, (width, height), dst=dst, interpolation=cv2.INTER_AREA)
+        level += 1
+    if (width, height) != size:
+        dst = None if workspace is None else workspace.buffer('analysis', (size[1], size[0]) + frame.shape[2:])
+        frame = cv2.resize(frame, size, dst=dst, interpolation=cv2.INTER_LINEAR)
+    return frame
+
+
+def scale_positions(positions, from_size, to_size):
+    """Map (x, y, w, h) spots drawn on a from_size frame onto a to_size frame
+
+    Edges are scaled and rounded rather than the width and height, so spots
+    that touch at one resolution still touch at another.
+    """
+    positions = [tuple(int(v) for v in p) for p in positions]
+    if from_size is None or tuple(from_size) == tuple(to_size):
+        return positions
+    sx, sy = to_size[0] / from_size[0], to_size[1] / from_size[1]
+    scaled = []
+    for x, y, w, h in positions:
+        x0, y0 = round(x * sx), round(y * sy)
+        scaled.append((x0, y0, round((x + w) * sx) - x0, round((y + h) * sy) - y0))
+    return scaled
+
+
+class SpotLayout:
+    """Parking positions compiled into index arrays for one frame size
+
+    The filter chain only runs on the union bounding box of the spots (plus
+    FILTER_MARGIN) and every spot's non-zero count comes from a single
+    summed-area table, so scoring N spots costs four fancy-index lookups
+    instead of N Python iterations. Positions drawn at another resolution
+    (reference_size) are scaled to frame_size first.
+    """
+
+    def __init__(self, positions, frame_size, reference_size=None):
+        self._source = positions
+        self.frame_size = (int(frame_size[0]), int(frame_size[1]))
+        self.reference_size = tuple(reference_size) if reference_size else None
+        self.positions = scale_positions(positions, self.reference_size, self.frame_size)
+        width, height = self.frame_size
+
+        pos = np.array(self.positions, dtype=np.int64).reshape(-1, 4)
+        x, y, w, h = pos[:, 0], pos[:, 1], pos[:, 2], pos[:, 3]
+        self.xywh = pos
+
+        # Same rule as the legacy loop: threshold on the nominal area,
+        # count on the part of the spot that is inside the frame
+        self.areas = (w * h).astype(np.float64)
+
+        x0 = np.clip(x, 0, width)
+        y0 = np.clip(y, 0, height)
+        x1 = np.clip(x + w, x0, width)
+        y1 = np.clip(y + h, y0, height)
+
+        # Spot corners clipped to the frame, in frame coordinates
+        self.corners = (x0, y0, x1, y1)
+        self.roi = self._bounding_roi(np.arange(len(self.positions)))
+
+        # Corner indices into the ROI's integral image, shape (H+1, W+1)
+        self._x0, self._y0, self._x1, self._y1 = self.roi_corners(slice(None), self.roi)
+
+    def _bounding_roi(self, spots):
+        """Padded union bounding box of the given spots, clipped to the frame"""
+        width, height = self.frame_size
+        x0, y0, x1, y1 = (c[spots] for c in self.corners)
+        valid = (x1 > x0) & (y1 > y0)
+        if not valid.any():
+            return (0, 0, 0, 0)
+        return (max(int(x0[valid].min()) - FILTER_MARGIN, 0),
+                max(int(y0[valid].min()) - FILTER_MARGIN, 0),
+                min(int(x1[valid].max()) + FILTER_MARGIN, width),
+                min(int(y1[valid].max()) + FILTER_MARGIN, height))
+
+    def roi_corners(self, spots, roi):
+        """Spot corners relative to roi, clipped inside it"""
+        rx0, ry0, rx1, ry1 = roi
+        x0, y0, x1, y1 = (c[spots] for c in self.corners)
+        return ((x0 - rx0).clip(0, rx1 - rx0), (y0 - ry0).clip(0, ry1 - ry0),
+                (x1 - rx0).clip(0, rx1 - rx0), (y1 - ry0).clip(0, ry1 - ry0))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def matches(self, positions, frame_size, reference_size=None):
+        """True if this layout was compiled from this positions list at this frame size
+
+        Checked every frame, so it compares the list by identity rather than
+        walking every spot; callers replace the list when the layout changes.
+        """
+        return (positions is self._source
+                and len(positions) == len(self.positions)
+                and tuple(frame_size) == self.frame_size
+                and (tuple(reference_size) if reference_size else None) == self.reference_size)
+
+    def crop(self, frame):
+        """View of the frame restricted to the padded spot ROI"""
+        rx0, ry0, rx1, ry1 = self.roi
+        return frame[ry0:ry1, rx0:rx1]
+
+    def count_nonzero(self, processed_roi, workspace=None):
+        """Non-zero pixel count of every spot from one summed-area table"""
+        integral = self._integral(processed_roi, workspace)
+        return self._box_sums(integral, self._x0, self._y0, self._x1, self._y1) // 255
+
+    @staticmethod
+    def _integral(processed, workspace):
+        if workspace is None:
+            return cv2.integral(processed, sdepth=cv2.CV_32S)
+        height, width = processed.shape
+        return cv2.integral(processed, sum=workspace.buffer('integral', (height + 1, width + 1), np.int32),
+                            sdepth=cv2.CV_32S)
+
+    @staticmethod
+    def _box_sums(integral, x0, y0, x1, y1):
+        # The dilated mask is strictly 0/255, so sums are 255 * count
+        return (integral[y1, x1].astype(np.int64)
+                - integral[y0, x1]
+                - integral[y1, x0]
+                + integral[y0, x0])
+
+    def score(self, frame, threshold, spots=None, metrics=None, workspace=None):
+        """Return (occupied, counts) for all spots in one call
+
+        occupied is a bool vector in layout order; counts holds the number of
+        edge pixels found in each spot. If spots (an index array) is given,
+        only those spots are scored, the filter chain runs on their bounding
+        box alone and the vectors are in the order of spots. The filter chain
+        and the counting are timed into metrics (a LotMetrics) if given, and
+        run in the buffers of workspace (a FrameWorkspace) if given.
+        """
+        if spots is None:
+            roi = self.crop(frame)
+            if roi.size == 0:
+                counts = np.zeros(len(self.positions), dtype=np.int64)
+            else:
+                start = time.perf_counter()
+                processed = preprocess(roi, workspace)
+                filtered = time.perf_counter()
+                counts = self.count_nonzero(processed, workspace)
+                if metrics is not None:
+                    metrics.observe('preprocess', filtered - start)
+                    metrics.observe('score', time.perf_counter() - filtered)
+            return counts > self.areas * threshold, counts
+
+        spots = np.asarray(spots, dtype=np.int64)
+        roi = self._bounding_roi(spots)
+        rx0, ry0, rx1, ry1 = roi
+        if rx1 <= rx0 or ry1 <= ry0:
+            counts = np.zeros(len(spots), dtype=np.int64)
+        else:
+            start = time.perf_counter()
+            processed = preprocess(frame[ry0:ry1, rx0:rx1], workspace)
+            filtered = time.perf_counter()
+            integral = self._integral(processed, workspace)
+            counts = self._box_sums(integral, *self.roi_corners(spots, roi)) // 255
+            if metrics is not None:
+                metrics.observe('preprocess', filtered - start)
+                metrics.observe('score', time.perf_counter() - filtered)
+        return counts > self.areas[spots] * threshold, counts
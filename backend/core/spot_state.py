@@ -0,0 +1,177 @@
+import threading
+
+import numpy as np
+
+
+class SpotEventLog:
+    """Bounded ring buffer of spot state changes with a monotonic sequence number
+
+    Memory is fixed at `capacity` events whatever the number of spots or the
+    event rate. Clients that fall further behind than the buffer (or that
+    have never synced) are told to reset from a full state snapshot, which
+    the log keeps up to date from the changes it records. Since every change
+    goes through reset() and append(), replaying those calls elsewhere (e.g.
+    in another process) gives an identical log.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._seq = np.zeros(capacity, dtype=np.int64)
+        self._spot = np.zeros(capacity, dtype=np.int32)
+        self._state = np.zeros(capacity, dtype=bool)
+        self._time = np.zeros(capacity, dtype=np.float64)
+        self._lock = threading.Lock()
+        self.next_seq = 1
+        self.valid_from = 1  # First event sequence number of the current layout
+        self.occupied = np.zeros(0, dtype=bool)
+        self.last_change = np.zeros(0, dtype=np.float64)
+
+    @property
+    def latest_seq(self):
+        return self.next_seq - 1
+
+    def reset(self, occupied, timestamp):
+        """Start over from a full state, e.g. after the spot layout changed
+
+        Burns one sequence number so that clients synced to the old state
+        are always behind valid_from and get a reset.
+        """
+        with self._lock:
+            self.occupied = np.array(occupied, dtype=bool)
+            self.last_change = np.full(len(self.occupied), timestamp, dtype=np.float64)
+            self.next_seq += 1
+            self.valid_from = self.next_seq
+
+    def append(self, spots, states, timestamp):
+        """Record that each spot in spots changed to the matching state"""
+        count = len(spots)
+        if count == 0:
+            return
+        with self._lock:
+            self.occupied[spots] = states
+            self.last_change[spots] = timestamp
+            # Only the newest `capacity` events of a huge burst can be kept
+            if count > self.capacity:
+                self.next_seq += count - self.capacity
+                spots, states = spots[-self.capacity:], states[-self.capacity:]
+                count = self.capacity
+            seqs = np.arange(self.next_seq, self.next_seq + count)
+            slots = seqs % self.capacity
+            self._seq[slots] = seqs
+            self._spot[slots] = spots
+            self._state[slots] = states
+            self._time[slots] = timestamp
+            self.next_seq += count
+
+    def since(self, seq, limit=1000):
+        """Events after seq as (events, reset, more)
+
+        reset is True when the caller can't catch up incrementally and has to
+        reload the full state.
+        """
+        with self._lock:
+            oldest = max(self.next_seq - self.capacity, 1)
+            if seq >= self.next_seq or seq + 1 < max(oldest, self.valid_from):
+                return [], True, False
+            end = min(self.next_seq, seq + 1 + limit)
+            slots = np.arange(seq + 1, end) % self.capacity
+            events = [{'seq': int(s), 'spot': int(p), 'occupied': bool(o), 'time': float(t)}
+                      for s, p, o, t in zip(self._seq[slots], self._spot[slots],
+                                            self._state[slots], self._time[slots])]
+            return events, False, end < self.next_seq
+
+    def snapshot(self):
+        """Consistent (occupied bool array, last_change, latest event seq)"""
+        with self._lock:
+            return self.occupied.copy(), self.last_change.copy(), self.latest_seq
+
+    def export(self, since=None):
+        """Copy of the log, for mirroring it into another process
+
+        With `since` (the next_seq of an earlier export) only the events
+        recorded after it are copied, with their ring 'slots' and the
+        current state of the spots they touched ('spots'). It falls back to
+        a full copy ('slots' None) if the log was reset or wrapped past
+        `since` in the meantime.
+        """
+        with self._lock:
+            exported = {'next_seq': self.next_seq, 'valid_from': self.valid_from}
+            if since is None or since < self.valid_from or self.next_seq - since > self.capacity:
+                exported.update(slots=None, seq=self._seq.copy(), spot=self._spot.copy(),
+                                state=self._state.copy(), time=self._time.copy(),
+                                occupied=self.occupied.copy(), last_change=self.last_change.copy())
+                return exported
+            slots = np.arange(since, self.next_seq) % self.capacity
+            spots = np.unique(self._spot[slots])
+            exported.update(slots=slots, seq=self._seq[slots], spot=self._spot[slots],
+                            state=self._state[slots], time=self._time[slots], spots=spots,
+                            occupied=self.occupied[spots], last_change=self.last_change[spots])
+            return exported
+
+    def load(self, exported):
+        """Replace the log with an export() from a log of the same capacity"""
+        with self._lock:
+            self.next_seq = int(exported['next_seq'])
+            self.valid_from = int(exported['valid_from'])
+            self._seq[:] = exported['seq']
+            self._spot[:] = exported['spot']
+            self._state[:] = exported['state']
+            self._time[:] = exported['time']
+            self.occupied = np.array(exported['occupied'], dtype=bool)
+            self.last_change = np.array(exported['last_change'], dtype=np.float64)
+
+
+class SpotStateTracker:
+    """Debounced occupancy state of every spot in a lot
+
+    A spot turns occupied when its edge ratio rises above `high` and free
+    when it drops below `low`; in between it keeps its state. A new state
+    also has to hold for `min_dwell` seconds before it is committed. The
+    state is kept as a packed bitset plus the time of each spot's last
+    change; the first result resets the event log and every committed
+    change after that is appended to it.
+    """
+
+    def __init__(self, spot_count, high, low, min_dwell, log):
+        self.spot_count = spot_count
+        self.high = high
+        self.low = low
+        self.min_dwell = min_dwell
+        self.log = log
+        self.bits = np.zeros((spot_count + 7) // 8, dtype=np.uint8)
+        self.last_change = np.zeros(spot_count, dtype=np.float64)
+        self._pending_since = np.full(spot_count, np.nan)
+        self._initialized = False
+
+    @property
+    def occupied(self):
+        return np.unpackbits(self.bits, count=self.spot_count).astype(bool)
+
+    def update(self, ratios, now):
+        """Apply the latest edge ratios; returns the indices of spots that changed"""
+        occupied = self.occupied
+        desired = occupied.copy()
+        desired[ratios > self.high] = True
+        desired[ratios < self.low] = False
+
+        if not self._initialized:
+            # First result is taken as-is; clients pick it up via reset
+            self._initialized = True
+            self.bits = np.packbits(desired)
+            self.last_change[:] = now
+            self.log.reset(desired, now)
+            return np.zeros(0, dtype=np.int64)
+
+        differs = desired != occupied
+        self._pending_since[~differs] = np.nan
+        started = differs & np.isnan(self._pending_since)
+        self._pending_since[started] = now
+
+        changed = np.flatnonzero(differs & (now - self._pending_since >= self.min_dwell))
+        if len(changed):
+            occupied[changed] = desired[changed]
+            self.bits = np.packbits(occupied)
+            self.last_change[changed] = now
+            self._pending_since[changed] = np.nan
+            self.log.append(changed, occupied[changed], now)
+        return changed
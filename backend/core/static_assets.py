@@ -0,0 +1,112 @@
+"""The built frontend, served from memory
+
+`vite build` writes the app into backend/static, with fingerprinted bundles
+(name-<hash>.js/.css) under assets/. Every file is read once, with gzip
+and (if the brotli package is installed) brotli variants compressed ahead
+of time, so a request does no disk I/O and no compression. Fingerprinted
+files never change under the same name and are cached by browsers for a
+year; everything else, index.html included, is revalidated with its ETag.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+MAX_FILE_BYTES = 8 << 20  # Larger files are left on disk
+MIN_COMPRESS_BYTES = 256  # Smaller bodies don't gain from compression
+
+# Vite's default asset names: assets/<name>-<8+ char hash>.<ext>
+FINGERPRINTED = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Types worth compressing; images and fonts already are
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                'image/svg+xml', 'application/manifest+json', 'application/wasm')
+
+
+class StaticAsset:
+    """One file's bytes, precompressed variants and response headers"""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = IMMUTABLE if FINGERPRINTED.search(path) else REVALIDATE
+        self.variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES and self.mimetype.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+    def negotiate(self, accept_encodings):
+        """(content coding, body) for a request's Accept-Encoding (request.accept_encodings)"""
+        for coding in ('br', 'gzip'):
+            if coding in self.variants and accept_encodings.quality(coding) > 0:
+                return coding, self.variants[coding]
+        return 'identity', self.variants['identity']
+
+    def nbytes(self):
+        return sum(len(body) for body in self.variants.values())
+
+
+class StaticAssets:
+    """Every file of a built frontend directory, loaded on first use
+
+    get() returns None for paths that aren't cached: missing files, files
+    over MAX_FILE_BYTES and anything outside the directory.
+    """
+
+    def __init__(self, root, index='index.html'):
+        self.root = Path(root)
+        self.index_name = index
+        self.assets = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        assets = {}
+        if self.root.is_dir():
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    file_path = Path(directory) / name
+                    if file_path.stat().st_size > MAX_FILE_BYTES:
+                        continue
+                    path = file_path.relative_to(self.root).as_posix()
+                    assets[path] = StaticAsset(path, file_path.read_bytes())
+        self.assets = assets
+        return assets
+
+    def _loaded(self):
+        assets = self.assets
+        if assets is None:
+            with self._lock:
+                assets = self.assets if self.assets is not None else self.load()
+        return assets
+
+    def get(self, path):
+        return self._loaded().get(path)
+
+    @property
+    def index(self):
+        return self.get(self.index_name)
+
+    def stats(self):
+        assets = self._loaded()
+        return {
+            'files': len(assets),
+            'bytes': sum(asset.nbytes() for asset in assets.values()),
+            'brotli': brotli is not None
+        }
@@ -0,0 +1,144 @@
+import threading
+
+import cv2
+import numpy as np
+
+# Encoded variants a client can ask for with /api/video-stream?rendition=
+RENDITIONS = {
+    'full': {'width': None, 'quality': 80},   # Source resolution
+    'thumb': {'width': 320, 'quality': 50},   # Dashboard thumbnail
+}
+
+
+def encode_jpeg(frame, width=None, quality=80):
+    """JPEG-encode a frame, downscaling it to the given width first"""
+    if width is not None and frame.shape[1] > width:
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes() if ret else None
+
+
+def encode_renditions(frame, subscriber_counts):
+    """{rendition: jpeg bytes} for every rendition with subscribers"""
+    encoded = {}
+    for name, count in subscriber_counts.items():
+        if count > 0:
+            options = RENDITIONS[name]
+            data = encode_jpeg(frame, options['width'], options['quality'])
+            if data is not None:
+                encoded[name] = data
+    return encoded
+
+
+class RenditionCache:
+    """Latest processed frame of one lot and its encoded renditions
+
+    Frames are only encoded while someone is subscribed to the stream, and
+    each rendition is encoded at most once per frame sequence number however
+    many clients read it.
+
+    publish() copies the frame, so the caller may draw the next one into
+    the same buffer. The copies go into buffers of the cache's own, which
+    are recycled once they are neither the newest frame nor being encoded.
+    """
+
+    SPARE_BUFFERS = 2
+
+    def __init__(self, renditions=None):
+        self.renditions = dict(renditions or RENDITIONS)
+        self.subscribers = {name: 0 for name in self.renditions}
+        self.encode_count = 0
+        self._lock = threading.Lock()
+        self._encode_locks = {name: threading.Lock() for name in self.renditions}
+        self._seq = 0
+        self._frame = None  # The cache's copy of the newest frame
+        self._encoded = {}  # {rendition: (seq, jpeg bytes)}
+        self._readers = {}  # {id(frame buffer): encodes reading it}
+        self._spare = []  # Frame buffers free for the next publish()
+
+    def subscribe(self, rendition):
+        with self._lock:
+            self.subscribers[rendition] += 1
+
+    def unsubscribe(self, rendition):
+        with self._lock:
+            self.subscribers[rendition] = max(0, self.subscribers[rendition] - 1)
+
+    def has_subscribers(self):
+        return any(self.subscribers.values())
+
+    def _recycle(self, buffer):
+        """Keep a replaced frame buffer for reuse unless an encode still reads it (lock held)"""
+        if buffer is not None and id(buffer) not in self._readers and len(self._spare) < self.SPARE_BUFFERS:
+            self._spare.append(buffer)
+
+    def publish(self, seq, frame):
+        """Store a copy of the newest processed frame; renditions are encoded on demand"""
+        with self._lock:
+            index = next((i for i, spare in enumerate(self._spare)
+                          if spare.shape == frame.shape and spare.dtype == frame.dtype), None)
+            buffer = self._spare.pop(index) if index is not None else None
+        if buffer is None:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        with self._lock:
+            self._recycle(self._frame)
+            self._seq = seq
+            self._frame = buffer
+
+    def put_encoded(self, seq, encoded):
+        """Store renditions encoded elsewhere (e.g. by an analysis process)"""
+        with self._lock:
+            self._recycle(self._frame)
+            self._seq = seq
+            self._frame = None
+            for name, data in encoded.items():
+                self._encoded[name] = (seq, data)
+
+    def encode_active(self):
+        """Encode the newest frame for every rendition that has subscribers"""
+        for name, count in list(self.subscribers.items()):
+            if count > 0:
+                self.get(name)
+
+    def get(self, rendition, encode=True):
+        """Return (seq, jpeg bytes) of the newest frame, or (0, None) before the first one
+
+        With encode=False, returns None rather than encoding the newest
+        frame (or waiting for another reader's encode of it).
+        """
+        with self._lock:
+            seq, frame = self._seq, self._frame
+            cached = self._encoded.get(rendition)
+            if cached is not None and cached[0] == seq:
+                return cached
+            if frame is None:
+                # Nothing to encode from here; serve the newest encoded frame we have
+                return cached if cached is not None else (0, None)
+            if not encode:
+                return None
+            self._readers[id(frame)] = self._readers.get(id(frame), 0) + 1  # Not reused while encoding
+
+        try:
+            # One encode per (rendition, seq): concurrent readers wait for it
+            with self._encode_locks[rendition]:
+                cached = self._encoded.get(rendition)
+                if cached is not None and cached[0] == seq:
+                    return cached
+                options = self.renditions[rendition]
+                data = encode_jpeg(frame, options['width'], options['quality'])
+                if data is None:
+                    return cached if cached is not None else (0, None)
+                self.encode_count += 1
+                entry = (seq, data)
+                with self._lock:
+                    self._encoded[rendition] = entry
+                return entry
+        finally:
+            with self._lock:
+                self._readers[id(frame)] -= 1
+                if not self._readers[id(frame)]:
+                    del self._readers[id(frame)]
+                    if frame is not self._frame:
+                        self._recycle(frame)
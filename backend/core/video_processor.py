@@ -0,0 +1,425 @@
+import time
+
+import cv2
+import numpy as np
+
+from core.layout_file import LayoutWatcher, load_layout
+from core.loop_cache import CachedFrame, cache_key, open_loop_cache
+from core.metrics import LotMetrics
+from core.overlay import SpotOverlay, StatusBanner
+from core.pipeline import LatestQueue, PipelineStage
+from core.spot_classifier import load_classifier
+from core.spot_layout import scale_positions
+from core.stream_cache import encode_renditions
+from core.workspace import FrameWorkspace
+
+# A cache miss this few frames ahead of the capture is reached by reading
+# forward; further ones seek (which decodes from the previous keyframe)
+MAX_SKIP_FRAMES = 30
+
+
+class VideoProcessor:
+    """Decode, analyse and encode one lot's video
+
+    Results go to `publisher`, which either applies them to the API state
+    directly (same process) or forwards them from an analysis worker
+    process. It provides update_lot(), is_streaming(), subscriber_counts(),
+    publish_frame(), publish_encoded() and event_log().
+
+    Spots are scored and debounced by the monitor's OccupancyEngine, in
+    which this processor keeps its lot's state (`state`).
+    """
+    
+    def __init__(self, lot, monitor, publisher):
+        self.lot = lot
+        self.monitor = monitor
+        self.publisher = publisher
+        self.positions = []
+        self.reference_size = None  # Frame size the positions were drawn on, if known
+        self.layout_watcher = LayoutWatcher(lot.layout)
+        self.overlay_positions = []  # Positions at the source resolution, for drawing
+        self.overlay_layout = None  # Engine layout overlay_positions were scaled for
+        self.overlay = None  # Outlines of overlay_positions, redrawn only where a spot changed
+        self.banner = StatusBanner()
+        self.classifier = load_classifier(lot.classifier, lot.classifier_model, monitor)
+        self.event_log = publisher.event_log(lot.id)
+        self.last_analysis = float('-inf')
+        self.cap = None
+        self.fps = 30  # Default FPS
+        self.frame_delay = 1.0 / 30  # Default delay between frames
+        self.lot_key = lot.key
+        self.lot_id = lot.id
+        
+        # Decode -> analyze -> encode pipeline joined by drop-oldest queues
+        self.metrics = LotMetrics()
+        self.decoded_count = 0
+        self.decode_restarts = 0
+        self.decode_errors = 0
+        self.decode_fps = 0.0  # Measured over the last 100 frames
+        self.analyze_queue = LatestQueue(maxsize=2, max_age=0.5)
+        self.encode_queue = LatestQueue(maxsize=2, max_age=0.5)
+        self.analyze_stage = PipelineStage(f'analyze-lot{self.lot_id}', self.analyze_frame,
+                                           self.analyze_queue, self.encode_queue,
+                                           self.metrics.stages['analyze'])
+        self.encode_stage = PipelineStage(f'encode-lot{self.lot_id}', self.encode_frame,
+                                          self.encode_queue, histogram=self.metrics.stages['encode'])
+        
+        # Filter, resize and overlay buffers reused from frame to frame. An
+        # overlay frame can sit in the encode queue and in the encoder (the
+        # stream cache keeps a copy), so it is only overwritten after that
+        # many newer ones
+        self.workspace = FrameWorkspace()
+        self.overlay_buffers = self.encode_queue.maxsize + 2
+        self.engine = monitor.engine
+        self.state = self.engine.add_lot(self.lot_key, classifier=self.classifier,
+                                         analysis_width=lot.analysis_width, event_log=self.event_log,
+                                         workspace=self.workspace, metrics=self.metrics)
+        
+        # Results of a looped file source by frame index (see core.loop_cache);
+        # pipeline items carry a (cache, frame index) slot to store them under
+        self.loop_cache = None
+        self.frame_index = 0  # Of the next frame handed to the pipeline
+        self.cap_index = 0  # Of the next frame cap.read() returns
+        self.frame_seq = 0
+        
+        self.setup_video()
+    
+    def setup_video(self):
+        """Initialize video capture and load positions"""
+        try:
+            if self.lot.layout.exists():
+                stored = load_layout(self.lot.layout)
+                self.positions = stored.positions
+                self.reference_size = stored.frame_size
+                self.engine.set_positions(self.lot_key, self.positions, self.reference_size)
+                self.layout_watcher.current_hash = stored.hash
+                self.publisher.update_lot(self.lot_key, total=len(self.positions))
+                print(f"Loaded {len(self.positions)} positions for lot {self.lot_id}")
+            
+            if not self.lot.is_file or self.lot.source.exists():
+                source = self.lot.source if isinstance(self.lot.source, int) else str(self.lot.source)
+                self.cap = cv2.VideoCapture(source)
+                if self.cap.isOpened():
+                    # Get actual FPS from video
+                    self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+                    if self.fps <= 0:
+                        self.fps = 30  # Fallback FPS
+                    
+                    self.frame_delay = 1.0 / self.fps
+                    print(f"Video {self.lot_id} FPS: {self.fps}")
+                    
+                    # Set buffer size to reduce latency
+                    self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                    self.open_loop_cache()
+                else:
+                    print(f"Failed to open video {self.lot_id}")
+                    self.cap = None
+            else:
+                print(f"Video file not found: {self.lot.source}")
+                
+        except Exception as e:
+            print(f"Error setting up video {self.lot_id}: {e}")
+            self.cap = None
+    
+    def reload_layout(self):
+        """Pick up an edited layout file without restarting
+        
+        Runs on the analysis thread, so the next update_occupancy() compiles
+        the new positions and swaps them in between two frames.
+        """
+        stored = self.layout_watcher.poll()
+        if stored is None:
+            return False
+        self.positions = stored.positions
+        self.reference_size = stored.frame_size
+        self.engine.set_positions(self.lot_key, self.positions, self.reference_size)
+        if self.positions:
+            self.publisher.update_lot(self.lot_key, total=len(self.positions))
+        else:
+            self.publisher.update_lot(self.lot_key, total=0, available=0, occupied=0)
+        print(f"Reloaded {len(self.positions)} positions for lot {self.lot_id}")
+        self.open_loop_cache()
+        return True
+    
+    def open_loop_cache(self):
+        """Start the loop cache for the current source, layout and detector settings
+        
+        Frames queued under the previous cache are dropped by analyze_frame
+        or stored under that cache, never this one.
+        """
+        if not self.lot.loop_cache or not self.lot.is_file or self.cap is None:
+            return
+        capacity = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if capacity <= 0:
+            print(f"Frame count of lot {self.lot_id} unknown, not caching its loop")
+            return
+        width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        monitor = self.monitor
+        params = {
+            'analysis_size': self.state.analysis_size(width, height),
+            **self.classifier.params(),
+            'min_dwell': monitor.MIN_DWELL,
+            'analysis_fps': monitor.ANALYSIS_FPS,
+            'change_tolerance': monitor.CHANGE_TOLERANCE,
+            'full_rescore_interval': monitor.FULL_RESCORE_INTERVAL
+        }
+        try:
+            key = cache_key(self.lot.source, self.layout_watcher.current_hash, params)
+            self.loop_cache = open_loop_cache(self.lot, key, capacity)
+        except OSError as e:
+            print(f"Loop cache for lot {self.lot_id} unavailable: {e}")
+            self.loop_cache = None
+    
+    @property
+    def layout(self):
+        """Spot layout at the analysis resolution, once a frame was analysed"""
+        return self.state.layout
+    
+    @property
+    def ratios(self):
+        """Latest classifier score per spot"""
+        return self.state.scores
+    
+    @property
+    def occupied(self):
+        """Current debounced occupancy per spot"""
+        return self.state.occupied
+    
+    def update_occupancy(self, frame):
+        """Re-score the spots whose region changed since they were last scored"""
+        self.engine.update(self.lot_key, frame)
+        # Outlines are drawn at the source resolution
+        if self.overlay_layout is not self.state.layout:
+            height, width = frame.shape[:2]
+            self.overlay_positions = scale_positions(self.positions, self.reference_size or (width, height),
+                                                     (width, height))
+            self.overlay_layout = self.state.layout
+    
+    def process_single_frame(self, frame, draw=True, analyze=True):
+        """Process a single frame for parking detection
+        
+        With analyze=False the last occupancy result is reused, and with
+        draw=False only the free count is computed and no overlay frame is
+        returned.
+        """
+        if not self.positions:
+            return frame, 0
+        
+        if analyze or self.layout is None:
+            self.update_occupancy(frame)
+        occupied = self.occupied
+        free_count = int(len(occupied) - occupied.sum())
+        
+        if not draw:
+            return None, free_count
+        
+        # Composite the overlay onto a copy, in a reused buffer; the outlines
+        # are only re-rendered for spots whose state changed
+        start = time.perf_counter()
+        height, width = frame.shape[:2]
+        if self.overlay is None or not self.overlay.matches(self.overlay_positions, (width, height)):
+            self.overlay = SpotOverlay(self.overlay_positions, (width, height))
+        self.overlay.update(occupied)
+        processed_frame = self.workspace.ring('overlay', frame.shape, self.overlay_buffers)
+        np.copyto(processed_frame, frame)
+        self.overlay.draw(processed_frame)
+        self.banner.draw(processed_frame, f"Free: {free_count}/{len(self.positions)}")
+        self.metrics.observe('draw', time.perf_counter() - start)
+        
+        return processed_frame, free_count
+    
+    def analyze_frame(self, item):
+        """Analysis stage: detect occupancy and update parking data"""
+        seq, frame, slot = item
+        if self.reload_layout():
+            self.last_analysis = float('-inf')  # Score the new layout right away
+        
+        # Only draw and forward the overlay frame while the stream is watched
+        streaming = self.publisher.is_streaming(self.lot_id)
+        if isinstance(frame, CachedFrame):
+            return self.replay_frame(seq, frame, streaming)
+        
+        # Occupancy is analysed at ANALYSIS_FPS; frames in between only get the overlay
+        now = time.monotonic()
+        analyze = now - self.last_analysis >= 1.0 / self.monitor.ANALYSIS_FPS
+        if not analyze and not streaming:
+            if slot is not None:
+                slot[0].store_analysis(slot[1], None)
+            return None
+        
+        processed_frame, free_count = self.process_single_frame(frame, draw=streaming, analyze=analyze)
+        if slot is not None:
+            slot[0].store_analysis(slot[1], self.ratios if analyze and self.positions else None)
+        if not analyze:
+            return seq, processed_frame, slot
+        self.last_analysis = now
+        
+        # Update parking data
+        occupied_count = len(self.positions) - free_count
+        start = time.perf_counter()
+        self.publisher.update_lot(self.lot_key, available=free_count, occupied=occupied_count)
+        self.metrics.observe('publish', time.perf_counter() - start)
+        
+        if not streaming:
+            return None
+        return seq, processed_frame, slot
+    
+    def replay_frame(self, seq, cached, streaming):
+        """Analysis stage for a frame served from the loop cache
+        
+        The stored ratios go through the spot state tracker like fresh ones,
+        so counts and events are still live; the overlay comes pre-encoded.
+        """
+        if self.loop_cache is None or cached.key != self.loop_cache.key:
+            return None  # Looked up before a layout change
+        if (cached.ratios is not None and self.layout is not None
+                and len(cached.ratios) == len(self.ratios)):
+            self.engine.apply_scores(self.lot_key, cached.ratios)
+            self.last_analysis = time.monotonic()
+            
+            free_count = int(len(self.occupied) - self.occupied.sum())
+            start = time.perf_counter()
+            self.publisher.update_lot(self.lot_key, available=free_count,
+                                      occupied=len(self.positions) - free_count)
+            self.metrics.observe('publish', time.perf_counter() - start)
+        
+        if not streaming or not cached.encoded:
+            return None
+        return seq, cached, None
+    
+    def encode_frame(self, item):
+        """Encoder stage: JPEG-encode the renditions current viewers asked for"""
+        seq, processed_frame, slot = item
+        if isinstance(processed_frame, CachedFrame):
+            self.publisher.publish_encoded(self.lot_id, seq, processed_frame.encoded)
+        elif slot is not None:
+            # Encode here rather than in the publisher, to keep the JPEGs
+            encoded = encode_renditions(processed_frame, self.publisher.subscriber_counts(self.lot_id))
+            slot[0].store_encoded(slot[1], encoded)
+            self.publisher.publish_encoded(self.lot_id, seq, encoded)
+        else:
+            self.publisher.publish_frame(self.lot_id, seq, processed_frame)
+    
+    def cached_frame(self):
+        """The next frame's results from the loop cache, or None to decode it"""
+        cache = self.loop_cache
+        if cache is None or self.layout is None:
+            return None
+        if cache.frame_count and self.frame_index >= cache.frame_count:
+            self.frame_index = 0
+            self.decode_restarts += 1
+        counts = self.publisher.subscriber_counts(self.lot_id)
+        return cache.lookup(self.frame_index, [name for name, count in counts.items() if count])
+    
+    def seek_capture(self):
+        """Move the capture to frame_index after frames were served from the cache"""
+        gap = self.frame_index - self.cap_index
+        if 0 < gap <= MAX_SKIP_FRAMES:
+            for _ in range(gap):
+                self.cap.grab()
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
+        self.cap_index = self.frame_index
+    
+    def pipeline_stats(self):
+        """Queue depth and drop counts for every stage of this lot"""
+        return {
+            'decode': {
+                'frames': self.decoded_count,
+                'restarts': self.decode_restarts,
+                'errors': self.decode_errors,
+                'fps': round(self.decode_fps, 1)
+            },
+            'analyze': self.analyze_stage.stats(),
+            'motion': {
+                'analysis_size': self.layout.frame_size if self.layout is not None else None,
+                'classifier': self.classifier.name,
+                'analyses': self.state.analyses,
+                'spots_scored': self.state.spots_scored,
+                'spots_skipped': self.state.spots_skipped
+            },
+            'encode': self.encode_stage.stats(),
+            'loop_cache': self.loop_cache.stats() if self.loop_cache is not None else None,
+            'timings': self.metrics.to_dict()
+        }
+    
+    def run_processing(self):
+        """Decoder loop for this video, feeding the analysis and encoder stages
+        
+        Each stage runs on its own thread and they are joined by small
+        drop-oldest queues, so a slow analysis or encode skips stale frames
+        instead of delaying the decoder. OpenCV releases the GIL while
+        decoding, filtering and encoding, so the stages overlap on multi-core
+        machines.
+        
+        With a loop cache, frames whose results are cached skip decoding and
+        go through the stages as CachedFrames.
+        """
+        if not self.cap:
+            print(f"No video capture available for lot {self.lot_id}")
+            return
+        
+        self.analyze_stage.start()
+        self.encode_stage.start()
+        
+        last_report = time.monotonic()
+        next_frame_time = time.time()
+        
+        while True:
+            try:
+                frame = self.cached_frame()
+                slot = None
+                if frame is None:
+                    if self.loop_cache is not None and self.cap_index != self.frame_index:
+                        self.seek_capture()
+                    start = time.perf_counter()
+                    ret, frame = self.cap.read()
+                    self.metrics.observe('decode', time.perf_counter() - start)
+                    if self.loop_cache is not None:
+                        slot = (self.loop_cache, self.frame_index)
+                else:
+                    ret = True
+                if not ret:
+                    self.decode_restarts += 1
+                    if self.lot.is_file:
+                        # Loop video when it ends
+                        if self.loop_cache is not None:
+                            self.loop_cache.set_frame_count(self.frame_index)
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        self.frame_index = self.cap_index = 0
+                    else:
+                        # Camera dropped - reconnect
+                        print(f"Lost video source for lot {self.lot_id}, reconnecting")
+                        self.cap.release()
+                        time.sleep(1.0)
+                        self.cap.open(self.lot.source if isinstance(self.lot.source, int) else str(self.lot.source))
+                    continue
+                
+                if not isinstance(frame, CachedFrame):
+                    self.decoded_count += 1
+                    self.cap_index += 1
+                self.frame_index += 1
+                self.frame_seq += 1
+                self.analyze_queue.put((self.frame_seq, frame, slot))
+                
+                # Frame rate control - maintain video's original speed
+                next_frame_time += self.frame_delay
+                delay = next_frame_time - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind (e.g. after a stall) - don't try to catch up
+                    next_frame_time = time.time()
+                
+                # Frame rate over the last 100 frames, exported as a gauge
+                if self.frame_seq % 100 == 0:
+                    now = time.monotonic()
+                    self.decode_fps = 100 / (now - last_report)
+                    last_report = now
+                
+            except Exception as e:
+                # Counted in the errors metric; back off so a broken source doesn't spin
+                self.decode_errors += 1
+                print(f"Error decoding frame for lot {self.lot_id}: {e}")
+                time.sleep(0.1)
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class FrameWorkspace:
+    """Preallocated intermediate buffers for one lot's frame hot loop
+
+    OpenCV calls write into these through dst= instead of returning a fresh
+    array per call. Buffers only grow: asking for a smaller shape returns a
+    view of the existing buffer (OpenCV accepts strided views as dst), so
+    the per-frame ROIs of motion-gated scoring don't reallocate. clear()
+    drops everything, e.g. when the resolution changes.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self._rings = {}
+        self.allocations = 0  # Buffers allocated so far, for stats
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """Array of exactly this shape, reused from the previous call with this name"""
+        shape = tuple(int(n) for n in shape)
+        buf = self._buffers.get(name)
+        if (buf is None or buf.dtype != dtype or buf.ndim != len(shape)
+                or any(have < want for have, want in zip(buf.shape, shape))):
+            if buf is not None and buf.ndim == len(shape):
+                shape_alloc = tuple(max(have, want) for have, want in zip(buf.shape, shape))
+            else:
+                shape_alloc = shape
+            buf = np.empty(shape_alloc, dtype)
+            self._buffers[name] = buf
+            self.allocations += 1
+        if buf.shape == shape:
+            return buf
+        return buf[tuple(slice(0, n) for n in shape)]
+
+    def ring(self, name, shape, count, dtype=np.uint8):
+        """Next of `count` buffers of this shape, in rotation
+
+        For outputs handed to another thread: a buffer is only written again
+        after count - 1 newer ones, so it must not be referenced for longer
+        than that.
+        """
+        shape = tuple(int(n) for n in shape)
+        ring = self._rings.get(name)
+        if ring is None or ring[0][0].shape != shape or ring[0][0].dtype != dtype or len(ring[0]) != count:
+            ring = ([np.empty(shape, dtype) for _ in range(count)], [0])
+            self._rings[name] = ring
+            self.allocations += count
+        buffers, position = ring
+        buf = buffers[position[0]]
+        position[0] = (position[0] + 1) % count
+        return buf
+
+    def clear(self):
+        self._buffers.clear()
+        self._rings.clear()
+
+    def nbytes(self):
+        return (sum(buf.nbytes for buf in self._buffers.values())
+                + sum(buf.nbytes for buffers, _ in self._rings.values() for buf in buffers))
@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+
+import asgi
+from core.broadcast import FrameHub
+from core.stream_cache import RenditionCache
+
+
+class RacingHub(FrameHub):
+    """A frame is published while the first executor-side next_frame() runs, which then comes back empty"""
+
+    raced = False
+
+    def next_frame(self, viewer, encode=True):
+        if encode and not self.raced:
+            self.raced = True
+            self.publish_frame(2)
+            return None
+        return super().next_frame(viewer, encode)
+
+    def publish_frame(self, seq):
+        self.cache.publish(seq, np.full((48, 64, 3), seq, np.uint8))
+        self.publish(seq)
+
+
+def test_a_frame_published_during_the_executor_fetch_is_not_missed(monkeypatch):
+    hub = RacingHub(RenditionCache())
+    monkeypatch.setitem(asgi.web.stream_hubs, 'race', hub)
+
+    async def run():
+        monkeypatch.setitem(asgi._frame_wakeups, 'race', asgi.Wakeup(asyncio.get_running_loop()))
+        monkeypatch.setattr(asgi, '_parking_wakeup', asgi.Wakeup(asyncio.get_running_loop()))
+        hub.add_listener(asgi._frame_wakeups['race'].set)
+        hub.publish_frame(1)  # Not encoded: the stream goes to the executor for it
+
+        parts, gone = asyncio.Queue(), asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message.get('more_body'):
+                await parts.put(message['body'])
+
+        stream = asyncio.ensure_future(asgi.video_stream({}, receive, send, {'lot': 'race', 'rendition': 'thumb'}))
+        try:
+            # Frame 2 arrives well within FRAME_TIMEOUT, not as a resend after it
+            part = await asyncio.wait_for(parts.get(), timeout=1.0)
+            assert part == asgi.web.mjpeg_part('race', hub.cache.get('thumb')[1])
+        finally:
+            gone.set()
+            await asyncio.wait_for(stream, timeout=1.0)
+
+    asyncio.run(run())
@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+
+from core.broadcast import PENDING, FrameHub
+from core.stream_cache import RenditionCache
+
+
+def test_next_frame_without_encoding_leaves_the_viewer_pending():
+    hub = FrameHub(RenditionCache())
+    viewer = hub.subscribe('thumb')
+    assert hub.next_frame(viewer, encode=False) is None
+
+    hub.cache.publish(1, np.zeros((48, 64, 3), np.uint8))
+    hub.publish(1)
+    assert hub.next_frame(viewer, encode=False) is PENDING
+    assert viewer.last_seq == 0
+    assert hub.cache.encode_count == 0
+
+    data = hub.next_frame(viewer)
+    assert data.startswith(b'\xff\xd8')
+    assert viewer.last_seq == 1
+    assert viewer.delivered == 1
+
+
+def test_next_frame_serves_renditions_the_publisher_encoded():
+    hub = FrameHub(RenditionCache())
+    viewer = hub.subscribe('full')
+
+    def publish(seq):
+        hub.cache.publish(seq, np.full((48, 64, 3), seq, np.uint8))
+        hub.cache.encode_active()
+        hub.publish(seq)
+
+    publish(1)
+    assert hub.next_frame(viewer, encode=False) == hub.cache.get('full')[1]
+    for seq in (2, 3, 4):
+        publish(seq)
+    data = hub.next_frame(viewer, encode=False)
+    assert data == hub.cache.get('full')[1]
+    assert viewer.skipped == 2
+    assert hub.next_frame(viewer, encode=False) is None
+    assert hub.cache.encode_count == 4
+
+
+def test_still_frame_hold_counts_once_and_lapses():
+    hub = FrameHub(RenditionCache())
+    assert hub.hold('thumb', 0.2)
+    assert not hub.hold('thumb', 0.2)  # Renewed, not stacked
+    assert hub.cache.subscribers == {'full': 0, 'thumb': 1}
+    assert hub.stats()['viewers'] == 0
+
+    time.sleep(0.15)
+    hub.hold('thumb', 0.2)
+    time.sleep(0.15)  # Past the first expiry, within the renewal
+    assert hub.cache.subscribers['thumb'] == 1
+    time.sleep(0.3)
+    assert hub.cache.subscribers['thumb'] == 0
+    assert hub.hold('thumb', 0.2)
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.frame_allocations import NullPublisher, traced_kib
+from benchmarks.synthetic_lot import SyntheticLot
+from core.layout_file import save_layout
+from core.lot_registry import LotConfig
+from core.parking_monitor import ParkingMonitor
+from core.spot_layout import SpotLayout
+from core.video_processor import VideoProcessor
+
+BUDGET_KIB = 16  # A steady-state frame may allocate this much; a frame-sized array is hundreds of times more
+WARMUP = 5
+
+
+@pytest.fixture(scope='module')
+def lot():
+    lot = SyntheticLot(960, 540, 60, seed=1, turnover=0.05)
+    lot.frame_list = list(lot.frames(WARMUP + 15))
+    return lot
+
+
+def test_video_processor_steady_state_allocations(lot, tmp_path):
+    layout_file = tmp_path / 'layout'
+    save_layout(layout_file, lot.positions, lot.frame_size)
+    monitor = ParkingMonitor()
+    monitor.ANALYSIS_FPS = float('inf')  # Analyse every frame
+    processor = VideoProcessor(LotConfig('alloc', Path(tmp_path) / 'none.mp4', layout_file, analysis_width=480),
+                               monitor, NullPublisher())
+    seq = iter(range(1, 1 << 30))
+
+    _, peak = traced_kib(lambda f: processor.analyze_frame((next(seq), f, None)), lot.frame_list, WARMUP)
+    assert peak < BUDGET_KIB
+
+
+def test_monitor_steady_state_allocations(lot):
+    monitor = ParkingMonitor()
+    monitor.original_frame_sizes[0] = lot.frame_size
+    frames = [frame.copy() for frame in lot.frame_list]  # process_frame draws on its frame
+
+    _, peak = traced_kib(lambda f: monitor.process_frame(f, lot.positions, 0), frames, WARMUP)
+    assert peak < BUDGET_KIB
+
+
+def test_unbuffered_scoring_is_caught(lot):
+    # The same measurement sees a loop that allocates its filter buffers per frame
+    layout = SpotLayout(lot.positions, lot.frame_size)
+    mean, _ = traced_kib(lambda f: layout.score(f, 0.2), lot.frame_list, WARMUP)
+    assert mean > BUDGET_KIB * 10
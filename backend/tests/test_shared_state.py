@@ -0,0 +1,90 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from core import shared_state
+from core.shared_state import EVENT_CAPACITY, MAX_SPOTS, SharedLotState, SharedStatePublisher, SharedStateReader
+from core.spot_state import SpotEventLog
+
+PREFIX = f'pvtest-{os.getpid()}'
+LOT = {'total': 0, 'available': 0, 'occupied': 0, 'history': [], 'version': 0, 'modified': 0.0}
+
+
+class Lot:
+    def __init__(self, lot_id):
+        self.id = lot_id
+        self.key = f'lot{lot_id}'
+
+
+@pytest.fixture
+def segment():
+    segment = SharedLotState('1', create=True, prefix=PREFIX)
+    yield segment
+    segment.close()
+
+
+def mirrored(segment):
+    """The event log a web worker rebuilds from the segment"""
+    _, state = segment.read_state()
+    log = SpotEventLog(EVENT_CAPACITY)
+    log.load(state['event_log'])
+    return log
+
+
+def test_incremental_writes_mirror_the_log(segment):
+    rng = np.random.default_rng(0)
+    log = SpotEventLog(EVENT_CAPACITY)
+    log.reset(np.zeros(300, dtype=bool), 0.0)
+    segment.write_state(LOT, log)
+    for step in range(1, 400):
+        if step == 150:
+            log.reset(np.ones(200, dtype=bool), step)  # New layout
+        count = EVENT_CAPACITY + 10 if step == 300 else int(rng.integers(0, 8))  # 300 wraps the ring
+        spots = rng.integers(0, len(log.occupied), count)
+        log.append(spots, rng.random(count) < 0.5, float(step))
+        segment.write_state(LOT, log)
+
+        copy = mirrored(segment)
+        np.testing.assert_array_equal(copy.occupied, log.occupied)
+        np.testing.assert_array_equal(copy.last_change, log.last_change)
+        assert copy.since(log.latest_seq - 5) == log.since(log.latest_seq - 5)
+
+
+def test_layouts_above_max_spots_are_refused(segment):
+    log = SpotEventLog(EVENT_CAPACITY)
+    log.reset(np.zeros(MAX_SPOTS + 1, dtype=bool), 0.0)
+    with pytest.raises(ValueError):
+        segment.write_state(LOT, log)
+
+    publisher = SharedStatePublisher([Lot('2')], prefix=PREFIX)
+    try:
+        with pytest.raises(ValueError):
+            publisher.reset_spots('2', np.zeros(MAX_SPOTS + 1, dtype=bool), 0.0)
+        assert len(publisher.event_logs['2'].occupied) == 0
+    finally:
+        publisher.close()
+
+
+def test_reattaching_backs_off_while_the_analyzer_is_dead(segment, monkeypatch):
+    opened = []
+
+    class CountingState(SharedLotState):
+        def __init__(self, *args, **kwargs):
+            opened.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(shared_state, 'SharedLotState', CountingState)
+    reader = SharedStateReader([Lot('1')], api=None, prefix=PREFIX)
+    attached = reader._attach('1')  # Heartbeat never written: the analyzer looks dead
+    deadline = time.time() + 1.0
+    while time.time() < deadline:
+        assert reader._attach('1') is attached
+        time.sleep(0.02)
+    assert len(opened) <= 3  # Not once per 20 ms poll
+
+    segment.heartbeat()
+    assert reader._attach('1') is attached
+    assert '1' not in reader._retry
+    attached.close()
@@ -0,0 +1,87 @@
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.spot_analytics import make_batches
+from core.spot_analytics import DWELL_EDGES, SpotAnalytics
+
+START = 1_700_000_000.0  # make_batches() timestamps count up from here
+SPOTS = 200
+
+
+def feed(events, batch=64, seed=0):
+    """(analytics, retained KiB, tracemalloc peak KiB) after appending a stream, above the warmed-up live set"""
+    analytics = SpotAnalytics(utc_offset=0)
+    analytics.reset(np.zeros(SPOTS, dtype=bool), START)
+    stream = make_batches(events, SPOTS, batch, seed)
+    tracemalloc.start()
+    try:
+        for spots, states, timestamp in stream:
+            if analytics.events >= 1000:  # Warmed up: start measuring
+                break
+            analytics.append(spots, states, timestamp)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        analytics.append(spots, states, timestamp)
+        for spots, states, timestamp in stream:
+            analytics.append(spots, states, timestamp)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return analytics, (current - before) / 1024, (peak - before) / 1024
+
+
+def test_memory_stays_flat_over_millions_of_transitions():
+    short, short_retained, short_peak = feed(10_000)
+    long, long_retained, long_peak = feed(1_000_000)
+    assert long.events >= 100 * short.events > 0
+    # Nothing is kept per event, and the peak is one append's scratch arrays
+    assert long_retained < 1 and short_retained < 1
+    assert long_peak < 2 * short_peak
+    # Everything kept is sized by the spot count
+    assert long.dwell_hist.shape == short.dwell_hist.shape == (SPOTS, len(DWELL_EDGES) + 1)
+
+
+def test_aggregates_match_a_brute_force_recount():
+    batches = list(make_batches(50_000, SPOTS, 8, seed=1))
+    analytics = SpotAnalytics(utc_offset=0)
+    analytics.reset(np.zeros(SPOTS, dtype=bool), START)
+    for spots, states, timestamp in batches:
+        analytics.append(spots, states, timestamp)
+
+    occupied = np.zeros(SPOTS, dtype=bool)
+    since = np.full(SPOTS, START)
+    arrivals = np.zeros(SPOTS, dtype=np.int64)
+    dwell_hist = np.zeros((SPOTS, len(DWELL_EDGES) + 1), dtype=np.int64)
+    dwell_total = np.zeros(SPOTS)
+    hourly = np.zeros((SPOTS, 24))
+    peak = 0
+    for spots, states, timestamp in batches:
+        for spot, state in zip(spots, states):
+            if state and not occupied[spot]:
+                arrivals[spot] += 1
+            elif not state and occupied[spot]:
+                dwell = timestamp - since[spot]  # Every session starts after reset() here
+                dwell_hist[spot, np.searchsorted(DWELL_EDGES, dwell)] += 1
+                dwell_total[spot] += dwell
+                t = since[spot]
+                while t < timestamp:  # Split the session at hour boundaries
+                    end = min(timestamp, (t // 3600 + 1) * 3600)
+                    hourly[spot, int(t // 3600) % 24] += end - t
+                    t = end
+            occupied[spot] = state
+            since[spot] = timestamp
+        peak = max(peak, int(occupied.sum()))
+
+    np.testing.assert_array_equal(analytics.occupied, occupied)
+    np.testing.assert_array_equal(analytics.arrivals, arrivals)
+    np.testing.assert_array_equal(analytics.dwell_hist, dwell_hist)
+    np.testing.assert_allclose(analytics.dwell_total, dwell_total)
+    np.testing.assert_allclose(analytics.occupied_seconds, hourly, atol=1e-3)
+    assert analytics.events == sum(len(spots) for spots, _, _ in batches)
+    assert analytics.peak_occupied == peak
+
+    summary = analytics.lot_summary(batches[-1][2])
+    assert summary['turnover']['arrivals'] == arrivals.sum()
+    assert [bin['count'] for bin in summary['dwell']['histogram']] == dwell_hist.sum(axis=0).tolist()
+    assert summary['occupied'] == occupied.sum()
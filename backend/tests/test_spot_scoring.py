@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.spot_scoring import OCCUPANCY_THRESHOLD, legacy_score, make_frame, make_positions
+from core.spot_layout import SpotLayout, preprocess
+from core.workspace import FrameWorkspace
+
+WIDTH, HEIGHT = 640, 360
+
+
+def legacy_counts(frame, positions):
+    """Edge pixels per spot as the original loop counted them"""
+    processed = preprocess(frame)
+    return np.array([cv2.countNonZero(processed[y:y+h, x:x+w]) for x, y, w, h in positions])
+
+
+@pytest.mark.parametrize('count', [1, 12, 60])
+def test_layout_scores_match_the_legacy_loop(count):
+    frame = make_frame(WIDTH, HEIGHT, seed=count)
+    positions = make_positions(count, WIDTH, HEIGHT, seed=count)
+    layout = SpotLayout(positions, (WIDTH, HEIGHT))
+
+    occupied, counts = layout.score(frame, OCCUPANCY_THRESHOLD)
+    np.testing.assert_array_equal(counts, legacy_counts(frame, positions))
+    np.testing.assert_array_equal(occupied, legacy_score(frame, positions))
+
+    workspace = FrameWorkspace()
+    for _ in range(2):  # Again in the reused buffers
+        np.testing.assert_array_equal(layout.score(frame, OCCUPANCY_THRESHOLD, workspace=workspace)[1], counts)
+
+
+def test_subset_scores_match_the_legacy_loop():
+    frame = make_frame(WIDTH, HEIGHT, seed=3)
+    positions = make_positions(60, WIDTH, HEIGHT, seed=3)
+    layout = SpotLayout(positions, (WIDTH, HEIGHT))
+    spots = np.array([41, 2, 17, 59])
+
+    occupied, counts = layout.score(frame, OCCUPANCY_THRESHOLD, spots)
+    expected = legacy_counts(frame, positions)[spots]
+    np.testing.assert_array_equal(counts, expected)
+    np.testing.assert_array_equal(occupied, legacy_score(frame, positions)[spots])
@@ -0,0 +1,104 @@
+import threading
+
+import cv2
+import numpy as np
+
+from core.stream_cache import RENDITIONS, RenditionCache, encode_jpeg
+
+
+def make_frame(value, width=64, height=48):
+    frame = np.zeros((height, width, 3), np.uint8)
+    frame[:, : width // 2] = value
+    return frame
+
+
+def decode(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+def test_get_encodes_each_rendition_once_per_frame():
+    cache = RenditionCache()
+    assert cache.get('full') == (0, None)
+    frame = make_frame(200, 640, 360)
+    cache.publish(1, frame)
+
+    seq, data = cache.get('full')
+    assert seq == 1
+    assert data == encode_jpeg(frame, **RENDITIONS['full'])
+    assert cache.get('full') == (seq, data)
+    assert cache.encode_count == 1
+
+    seq, thumb = cache.get('thumb')
+    assert seq == 1
+    assert decode(thumb).shape == (180, 320, 3)
+    assert cache.encode_count == 2
+
+
+def test_publish_copies_so_the_caller_can_reuse_its_buffer():
+    cache = RenditionCache()
+    buffer = make_frame(200)
+    cache.publish(1, buffer)
+    buffer[:] = 0  # Drawing the next frame into the same buffer
+
+    seq, data = cache.get('full')
+    assert seq == 1
+    assert abs(int(decode(data)[:, :16].mean()) - 200) <= 2
+
+
+def test_publish_reuses_buffers_no_encode_holds():
+    cache = RenditionCache()
+    cache.publish(1, make_frame(10))
+    first = cache._frame
+    cache.publish(2, make_frame(20))
+    cache.publish(3, make_frame(30))
+    assert cache._frame is first  # Recycled once replaced
+    assert len(cache._spare) <= RenditionCache.SPARE_BUFFERS
+
+    cache.publish(4, make_frame(40, width=32))  # A new size gets a new buffer
+    assert cache._frame.shape == (48, 32, 3)
+
+
+def test_buffer_being_encoded_is_not_reused():
+    cache = RenditionCache()
+    cache.publish(1, make_frame(200))
+    held = cache._frame
+    entered, release = threading.Event(), threading.Event()
+    original = cache.renditions
+
+    class SlowOptions(dict):
+        def __getitem__(self, name):
+            entered.set()
+            release.wait(5)
+            return original[name]
+
+    cache.renditions = SlowOptions(original)
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(entry=cache.get('full')))
+    reader.start()
+    assert entered.wait(5)
+
+    for seq in range(2, 6):  # Newer frames while the encode is still running
+        cache.publish(seq, make_frame(0))
+        assert cache._frame is not held
+    assert all(spare is not held for spare in cache._spare)
+    assert np.all(held[:, :32] == 200)
+
+    release.set()
+    reader.join(5)
+    seq, data = result['entry']
+    assert seq == 1
+    assert abs(int(decode(data)[:, :16].mean()) - 200) <= 2
+
+    cache.renditions = original
+    cache.publish(6, make_frame(0))
+    cache.publish(7, make_frame(0))
+    assert cache._frame is held or any(spare is held for spare in cache._spare)
+
+
+def test_put_encoded_serves_the_stored_jpegs():
+    cache = RenditionCache()
+    cache.publish(1, make_frame(50))
+    cache.put_encoded(2, {'full': b'jpeg'})
+    assert cache.get('full') == (2, b'jpeg')
+    assert cache.get('thumb') == (0, None)
+    assert cache.encode_count == 0
@@ -0,0 +1,168 @@
+# train_classifier.py
+"""Train and evaluate spot classifiers on labelled crops
+
+Labelled crops are spot images sorted into a directory per label:
+
+    crops/occupied/*.png
+    crops/empty/*.png
+
+`export` cuts them out of a video with its layout file and a (frames,
+spots) boolean label array, e.g. the truth.npy of benchmarks.synthetic_lot
+or labels made by hand. `train` fits the linear classifier (see
+core/spot_classifier.py) and reports precision and recall on a held-out
+part of the crops; `evaluate` scores any classifier on a crop directory.
+
+    python train_classifier.py export lot.mp4 --layout layout --labels truth.npy --out crops --step 10
+    python train_classifier.py train crops --out models/lot1.npz
+    python train_classifier.py evaluate crops --classifier linear --model models/lot1.npz
+    python train_classifier.py evaluate crops --classifier edge
+
+A lot uses the model with "classifier": "linear" and
+"classifier_model": "models/lot1.npz" in lots.json.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from core.layout_file import load_layout
+from core.parking_monitor import ParkingMonitor
+from core.spot_classifier import CLASSIFIERS, crop_features, load_classifier, train_linear
+from core.spot_layout import scale_positions
+
+LABELS = ('empty', 'occupied')
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def load_crops(directory):
+    """(list of BGR crops, bool labels) from directory/occupied and directory/empty"""
+    crops, labels = [], []
+    for label, name in enumerate(LABELS):
+        for path in sorted((Path(directory) / name).glob('*')):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            crop = cv2.imread(str(path))
+            if crop is None or crop.size == 0:
+                print(f"Skipping unreadable {path}")
+                continue
+            crops.append(crop)
+            labels.append(bool(label))
+    return crops, np.array(labels, dtype=bool)
+
+
+def report(labels, predicted):
+    """Precision and recall of the occupied class, plus accuracy"""
+    true_pos = int((predicted & labels).sum())
+    return {
+        'crops': int(len(labels)),
+        'occupied': int(labels.sum()),
+        'precision': round(true_pos / max(1, int(predicted.sum())), 4),
+        'recall': round(true_pos / max(1, int(labels.sum())), 4),
+        'accuracy': round(float((predicted == labels).mean()), 4) if len(labels) else None,
+    }
+
+
+def export(args):
+    stored = load_layout(args.layout)
+    labels = np.load(args.labels)
+    if labels.ndim != 2 or labels.shape[1] != len(stored.positions):
+        sys.exit(f"{args.labels} has shape {labels.shape}, expected (frames, {len(stored.positions)})")
+    out = Path(args.out)
+    for name in LABELS:
+        (out / name).mkdir(parents=True, exist_ok=True)
+
+    cap = cv2.VideoCapture(str(args.video))
+    if not cap.isOpened():
+        sys.exit(f"Could not open {args.video}")
+    counts = [0, 0]
+    try:
+        for index in range(len(labels)):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % args.step:
+                continue
+            height, width = frame.shape[:2]
+            positions = scale_positions(stored.positions, stored.frame_size or (width, height), (width, height))
+            for spot, (x, y, w, h) in enumerate(positions):
+                crop = frame[max(y, 0):y + h, max(x, 0):x + w]
+                if crop.size == 0:
+                    continue
+                label = int(labels[index, spot])
+                cv2.imwrite(str(out / LABELS[label] / f'{Path(args.video).stem}-f{index:06d}-s{spot:03d}.png'), crop)
+                counts[label] += 1
+    finally:
+        cap.release()
+    print(f"Wrote {counts[1]} occupied and {counts[0]} empty crops to {out}")
+
+
+def train(args):
+    crops, labels = load_crops(args.crops)
+    if len(np.unique(labels)) < 2:
+        sys.exit(f"Need both occupied and empty crops in {args.crops}")
+    features = crop_features(crops)
+
+    # Hold out a random part of the crops to report on
+    order = np.random.default_rng(args.seed).permutation(len(labels))
+    held_out = int(len(labels) * args.validation)
+    test, fit = order[:held_out], order[held_out:]
+    started = time.perf_counter()
+    model = train_linear(features[fit], labels[fit], l2=args.l2)
+    elapsed = time.perf_counter() - started
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    model.save(args.out)
+    print(f"Trained on {len(fit)} crops in {elapsed:.2f} s, saved to {args.out}")
+    if held_out:
+        print(json.dumps(report(labels[test], model.predict(features[test]) > model.threshold), indent=2))
+
+
+def evaluate(args):
+    crops, labels = load_crops(args.crops)
+    try:
+        classifier = load_classifier(args.classifier, args.model, ParkingMonitor())
+    except (OSError, ValueError) as e:
+        sys.exit(str(e))
+    started = time.perf_counter()
+    scores = classifier.crop_scores(crops)
+    elapsed = time.perf_counter() - started
+    result = report(labels, scores > classifier.threshold)
+    result['crops_per_second'] = round(len(crops) / elapsed, 1) if elapsed else None
+    print(json.dumps({'classifier': classifier.name, **result}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate spot classifiers on labelled crops")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('export', help="cut labelled crops out of a video")
+    command.add_argument('video')
+    command.add_argument('--layout', required=True, help="layout file for the video")
+    command.add_argument('--labels', required=True, help=".npy (frames, spots) bool array, True = occupied")
+    command.add_argument('--out', required=True, help="crop directory")
+    command.add_argument('--step', type=int, default=10, help="export every n-th frame")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser('train', help="fit the linear classifier")
+    command.add_argument('crops', help="directory with occupied/ and empty/ crops")
+    command.add_argument('--out', required=True, help="model file (.npz)")
+    command.add_argument('--l2', type=float, default=1.0, help="ridge penalty on the weights")
+    command.add_argument('--validation', type=float, default=0.2, help="share of crops held out for the report")
+    command.add_argument('--seed', type=int, default=0)
+    command.set_defaults(run=train)
+
+    command = commands.add_parser('evaluate', help="precision and recall of a classifier")
+    command.add_argument('crops', help="directory with occupied/ and empty/ crops")
+    command.add_argument('--classifier', choices=CLASSIFIERS, default='linear')
+    command.add_argument('--model', help="model file of the linear classifier")
+    command.set_defaults(run=evaluate)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
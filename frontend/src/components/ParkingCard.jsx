@@ -1,9 +1,19 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import './ParkingCard.css'
 
+// Milliseconds between thumbnail refreshes; a live stream per card would hold
+// one of the browser's six connections to the server for every lot
+const THUMB_REFRESH_MS = 2000
+
 const ParkingCard = ({ lotId, data }) => {
   const navigate = useNavigate()
+  const [tick, setTick] = useState(0)
+
+  useEffect(() => {
+    const timer = setInterval(() => setTick(t => t + 1), THUMB_REFRESH_MS)
+    return () => clearInterval(timer)
+  }, [])
 
   const handleMoreInfo = () => {
     navigate(`/details/${lotId}`)
@@ -12,6 +22,12 @@ const ParkingCard = ({ lotId, data }) => {
   return (
     <div className="parking-card">
       <h2>Parking Lot {lotId}</h2>
+      {/* 320px low-quality still; the full-size live stream is on the details page */}
+      <img
+        src={`/api/video-frame?lot=${lotId}&rendition=thumb&t=${tick}`}
+        alt={`Parking Lot ${lotId} preview`}
+        className="parking-card-thumb"
+      />
       <div className="stat-container">
         <div className="stat">
           <div className="stat-value">{data.total || 0}</div>
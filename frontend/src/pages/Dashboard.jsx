@@ -4,10 +4,7 @@ import axios from 'axios'
 import './Dashboard.css'
 
 const Dashboard = () => {
-  const [parkingData, setParkingData] = useState({
-    lot1: { total: 0, available: 0, occupied: 0 },
-    lot2: { total: 0, available: 0, occupied: 0 }
-  })
+  const [parkingData, setParkingData] = useState({})
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
 
@@ -31,8 +28,15 @@ const Dashboard = () => {
 
   useEffect(() => {
     fetchParkingData()
-    const interval = setInterval(fetchParkingData, 5000)
-    return () => clearInterval(interval)
+
+    // The server pushes a lot's counts only when they change
+    const events = new EventSource('/api/parking-stream')
+    events.onmessage = (event) => {
+      const changed = JSON.parse(event.data)
+      setParkingData(prev => ({ ...prev, ...changed }))
+      setError(null)
+    }
+    return () => events.close()
   }, [])
 
   if (loading) {
@@ -54,8 +58,10 @@ const Dashboard = () => {
       )}
       
       <div className="cards-container">
-        <ParkingCard lotId={1} data={parkingData.lot1} />
-        <ParkingCard lotId={2} data={parkingData.lot2} />
+        {/* Lots come from the backend's lot registry, keyed lot<id> */}
+        {Object.entries(parkingData).map(([lotKey, data]) => (
+          <ParkingCard key={lotKey} lotId={lotKey.replace(/^lot/, '')} data={data} />
+        ))}
       </div>
     </div>
   )
@@ -35,8 +35,11 @@ const ParkingDetails = () => {
     }
 
     fetchDetails()
-    const interval = setInterval(fetchDetails, 5000)
-    return () => clearInterval(interval)
+
+    // Refetch (a cheap conditional GET) only when the server says the lot changed
+    const events = new EventSource(`/api/parking-stream?lot=${lotId}`)
+    events.onmessage = () => fetchDetails()
+    return () => events.close()
   }, [lotId])
 
   if (loading) {